@@ -0,0 +1,269 @@
+import json
+import os
+import queue
+import threading
+import time
+import datetime
+import urllib.request
+import cv2
+from detections import Detections
+from metrics import registry
+from config import *
+
+class Alert:
+    """One zone violation by one tracked object, as handed to the sinks"""
+    __slots__ = ("zone", "track_id", "cls", "name", "conf", "box", "camera_id", "frame_index",
+                 "detected_at", "frame", "snapshot_path")
+
+    def __init__(self, zone: str, track_id: int, cls: int, name: str, conf: float, box, camera_id: str,
+                 frame_index: int, detected_at: float, frame=None):
+        self.zone = zone
+        self.track_id = track_id        # -1 when the boxes are not tracked
+        self.cls = cls
+        self.name = name                # Class name, e.g. "person"
+        self.conf = conf
+        self.box = box                  # [x1, y1, x2, y2]
+        self.camera_id = camera_id
+        self.frame_index = frame_index
+        self.detected_at = detected_at  # Capture time of the frame the violation was seen in
+        self.frame = frame              # Frame for snapshots (not copied; frames are not reused after inference)
+        self.snapshot_path = None       # Set by SnapshotSink for the sinks after it
+
+    def to_dict(self) -> dict:
+        return {"zone": self.zone, "track_id": self.track_id, "class": self.name, "confidence": round(self.conf, 3),
+                "box": [round(float(v), 1) for v in self.box], "camera": self.camera_id, "frame": self.frame_index,
+                "detected_at": self.detected_at, "snapshot": self.snapshot_path}
+
+class ConsoleSink:
+    """Prints alerts (the behaviour before the alert bus)"""
+    name = "console"
+
+    def send(self, alert: Alert):
+        track = f" (track {alert.track_id})" if alert.track_id >= 0 else ""
+        print(f"⚠️  ALERT: {alert.name.capitalize()} detected in {alert.zone}!{track}")
+
+class SnapshotSink:
+    """Encodes the alert frame as a JPEG on the alert worker, off the frame loop"""
+    name = "snapshot"
+
+    def __init__(self, folder: str = ALERT_SNAPSHOT_FOLDER, quality: int = ALERT_SNAPSHOT_QUALITY):
+        self.folder = folder
+        self.quality = quality
+        os.makedirs(folder, exist_ok=True)
+
+    def send(self, alert: Alert):
+        if alert.frame is None:
+            return
+        x1, y1, x2, y2 = (int(v) for v in alert.box)
+        frame = alert.frame.copy()
+        cv2.rectangle(frame, (x1, y1), (x2, y2), ZONE_ALERT_COLOR, 2)
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+        stamp = datetime.datetime.fromtimestamp(alert.detected_at).strftime("%Y%m%d_%H%M%S")
+        zone = alert.zone.replace(" ", "_")
+        path = os.path.join(self.folder, f"{stamp}_{alert.camera_id}_{zone}_track{alert.track_id}.jpg")
+        with open(path, "wb") as f:
+            f.write(jpeg.tobytes())
+        alert.snapshot_path = path
+
+class WebhookSink:
+    """POSTs the alert as JSON (with the snapshot path when a SnapshotSink ran first)"""
+    name = "webhook"
+
+    def __init__(self, url: str = ALERT_WEBHOOK_URL, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, alert: Alert):
+        request = urllib.request.Request(self.url, data=json.dumps(alert.to_dict()).encode(),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+class MemorySink:
+    """Local stand-in sink for tests: keeps delivered alerts in a list"""
+    name = "memory"
+
+    def __init__(self):
+        self.alerts = []
+        self._condition = threading.Condition()
+
+    def send(self, alert: Alert):
+        with self._condition:
+            self.alerts.append(alert)
+            self._condition.notify_all()
+
+    def wait_for(self, count: int, timeout: float = 5.0) -> bool:
+        """Block until at least ``count`` alerts were delivered"""
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.alerts) >= count, timeout)
+
+def default_sinks():
+    """Sinks enabled in config.py"""
+    sinks = [ConsoleSink()]
+    if ALERT_SNAPSHOT_FOLDER:
+        sinks.append(SnapshotSink())
+    if ALERT_WEBHOOK_URL:
+        sinks.append(WebhookSink())
+    return sinks
+
+class AlertBus:
+    """Delivers zone alerts to sinks on worker threads so the frame loop never waits for them
+
+    ``publish_frame()`` runs on the frame loop and only does dictionary lookups.
+    It alerts on the zone detector's enter events, so a track has to pass the
+    zone state machine's hysteresis and confidence floor first. A (zone, track)
+    pair alerts once and stays quiet while it is seen again within
+    ``debounce_seconds``; each zone may alert at most ``rate_per_minute``
+    times (token bucket). Accepted alerts go on a bounded queue (dropped when it
+    is full) and workers run every sink in order, measuring the latency from the
+    frame's capture to delivery.
+    """
+    def __init__(self, sinks=None, debounce_seconds: float = ALERT_DEBOUNCE_SECONDS,
+                 rate_per_minute: float = ALERT_RATE_LIMIT_PER_MINUTE, queue_size: int = ALERT_QUEUE_SIZE,
+                 workers: int = ALERT_WORKERS):
+        self.sinks = default_sinks() if sinks is None else sinks
+        self.debounce_seconds = debounce_seconds
+        self.rate_per_minute = rate_per_minute
+        self.worker_count = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._workers = []
+        self._last_seen = {}   # (camera, zone, track) -> last time it was in the zone
+        self._tokens = {}      # (camera, zone) -> (tokens, last refill time)
+        self._last_cleanup = 0.0
+        # Statistics
+        self.published = 0
+        self.debounced = 0
+        self.rate_limited = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.failed = 0
+        self._latency = {sink.name: registry.histogram("cctv_alert_latency_seconds",
+                                                       "Time from the detection frame's capture to delivery",
+                                                       {"sink": sink.name}) for sink in self.sinks}
+        self._latencies = []   # Recent end-to-end latencies (seconds) for get_alert_info()
+
+    def start(self):
+        for number in range(self.worker_count):
+            worker = threading.Thread(target=self._run, name=f"AlertWorker-{number + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        print(f"Alert bus: {', '.join(sink.name for sink in self.sinks)} "
+              f"(debounce {self.debounce_seconds:.0f}s, {self.rate_per_minute:.0f}/min per zone)")
+
+    def stop(self, timeout: float = 5.0):
+        """Deliver what is queued, then stop the workers"""
+        for _ in self._workers:
+            self._queue.put(None)
+        deadline = time.time() + timeout
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.time()))
+        self._workers = []
+
+    def publish_frame(self, packet, zone_detector, camera_id: str = "camera01", frame=None):
+        """Publish an alert for every track that entered a zone in an inferred frame
+
+        Call right after ``zone_detector.check_detections()`` for the same frame.
+        """
+        if zone_detector is None:
+            return
+        now = packet.timestamp
+        hits = zone_detector.last_hits
+        detections = None
+        if hits.any() or zone_detector.last_events:
+            detections = Detections.from_results(packet.results)
+        if hits.any() and self._last_seen:
+            # Tracks still inside keep their debounce clock running (no new alerts)
+            for row, zone_index in zip(*hits.nonzero()):
+                track_id = int(detections.id[row]) if detections.id is not None and row < len(detections) else -1
+                key = (camera_id, zone_detector.zones[zone_index].name, track_id)
+                if key in self._last_seen:
+                    self._last_seen[key] = now
+        for event in zone_detector.last_events:
+            if event.kind != "enter":
+                continue
+            row = self._event_row(detections, hits, event, zone_detector.track_states.min_confidence)
+            zone_name = zone_detector.zones[event.zone_index].name
+            if row is None or not self._accept(camera_id, zone_name, event.track_id, now):
+                continue
+            class_id = int(detections.cls[row])
+            self.publish(Alert(zone_name, event.track_id, class_id, detections.names.get(class_id, str(class_id)),
+                               float(detections.conf[row]), detections.xyxy[row], camera_id, packet.index,
+                               now, packet.frame if frame is None else frame))
+        if now - self._last_cleanup > self.debounce_seconds:
+            self._forget_stale(now)
+
+    @staticmethod
+    def _event_row(detections, hits, event, min_confidence: float):
+        """Row of the box behind an enter event (the most confident one for untracked boxes), or None"""
+        if event.zone_index >= hits.shape[1] or len(hits) != len(detections):
+            return None
+        candidates = hits[:, event.zone_index] & (detections.conf >= min_confidence)
+        if detections.id is not None and event.track_id != -1:
+            candidates &= detections.id == event.track_id
+        rows = candidates.nonzero()[0]
+        if not len(rows):
+            return None
+        return int(rows[detections.conf[rows].argmax()])
+
+    def _accept(self, camera_id: str, zone: str, track_id: int, now: float) -> bool:
+        key = (camera_id, zone, track_id)
+        last_seen = self._last_seen.get(key)
+        self._last_seen[key] = now
+        if last_seen is not None and now - last_seen < self.debounce_seconds:
+            self.debounced += 1
+            return False
+
+        # Token bucket per zone: refills at rate_per_minute, holds at most rate_per_minute tokens
+        zone_key = (camera_id, zone)
+        tokens, refilled_at = self._tokens.get(zone_key, (self.rate_per_minute, now))
+        tokens = min(self.rate_per_minute, tokens + (now - refilled_at) * self.rate_per_minute / 60.0)
+        if tokens < 1.0:
+            self._tokens[zone_key] = (tokens, now)
+            self.rate_limited += 1
+            return False
+        self._tokens[zone_key] = (tokens - 1.0, now)
+        return True
+
+    def _forget_stale(self, now: float):
+        self._last_seen = {key: seen for key, seen in self._last_seen.items() if now - seen < self.debounce_seconds}
+        self._last_cleanup = now
+
+    def publish(self, alert: Alert) -> bool:
+        """Queue an alert for delivery without blocking. Returns False if the queue was full"""
+        self.published += 1
+        try:
+            self._queue.put_nowait(alert)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            alert = self._queue.get()
+            if alert is None:
+                return
+            for sink in self.sinks:
+                try:
+                    sink.send(alert)
+                except Exception as e:
+                    self.failed += 1
+                    print(f"Alert sink '{sink.name}' failed: {e}")
+                    continue
+                self._latency[sink.name].observe(time.time() - alert.detected_at)
+            latency = time.time() - alert.detected_at
+            self._latencies = self._latencies[-999:] + [latency]
+            self.delivered += 1
+            alert.frame = None  # Let the frame go as soon as every sink has it
+
+    def get_alert_info(self) -> str:
+        info = (f"Alerts: {self.published} published, {self.delivered} delivered, {self.debounced} debounced, "
+                f"{self.rate_limited} rate-limited, {self.dropped} dropped, {self.failed} sink failures")
+        if self._latencies:
+            latencies = sorted(self._latencies)
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+            info += f" (latency p50 {p50 * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms)"
+        return info
@@ -0,0 +1,197 @@
+import cv2
+import glob
+import json
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from retention import parse_recording_name
+from config import *
+
+# Containers picked up when a folder is given
+VIDEO_FILE_EXTENSIONS = (".avi", ".mp4", ".mkv", ".mov")
+
+# Per-process state, set up once by worker_init()
+_worker = {}
+
+def find_recordings(paths):
+    """Video files under the given folders (recursively, e.g. daily folders), files or glob patterns"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                files.extend(os.path.join(folder, name) for name in names
+                             if name.lower().endswith(VIDEO_FILE_EXTENSIONS))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            files.extend(glob.glob(path))
+    # Skip annotated copies made by dual-stream recording
+    return sorted(set(f for f in files if "_annotated" not in os.path.basename(f)))
+
+def recording_info(path: str, duration: float):
+    """(camera_id, start time) from a recording's name (see parse_recording_name), else from the file's mtime"""
+    parsed = parse_recording_name(path)
+    if parsed:
+        return parsed
+    return os.path.splitext(os.path.basename(path))[0], os.path.getmtime(path) - duration
+
+def file_key(path: str) -> dict:
+    """Identifies a file's content well enough to notice it changed since it was analyzed"""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+def load_checkpoint(path: str) -> dict:
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {}
+
+def save_checkpoint(path: str, checkpoint: dict):
+    """Write atomically so an interrupted run never leaves a truncated checkpoint"""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temp_path, path)
+
+def worker_init(model_path: str, zones_file: str, db_path: str, threads: int):
+    """Load the model, zones and store once per worker process (without a zones file, each camera's own zones)"""
+    try:
+        import torch
+        torch.set_num_threads(threads)  # Workers share the cores instead of each using all of them
+    except ImportError:
+        pass
+    cv2.setNumThreads(1)
+    from inference_backend import load_model
+    from zone_detector import ZoneDetector
+    from metadata_store import DetectionStore
+
+    _worker["model"] = load_model(dynamic=True, model_path=model_path)
+    _worker["zone_detector"] = None
+    _worker["camera_zones"] = {}  # camera_id -> ZoneDetector, loaded on first use
+    if zones_file and os.path.exists(zones_file):
+        _worker["zone_detector"] = ZoneDetector()
+        _worker["zone_detector"].load_zones(zones_file)
+    _worker["store"] = DetectionStore(db_path)
+
+def analyze_file(path: str, batch_size: int = BATCH_ANALYSIS_BATCH_SIZE, stride: int = BATCH_ANALYSIS_STRIDE) -> dict:
+    """Decode one recording, run batched inference, tracking and zone checks, and store the results"""
+    from multi_camera import create_tracker, track_result
+    from pipeline import FramePacket
+    from zone_detector import load_camera_zones
+
+    model, zone_detector, store = _worker["model"], _worker["zone_detector"], _worker["store"]
+    start_time = time.time()
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or TARGET_FPS
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    camera_id, recorded_at = recording_info(path, total_frames / fps)
+    if zone_detector is None:
+        camera_zones = _worker["camera_zones"]
+        if camera_id not in camera_zones:
+            camera_zones[camera_id] = load_camera_zones(camera_id)
+        zone_detector = camera_zones[camera_id] if camera_zones[camera_id].zones else None
+
+    # A file that was interrupted half-way is analyzed again from the start
+    store.delete_segment(path)
+    store.begin_segment(path, camera_id, recorded_at)
+    tracker = create_tracker(fps / stride)
+
+    frames_decoded = frames_analyzed = detection_count = 0
+    batch = []
+    while True:
+        ret, frame = cap.read()
+        if ret:
+            batch.append(FramePacket(frames_decoded, recorded_at + frames_decoded / fps, frame))
+            frames_decoded += 1
+            # Skipped frames are only grabbed, never decoded into an image
+            for _ in range(stride - 1):
+                if not cap.grab():
+                    break
+                frames_decoded += 1
+        if batch and (len(batch) == batch_size or not ret):
+            results = model.predict([packet.frame for packet in batch], classes=DETECTION_CLASSES, verbose=False)
+            for packet, result in zip(batch, results):
+                detections = track_result(tracker, result, packet.frame)
+                packet.results = [detections]
+                if zone_detector and len(detections):
+                    hits = zone_detector.hit_matrix(detections.xyxy, packet.frame.shape[:2], detections.cls)
+                    packet.box_zones = [[zone_detector.zones[i].name for i, hit in enumerate(row) if hit]
+                                        for row in hits]
+                    packet.zones = sorted({name for names in packet.box_zones for name in names})
+                store.write_packet(packet)
+                detection_count += len(detections)
+            frames_analyzed += len(batch)
+            batch = []
+        if not ret:
+            break
+
+    cap.release()
+    store.flush()
+    seconds = time.time() - start_time
+    return {"file": path, "frames": frames_decoded, "analyzed": frames_analyzed,
+            "detections": detection_count, "seconds": seconds}
+
+def run_batch_analysis(paths, workers: int = BATCH_ANALYSIS_WORKERS, batch_size: int = BATCH_ANALYSIS_BATCH_SIZE,
+                       stride: int = BATCH_ANALYSIS_STRIDE, checkpoint_path: str = BATCH_ANALYSIS_CHECKPOINT,
+                       db_path: str = METADATA_DB_PATH, zones_file: str = ""):
+    """Re-run detection over recorded footage on a process pool, resuming from the checkpoint"""
+    files = find_recordings(paths)
+    checkpoint = load_checkpoint(checkpoint_path)
+    pending = [f for f in files if checkpoint.get(os.path.abspath(f), {}).get("key") != file_key(f)]
+    print(f"=== Batch Analysis: {len(files)} recordings, {len(files) - len(pending)} already done ===")
+    if not pending:
+        return
+
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, len(pending))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"Workers: {workers} processes x {threads} threads, batch size {batch_size}, stride {stride}, "
+          f"{INFERENCE_BACKEND} backend")
+    if INFERENCE_BACKEND != "pytorch":
+        # Export once here so the workers do not race to create the same cached file
+        from inference_backend import export_model
+        export_model(dynamic=True)
+
+    start_time = time.time()
+    total_frames = total_analyzed = 0
+    # "spawn" keeps CUDA and the model out of forked state
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=worker_init,
+                             initargs=(YOLO_MODEL_PATH, zones_file, db_path, threads)) as pool:
+        futures = {pool.submit(analyze_file, f, batch_size, stride): f for f in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                print(f"[{done}/{len(pending)}] Error analyzing {path}: {e}")
+                continue
+            total_frames += stats["frames"]
+            total_analyzed += stats["analyzed"]
+            # Checkpoint per finished file so an interrupted run resumes with the next one
+            checkpoint[os.path.abspath(path)] = {"key": file_key(path), "frames": stats["frames"],
+                                                 "detections": stats["detections"],
+                                                 "finished": time.time()}
+            save_checkpoint(checkpoint_path, checkpoint)
+            print(f"[{done}/{len(pending)}] {os.path.basename(path)}: {stats['frames']} frames, "
+                  f"{stats['detections']} detections, {stats['analyzed'] / stats['seconds']:.1f} FPS")
+
+    duration = time.time() - start_time
+    fps = total_frames / duration if duration else 0.0
+    print(f"Analyzed {total_frames} frames ({total_analyzed} inferred) in {duration:.2f} seconds")
+    print(f"Aggregate FPS: {fps:.2f} ({fps / workers:.2f} per worker, "
+          f"{fps / (workers * threads):.2f} per core)")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Re-run detection and zone checks over recorded footage")
+    parser.add_argument("paths", nargs="*", default=[OUTPUT_FOLDER], help="Folders, files or glob patterns")
+    parser.add_argument("--workers", type=int, default=BATCH_ANALYSIS_WORKERS, help="Worker processes (0 = one per core)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_ANALYSIS_BATCH_SIZE)
+    parser.add_argument("--stride", type=int, default=BATCH_ANALYSIS_STRIDE, help="Analyze every Nth frame")
+    args = parser.parse_args()
+    run_batch_analysis(args.paths, args.workers, args.batch_size, args.stride)
@@ -0,0 +1,307 @@
+import contextlib
+import datetime
+import glob
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import cv2
+import numpy as np
+from detections import Detections
+from detector import detect_objects, draw_overlay
+from zone_detector import ZoneDetector, load_camera_zones
+from benchmark_zones import random_zones
+from metrics import registry
+from config import *
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Stages timed for every frame, in pipeline order
+STAGES = ("decode", "inference", "zones", "overlay", "encode")
+
+class MockModel:
+    """Stands in for YOLO so the pipeline can be benchmarked without weights
+
+    Returns a few tracked boxes that sweep across the frame, after an optional
+    fixed delay that imitates inference time.
+    """
+    names = {0: "person", 2: "car"}
+
+    def __init__(self, box_count: int = 4, latency_ms: float = 0.0):
+        self.box_count = box_count
+        self.latency_ms = latency_ms
+        self.frame_index = 0
+
+    def track(self, frame, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        height, width = frame.shape[:2]
+        box = np.arange(self.box_count)
+        x1 = (self.frame_index * 4 + box * width / self.box_count) % (width - 60)
+        y1 = (box * 97 + self.frame_index) % (height - 120)
+        xyxy = np.stack([x1, y1, x1 + 60, y1 + 120], axis=1)
+        self.frame_index += 1
+        return [Detections(xyxy, box % 2 * 2, np.full(self.box_count, 0.9), box + 1, (height, width), self.names)]
+
+    predict = track
+
+def percentiles(samples_ms) -> dict:
+    if not samples_ms:
+        return {"count": 0}
+    values = np.asarray(samples_ms)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "mean": float(values.mean()), "p50": float(p50), "p95": float(p95),
+            "p99": float(p99), "max": float(values.max())}
+
+def peak_rss_mb() -> float:
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KB on Linux and in bytes on macOS
+        return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    return 0.0
+
+def benchmark_video(video_path: str, model, zone_detector, max_frames: int = 0) -> dict:
+    """Replay one video through every pipeline stage and time each stage per frame"""
+    cap = cv2.VideoCapture(video_path)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    encode_path = os.path.join(tempfile.gettempdir(), f"benchmark_encode{VIDEO_EXTENSION}")
+    writer = cv2.VideoWriter(encode_path, cv2.VideoWriter_fourcc(*VIDEO_CODEC), TARGET_FPS, (width, height))
+
+    samples = {stage: [] for stage in STAGES}
+    end_to_end = []
+    frames = 0
+    start_time = time.perf_counter()
+    while not max_frames or frames < max_frames:
+        t0 = time.perf_counter()
+        ret, frame = cap.read()
+        t1 = time.perf_counter()
+        if not ret:
+            break
+        _, results = detect_objects(frame, model, draw=False)
+        t2 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # Alert prints are not part of the measurement
+            zone_detector.check_detections(results)
+        t3 = time.perf_counter()
+        draw_overlay(frame, results, zone_detector)
+        t4 = time.perf_counter()
+        writer.write(frame)
+        t5 = time.perf_counter()
+
+        for stage, begin, end in zip(STAGES, (t0, t1, t2, t3, t4), (t1, t2, t3, t4, t5)):
+            samples[stage].append((end - begin) * 1000.0)
+        end_to_end.append((t5 - t0) * 1000.0)
+        frames += 1
+    duration = time.perf_counter() - start_time
+
+    cap.release()
+    writer.release()
+    if os.path.exists(encode_path):
+        os.remove(encode_path)
+    return {"video": os.path.basename(video_path), "resolution": [width, height], "frames": frames,
+            "seconds": duration, "fps": frames / duration if duration else 0.0,
+            "stages": {stage: percentiles(values) for stage, values in samples.items()},
+            "end_to_end": percentiles(end_to_end), "_samples": samples, "_end_to_end": end_to_end}
+
+def run_benchmark(videos=None, mock: bool = False, mock_latency_ms: float = 0.0, max_frames: int = 0,
+                  output_folder: str = "benchmarks", backend: str = INFERENCE_BACKEND, imgsz: int = INFERENCE_IMGSZ,
+                  int8: bool = INFERENCE_INT8) -> dict:
+    """Benchmark every stage over the example videos and save the results as JSON"""
+    videos = videos or sorted(glob.glob(os.path.join("examples", "Test *.mp4")))
+    if not videos:
+        print("No videos to benchmark (expected examples/Test *.mp4)")
+        return {}
+
+    load_seconds = 0.0
+    if mock:
+        model = MockModel(latency_ms=mock_latency_ms)
+    else:
+        from inference_backend import load_model, warm_up
+        # Export (first run only) and warm-up are reported separately from the per-frame timings
+        start = time.perf_counter()
+        model = load_model(backend, imgsz, int8)
+        load_seconds = time.perf_counter() - start
+        warm_up(model, imgsz)
+
+    # Use the saved zones when there are any, otherwise a fixed synthetic set
+    with contextlib.redirect_stdout(io.StringIO()):
+        zone_detector = load_camera_zones("camera01")
+        if not zone_detector.zones:
+            random_zones(zone_detector, 4)
+
+    model_info = "mock model" if mock else f"{YOLO_MODEL_PATH} on {backend} at {imgsz}px{' INT8' if int8 else ''}"
+    print(f"=== Pipeline Benchmark: {len(videos)} videos, {model_info} ===")
+    cpu_start = os.times()
+    if psutil is not None:
+        psutil.cpu_percent(percpu=True)  # Starts the per-core measurement window
+    wall_start = time.perf_counter()
+
+    runs = []
+    for video_path in videos:
+        run = benchmark_video(video_path, model, zone_detector, max_frames)
+        runs.append(run)
+        print(f"{run['video']}: {run['frames']} frames, {run['fps']:.1f} FPS, "
+              f"end-to-end p95 {run['end_to_end'].get('p95', 0.0):.1f} ms")
+
+    wall = time.perf_counter() - wall_start
+    cpu_end = os.times()
+    cpu_seconds = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    cpu_count = os.cpu_count() or 1
+    total_frames = sum(run["frames"] for run in runs)
+
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "system": {"platform": platform.platform(), "python": platform.python_version(), "cpu_count": cpu_count,
+                   "opencv": cv2.__version__, "numpy": np.__version__},
+        "settings": {"model": "mock" if mock else YOLO_MODEL_PATH, "mock_latency_ms": mock_latency_ms,
+                     "backend": "mock" if mock else backend, "imgsz": imgsz, "int8": int8,
+                     "model_load_seconds": load_seconds,
+                     "max_frames": max_frames, "zones": len(zone_detector.zones), "codec": VIDEO_CODEC,
+                     "detection_classes": DETECTION_CLASSES},
+        "summary": {
+            "frames": total_frames,
+            "seconds": wall,
+            "fps": total_frames / wall if wall else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+            # Process CPU time as a share of the wall time of all cores (100 = every core busy)
+            "cpu_percent_of_all_cores": cpu_seconds / (wall * cpu_count) * 100 if wall else 0.0,
+            "cpu_percent_per_core": psutil.cpu_percent(percpu=True) if psutil is not None else None,
+            "stages": {stage: percentiles([v for run in runs for v in run["_samples"][stage]]) for stage in STAGES},
+            "end_to_end": percentiles([v for run in runs for v in run["_end_to_end"]]),
+        },
+        "videos": [{key: value for key, value in run.items() if not key.startswith("_")} for run in runs],
+    }
+
+    print(get_report_info(report))
+    os.makedirs(output_folder, exist_ok=True)
+    path = os.path.join(output_folder, f"benchmark_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {path}")
+    return report
+
+def measure_metrics_overhead(video_path: str = None, max_frames: int = 300, repeats: int = 5,
+                             mock_latency_ms: float = 0.0):
+    """Cost of the metrics relative to the frame time, with metrics off vs on
+
+    Wall-clock runs (interleaved, fastest of each kind) are noisy at the 1% level,
+    so the overhead is also computed from the number of observations per frame
+    times the measured cost of one observation.
+    """
+    from metrics import MetricsRegistry
+    video_path = video_path or os.path.join("examples", "Test 1.mp4")
+    zone_detector = ZoneDetector()
+    with contextlib.redirect_stdout(io.StringIO()):
+        random_zones(zone_detector, 4)
+
+    def observation_count():
+        return sum(value["count"] for value in registry.snapshot().values() if isinstance(value, dict))
+
+    print(f"=== Metrics Overhead: {os.path.basename(video_path)}, {repeats} runs each ===")
+    enabled = registry.enabled
+    timings = {False: [], True: []}
+    observations = frames = 0
+    benchmark_video(video_path, MockModel(latency_ms=mock_latency_ms), zone_detector, max_frames)  # Warm-up
+    for _ in range(repeats):
+        for state in (False, True):
+            registry.enabled = state
+            before = observation_count()
+            run = benchmark_video(video_path, MockModel(latency_ms=mock_latency_ms), zone_detector, max_frames)
+            timings[state].append(run["seconds"] / run["frames"] * 1000.0)
+            if state:
+                observations += observation_count() - before
+                frames += run["frames"]
+    registry.enabled = enabled
+
+    # Cost of one observation, on a private registry so it does not show up in the metrics
+    histogram = MetricsRegistry(enabled=True).histogram("overhead_probe", "")
+    count = 100000
+    start = time.perf_counter()
+    for _ in range(count):
+        histogram.observe(0.001)
+    observe_ms = (time.perf_counter() - start) / count * 1000.0
+
+    off, on = min(timings[False]), min(timings[True])
+    per_frame = observations / frames if frames else 0.0
+    estimated = per_frame * observe_ms / off * 100
+    print(f"Metrics off: {off:.3f} ms/frame, metrics on: {on:.3f} ms/frame "
+          f"(wall-clock difference {(on - off) / off * 100:+.2f}%, run-to-run noise included)")
+    print(f"Observations: {per_frame:.1f} per frame x {observe_ms * 1000:.2f} us each")
+    print(f"Overhead: {estimated:.3f}% of the frame time {'✅' if estimated < 1.0 else '⚠️  above the 1% budget'}")
+    return estimated
+
+def get_report_info(report: dict) -> str:
+    summary = report["summary"]
+    lines = [f"Frames: {summary['frames']}  End-to-end FPS: {summary['fps']:.2f}  "
+             f"Peak RSS: {summary['peak_rss_mb']:.0f} MB  CPU: {summary['cpu_percent_of_all_cores']:.0f}% "
+             f"of {report['system']['cpu_count']} cores",
+             f"{'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    for stage, stats in list(summary["stages"].items()) + [("end-to-end", summary["end_to_end"])]:
+        if stats.get("count"):
+            lines.append(f"{stage:<12}{stats['p50']:>10.2f}{stats['p95']:>10.2f}{stats['p99']:>10.2f}")
+    return "\n".join(lines)
+
+def compare_backends(reports):
+    """One line per backend run: inference and end-to-end latency, FPS and memory"""
+    print("=== Backends ===")
+    print(f"{'backend':<22}{'load s':>8}{'infer p50':>11}{'infer p95':>11}{'e2e p95':>9}{'FPS':>8}{'RSS MB':>8}")
+    for report in reports:
+        settings, summary = report["settings"], report["summary"]
+        name = f"{settings['backend']} {settings['imgsz']}{' int8' if settings['int8'] else ''}"
+        inference = summary["stages"]["inference"]
+        print(f"{name:<22}{settings['model_load_seconds']:>8.1f}{inference.get('p50', 0.0):>11.2f}"
+              f"{inference.get('p95', 0.0):>11.2f}{summary['end_to_end'].get('p95', 0.0):>9.2f}"
+              f"{summary['fps']:>8.2f}{summary['peak_rss_mb']:>8.0f}")
+
+def compare_reports(baseline_path: str, candidate_path: str):
+    """Print per-stage p50/p95 and FPS changes between two saved runs"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["summary"]
+    with open(candidate_path) as f:
+        candidate = json.load(f)["summary"]
+    print(f"=== {os.path.basename(baseline_path)} -> {os.path.basename(candidate_path)} ===")
+    print(f"FPS: {baseline['fps']:.2f} -> {candidate['fps']:.2f} ({candidate['fps'] / baseline['fps']:.2f}x)")
+    for stage in list(STAGES) + ["end_to_end"]:
+        old = baseline["stages"].get(stage) if stage in STAGES else baseline["end_to_end"]
+        new = candidate["stages"].get(stage) if stage in STAGES else candidate["end_to_end"]
+        if old and new and old.get("count") and new.get("count"):
+            print(f"{stage:<12} p50 {old['p50']:7.2f} -> {new['p50']:7.2f} ms   "
+                  f"p95 {old['p95']:7.2f} -> {new['p95']:7.2f} ms")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on the example videos")
+    parser.add_argument("videos", nargs="*", help="Videos to replay (default: examples/Test *.mp4)")
+    parser.add_argument("--mock", action="store_true", help="Use a mock model instead of the YOLO weights")
+    parser.add_argument("--mock-latency-ms", type=float, default=0.0, help="Simulated inference time of the mock")
+    parser.add_argument("--max-frames", type=int, default=0, help="Frames per video (0 = whole video)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="Compare two saved runs")
+    parser.add_argument("--metrics-overhead", action="store_true", help="Measure the cost of the metrics (mock model)")
+    parser.add_argument("--backend", nargs="+", default=[INFERENCE_BACKEND],
+                        help="Inference backends to run one after another (pytorch, onnx, openvino)")
+    parser.add_argument("--imgsz", type=int, default=INFERENCE_IMGSZ, help="Model input size")
+    parser.add_argument("--int8", action="store_true", default=INFERENCE_INT8, help="INT8-quantized exports")
+    args = parser.parse_args()
+    if args.compare:
+        compare_reports(*args.compare)
+    elif args.metrics_overhead:
+        measure_metrics_overhead(args.videos[0] if args.videos else None, args.max_frames or 300,
+                                 mock_latency_ms=args.mock_latency_ms)
+    elif args.mock:
+        run_benchmark(args.videos, True, args.mock_latency_ms, args.max_frames)
+    else:
+        reports = [run_benchmark(args.videos, max_frames=args.max_frames, backend=backend, imgsz=args.imgsz,
+                                 int8=args.int8) for backend in args.backend]
+        if len(reports) > 1 and all(reports):
+            compare_backends(reports)
@@ -0,0 +1,102 @@
+import contextlib
+import io
+import time
+import cv2
+import numpy as np
+from detections import Detections
+from zone_detector import ZoneDetector, box_test_points, points_in_zones
+
+def random_zones(zone_detector, count, width=640, height=480, rng=None):
+    """Add `count` random convex-ish quadrilateral zones"""
+    rng = rng or np.random.default_rng(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(count):
+            cx, cy = rng.integers(50, width - 50), rng.integers(50, height - 50)
+            w, h = rng.integers(20, 120, size=2)
+            points = [(int(cx - w), int(cy - h)), (int(cx + w), int(cy - h)),
+                      (int(cx + w), int(cy + h)), (int(cx - w), int(cy + h))]
+            zone_detector.add_zone(points)
+
+def random_polygons(zone_detector, count, width=1920, height=1080, rng=None):
+    """Add `count` random 3-8 vertex star-shaped polygon zones spread over the frame"""
+    rng = rng or np.random.default_rng(2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(count):
+            cx, cy = rng.integers(0, width), rng.integers(0, height)
+            radius = rng.integers(20, 120)
+            angles = np.sort(rng.uniform(0, 2 * np.pi, rng.integers(3, 9)))
+            zone_detector.add_zone([(int(cx + radius * np.cos(a)), int(cy + radius * np.sin(a))) for a in angles])
+
+def random_boxes(count, width=640, height=480, rng=None):
+    rng = rng or np.random.default_rng(1)
+    x1 = rng.uniform(0, width - 60, count)
+    y1 = rng.uniform(0, height - 120, count)
+    w = rng.uniform(10, 60, count)
+    h = rng.uniform(20, 120, count)
+    return np.stack([x1, y1, x1 + w, y1 + h], axis=1).astype(np.float32)
+
+def legacy_hit_matrix(zones, xyxy):
+    """Original per-box, per-zone, per-corner cv2.pointPolygonTest loop"""
+    hits = np.zeros((len(xyxy), len(zones)), dtype=bool)
+    for row, box in enumerate(xyxy):
+        x1, y1, x2, y2 = int(box[0]), int(box[1]), int(box[2]), int(box[3])
+        corners = [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+        for column, zone in enumerate(zones):
+            contour = np.array(zone.points, dtype=np.int32)
+            hits[row, column] = any(cv2.pointPolygonTest(contour, pt, False) >= 0 for pt in corners)
+    return hits
+
+def time_call(function, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1000.0
+
+def benchmark_zone_hits(box_count=100, zone_count=50, repeats=50):
+    """Compare the legacy loop against the vectorized hit test and check they agree"""
+    print(f"=== Zone Hit-Test Benchmark: {box_count} boxes x {zone_count} zones ===")
+    zone_detector = ZoneDetector()
+    random_zones(zone_detector, zone_count)
+    xyxy = random_boxes(box_count)
+
+    expected = legacy_hit_matrix(zone_detector.zones, xyxy)
+    actual = zone_detector.hit_matrix(xyxy)
+    if not np.array_equal(expected, actual):
+        print("❌ Vectorized results differ from the legacy loop")
+        return
+
+    legacy_ms = time_call(lambda: legacy_hit_matrix(zone_detector.zones, xyxy), max(1, repeats // 10))
+    vectorized_ms = time_call(lambda: zone_detector.hit_matrix(xyxy), repeats)
+    detections = [Detections(xyxy)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        check_ms = time_call(lambda: zone_detector.check_detections(detections), repeats)
+
+    print(f"Hits: {int(expected.sum())} box/zone pairs (identical results)")
+    print(f"Legacy loop:          {legacy_ms:8.3f} ms")
+    print(f"Vectorized hit test:  {vectorized_ms:8.3f} ms")
+    print(f"check_detections():   {check_ms:8.3f} ms")
+    print(f"Speedup:              {legacy_ms / vectorized_ms:8.1f}x")
+
+def benchmark_zone_scaling(zone_counts=(10, 50, 200, 800), box_count=100, repeats=50):
+    """Hit-test time against every zone versus through the grid index as the zone count grows"""
+    print(f"=== Zone Index Scaling: {box_count} boxes, 1920x1080 ===")
+    xyxy = random_boxes(box_count, 1920, 1080)
+    points, _ = box_test_points(xyxy, "corners")
+    for zone_count in zone_counts:
+        zone_detector = ZoneDetector()
+        random_polygons(zone_detector, zone_count)
+        edges = zone_detector.get_zone_edges()
+        grid = zone_detector.get_zone_grid()
+        if not np.array_equal(points_in_zones(points, *edges), grid.points_in_zones(points, *edges)):
+            print(f"❌ Grid results differ from the full test with {zone_count} zones")
+            return
+        full_ms = time_call(lambda: points_in_zones(points, *edges), repeats)
+        grid_ms = time_call(lambda: grid.points_in_zones(points, *edges), repeats)
+        print(f"{zone_count:5d} zones: all zones {full_ms:8.3f} ms, grid index {grid_ms:8.3f} ms")
+
+if __name__ == "__main__":
+    import sys
+    if "--scaling" in sys.argv:
+        benchmark_zone_scaling()
+    else:
+        benchmark_zone_hits()
@@ -5,17 +5,116 @@
 RESTART_INTERVAL_MINUTES = 1   # How often to restart recording (in minutes) - TESTING MODE
 SAVE_INTERVAL_HOURS = 1        # How often to save and restart the entire system (in hours) - TESTING MODE
 
+# Continuous Recording Settings
+CONTINUOUS_RECORDING = False   # Keep camera and model loaded and roll over to new files without gaps
+SEGMENT_DURATION_MINUTES = RESTART_INTERVAL_MINUTES  # Length of each recorded segment
+SEGMENT_MAX_MB = 0             # Also roll over when a segment reaches this size (0 = no size limit)
+SEGMENT_PREOPEN_SECONDS = 2    # Open the next segment file this long before the boundary
+
+# Event Recording Settings
+EVENT_RECORDING = False        # Only record clips around events instead of every frame
+EVENT_TRIGGER = "zone"         # "zone" (restricted zone violation) or "detection" (any detected object)
+EVENT_PREROLL_SECONDS = 3      # Seconds kept in memory and written before each event
+EVENT_POSTROLL_SECONDS = 5     # Keep recording this long after the last trigger
+EVENT_FOLDER = "events"        # Sub-folder of OUTPUT_FOLDER for event clips and their index.jsonl
+
+# Dual-Stream Recording Settings
+DUAL_STREAM_RECORDING = False  # Record untouched frames at the camera's rate, detections go to a .jsonl sidecar
+ANNOTATED_STREAM_FPS = 5       # Frame rate of the extra annotated stream (0 = no annotated stream)
+ANNOTATED_STREAM_SCALE = 0.5   # Size of the annotated stream relative to the camera resolution
+
+# Detection Metadata Store Settings
+ENABLE_METADATA_STORE = True   # Persist every inferred frame's boxes and zone hits for search without video
+METADATA_DB_PATH = "recordings/metadata.db"  # SQLite database (query with metadata_store.DetectionStore.query_tracks)
+METADATA_BATCH_FRAMES = 60     # Frames buffered per insert transaction (also flushed at least once a second)
+
+# Batch Analysis Settings (python batch_analyze.py [folders or files])
+BATCH_ANALYSIS_WORKERS = 0      # Worker processes, each with its own model (0 = one per CPU core)
+BATCH_ANALYSIS_BATCH_SIZE = 8   # Frames per batched inference call
+BATCH_ANALYSIS_STRIDE = 1       # Analyze every Nth frame of the recordings
+BATCH_ANALYSIS_CHECKPOINT = "recordings/analysis_checkpoint.json"  # Finished files, skipped when resuming
+
+# Alert Settings
+ENABLE_ALERT_BUS = False       # True: deliver zone alerts on worker threads (console, snapshots, webhook) off the frame loop
+ALERT_DEBOUNCE_SECONDS = 10.0  # A tracked object alerts again only after leaving a zone for this long
+ALERT_RATE_LIMIT_PER_MINUTE = 6  # Most alerts per zone and minute
+ALERT_QUEUE_SIZE = 64          # Alerts waiting for delivery (newer alerts are dropped when full)
+ALERT_WORKERS = 2              # Threads running the alert sinks
+ALERT_SNAPSHOT_FOLDER = "recordings/snapshots"  # JPEG snapshot per alert ("" = no snapshots)
+ALERT_SNAPSHOT_QUALITY = 85    # JPEG quality of the snapshots
+ALERT_WEBHOOK_URL = ""         # POST every alert as JSON to this URL ("" = no webhook)
+
+# Metrics Settings
+ENABLE_METRICS = False         # True: record per-frame timings, queue depths and trigger counts (under 1% overhead)
+METRICS_HOST = "127.0.0.1"     # Metrics endpoint address (local only)
+METRICS_PORT = 9108            # Scrape http://127.0.0.1:9108/metrics (Prometheus) or /metrics.json (0 = no endpoint)
+METRICS_WINDOW = 1024          # Recent samples per histogram used for the rolling p50/p95/p99
+METRICS_LOG_FILE = ""          # Append a JSON snapshot here every METRICS_LOG_INTERVAL seconds ("-" = console, "" = off)
+METRICS_LOG_INTERVAL = 10.0    # Seconds between JSON snapshots
+
 # File Management
 OUTPUT_FOLDER = "recordings"   # Folder to store video files
 ENABLE_DAILY_ORGANIZATION = True  # Automatically organize files into daily folders
+# Retention (with daily organization): finished recordings are filed by recording date and indexed;
+# the oldest are deleted first when a camera is over quota or the disk runs low
+RETENTION_INDEX_PATH = "recordings/retention.db"  # SQLite index of filed recordings
+RETENTION_MAX_AGE_DAYS = 0     # Delete recordings older than this (0 = keep forever)
+RETENTION_EVENT_MAX_AGE_DAYS = 0  # Age limit for recordings with zone events and event clips (0 = keep forever)
+RETENTION_CAMERA_QUOTA_GB = 0  # Maximum disk usage per camera (0 = no quota)
+RETENTION_MIN_FREE_GB = 0      # Delete the oldest recordings while free disk space is below this (0 = off)
+RETENTION_CHECK_SECONDS = 60   # How often ages and disk space are checked between filed recordings
+# Seek index: a <recording>.seek file with the capture time of every frame and a thumbnail strip
+ENABLE_SEEK_INDEX = True       # Index recordings as they are written (python seek_index.py seek/timeline)
+SEEK_THUMBNAIL_INTERVAL = 5.0  # Seconds of footage between thumbnails
+SEEK_THUMBNAIL_WIDTH = 160     # Thumbnail width in pixels (height keeps the aspect ratio)
+SEEK_THUMBNAIL_QUALITY = 60    # JPEG quality of thumbnails (0-100)
 
 # Detection Settings
 ENABLE_ZONE_DETECTION = True   # Enable restricted zone detection
 DETECTION_CLASSES = [0, 2]     # Classes to detect: 0=person, 2=car (modify as needed)
+DETECTION_STRIDE = 1           # Run the model every Nth frame; skipped frames reuse tracked boxes (1 = every frame)
+ADAPTIVE_STRIDE = False        # Also run the model early when the scene changes (stride becomes the max gap)
+STRIDE_DIFF_THRESHOLD = 0.04   # Frame-difference score (0..1) that forces an early inference in adaptive mode
+ENABLE_ROI_INFERENCE = False   # Run the model only on the area around the restricted zones
+ROI_PADDING = 32               # Pixels added around the zones' bounding rectangle
+ROI_TILE_SIZE = 0              # Split large ROIs into tiles of this size at native resolution (0 = one crop)
+ROI_TILE_OVERLAP = 64          # Overlap between neighbouring tiles so people on a seam are not cut in half
+
+# Motion Gating Settings
+ENABLE_MOTION_GATING = False   # Skip inference entirely on frames without motion
+MOTION_METHOD = "diff"         # "diff" (frame difference) or "mog2" (background subtraction)
+MOTION_FRAME_SIZE = (160, 120) # Thumbnail size used for motion analysis
+MOTION_PIXEL_THRESHOLD = 25    # Per-pixel change (0-255) counted as motion (MOG2 variance threshold in "mog2" mode)
+MOTION_MIN_AREA = 0.005        # Fraction of changed pixels that counts as motion (lower = more sensitive)
+MOTION_COOLDOWN_FRAMES = 30    # Keep running inference this many frames after motion stops
+
+# Live Preview Settings
+# MJPEG over HTTP: open http://127.0.0.1:8080/ in a browser (works in headless mode too)
+ENABLE_PREVIEW_SERVER = False  # True: serve the newest annotated frame of every camera
+PREVIEW_HOST = "127.0.0.1"     # Use "0.0.0.0" to watch from other machines on the network
+PREVIEW_PORT = 8080
+PREVIEW_SCALE = 0.5            # Preview size relative to the camera frame
+PREVIEW_FPS = 10               # Maximum preview frame rate (0 = every frame)
+PREVIEW_JPEG_QUALITY = 70      # JPEG quality of preview frames (0-100)
+PREVIEW_SEND_BUFFER = 65536    # Socket send buffer per viewer in bytes; small so slow viewers get fresh frames
+
+# Headless Service Settings
+HEADLESS_MODE = False          # Run without any window: zones come from ZONES_FILE, commands from the control socket
+ZONES_FILE = "zones.json"      # Legacy zones file, used for cameras without their own file in ZONES_FOLDER
+ZONES_FOLDER = "zones"         # Per-camera zone files (<camera_id>.json) with cached geometry, saved as zones change
+ZONES_WATCH_INTERVAL = 1.0     # Seconds between checks of the zones file; edits are hot-reloaded
+CONTROL_HOST = "127.0.0.1"     # Control socket address (local connections only)
+CONTROL_PORT = 8765            # Send commands with e.g.: echo info | nc 127.0.0.1 8765
 
 # Camera SettingsExample Video (1).mp4
 CAMERA_INDEX = 0 #"examples/"  use any of the example in examples folder to see the output in action.  (usually 0 for built-in webcam)
 TARGET_FPS = 30.0              # Target frames per second for recording
+# Multi-camera mode (python multi_camera.py): one shared model serves every source in batches
+CAMERA_SOURCES = [CAMERA_INDEX]  # Camera indexes, stream URLs or video files, e.g.
+# CAMERA_SOURCES = ["examples/Test 1.mp4", "examples/Test 2.mp4", "examples/Test 3.mp4"]
+MULTI_CAMERA_BATCH_TIMEOUT_MS = 15  # How long the server waits to fill a batch with one frame per camera
+MULTI_CAMERA_SHOW_WINDOWS = True    # Show one window per camera (zones are drawn per window)
+TRACKER_CONFIG = "bytetrack.yaml"   # Ultralytics tracker config used for per-camera tracking
 # Video codec options (try different ones if playback issues occur):
 VIDEO_CODEC = 'XVID'           # Primary: XVID (most reliable for normal playback)
 # VIDEO_CODEC = 'mp4v'         # Alternative 1: mp4v (if XVID doesn't work)
@@ -23,12 +122,49 @@ VIDEO_CODEC = 'XVID'           # Primary: XVID (most reliable for normal playbac
 VIDEO_EXTENSION = '.avi'       # Video file extension (use .avi with XVID)
 # VIDEO_EXTENSION = '.mp4'     # Use .mp4 if using mp4v codec
 
+# Pipeline Settings
+# Capture, inference and encoding run on separate threads joined by bounded queues
+CAPTURE_QUEUE_SIZE = 4          # Frames buffered between the camera grabber and inference
+CAPTURE_DROP_POLICY = "oldest"  # When inference falls behind: "oldest", "newest" or "block" (use "block" for video files)
+WRITER_QUEUE_SIZE = 32          # Annotated frames buffered between inference and the video encoder
+WRITER_DROP_POLICY = "block"    # "block" records every inferred frame; "oldest"/"newest" drop frames instead
+
 # Model Settings
 YOLO_MODEL_PATH = "models/yolo11m.pt" # Path to YOLO model file
+INFERENCE_BACKEND = "pytorch"  # "pytorch", "onnx" (ONNX Runtime) or "openvino"; exports are made once and cached
+INFERENCE_IMGSZ = 640          # Model input size in pixels (smaller = faster, less accurate on small objects)
+INFERENCE_INT8 = False         # INT8-quantize the export (ONNX: dynamic weight quantization, OpenVINO: NNCF)
+INFERENCE_INT8_DATA = "coco8.yaml"  # Calibration dataset for OpenVINO INT8
+INFERENCE_WARMUP = True        # Run blank frames once at startup so the first real frame is not slow
+MODEL_CACHE_FOLDER = "models/cache"  # Exported models, named by weights hash, backend and options
+
+# Load Governor Settings
+# When the frame loop falls behind, trade preview quality, detection stride and model input size for speed
+ENABLE_GOVERNOR = False        # Adjust the settings below within their bounds to hold the target FPS
+GOVERNOR_TARGET_FPS = 0        # Frame rate to hold (0 = the camera's frame rate)
+GOVERNOR_INTERVAL_SECONDS = 2.0  # Seconds of frames measured before each decision
+GOVERNOR_HIGH_LOAD = 0.9       # Busy time per frame / target frame interval above which settings are lowered
+GOVERNOR_LOW_LOAD = 0.5        # Load below which the last change is undone
+GOVERNOR_RECOVER_INTERVALS = 3 # Calm intervals before undoing a change (doubles when an undo had to be reverted)
+GOVERNOR_MIN_IMGSZ = 320       # Smallest model input size (fixed-size ONNX/OpenVINO exports always keep INFERENCE_IMGSZ)
+GOVERNOR_IMGSZ_STEP = 64       # Input size change per step (multiple of 32)
+GOVERNOR_MAX_STRIDE = 4        # Largest detection stride (skipped frames reuse tracked boxes)
+GOVERNOR_MIN_PREVIEW_QUALITY = 40  # Lowest preview JPEG quality
 
 # Zone Detection Settings
 ZONE_ALERT_COLOR = (0, 0, 255)  # BGR color for triggered zones (Red)
 ZONE_NORMAL_COLOR = (0, 255, 0) # BGR color for normal zones (Green)
 ZONE_DRAWING_COLOR = (255, 0, 0) # BGR color for drawing zones (Blue)
+ZONE_EXCLUDE_COLOR = (128, 128, 128) # BGR color for exclude zones (Gray)
+RENDER_OVERLAY = True           # Draw boxes and zones; False skips all drawing when no display or annotated recording is needed
+ZONE_HIT_METHOD = "polygon"     # "polygon" (exact point-in-polygon) or "mask" (lookup in a rasterized zone mask)
+ZONE_TEST_POINT = "corners"     # "corners" (any box corner), "bottom_center" (footprint) or "overlap" (area share)
+ZONE_MIN_OVERLAP = 0.2          # Share of the box area that must lie inside a zone in "overlap" mode
+ZONE_GRID_MIN_ZONES = 8         # From this many zones, polygon hit tests go through a uniform grid index
+ZONE_GRID_CELL_SIZE = 64        # Pixels per grid cell of the zone index
+ZONE_ENTER_FRAMES = 3           # Consecutive frames inside a zone before a track counts as entered
+ZONE_EXIT_FRAMES = 10           # Consecutive frames outside before a track counts as gone (hysteresis)
+ZONE_MIN_CONFIDENCE = 0.4       # Boxes below this confidence never put a track inside a zone
+ZONE_TRACK_STALE_SECONDS = 5.0  # Tracks not seen for this long leave their zones
 
 # =========================================== 
\ No newline at end of file
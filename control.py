@@ -0,0 +1,104 @@
+import queue
+import signal
+import socketserver
+import threading
+from config import *
+
+# Commands understood by the headless recorder
+COMMANDS = ("quit", "shutdown", "clear", "info", "reload", "save", "status", "help")
+
+class ControlCommand:
+    """A command waiting to be handled by the frame loop"""
+    __slots__ = ("name", "response", "done")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.response = ""
+        self.done = threading.Event()
+
+    def reply(self, response: str):
+        self.response = response
+        self.done.set()
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    """One line per command, one reply line (or block) per command"""
+    def handle(self):
+        for raw_line in self.rfile:
+            name = raw_line.decode("utf-8", "replace").strip().lower()
+            if not name:
+                continue
+            if name not in COMMANDS:
+                self.wfile.write(f"error: unknown command '{name}' (try: {', '.join(COMMANDS)})\n".encode())
+                continue
+            if name == "help":
+                self.wfile.write(f"commands: {', '.join(COMMANDS)}\n".encode())
+                continue
+            command = self.server.control.submit(name)
+            if command.done.wait(timeout=5.0):
+                self.wfile.write((command.response.rstrip("\n") + "\n").encode())
+            else:
+                self.wfile.write(b"error: recorder did not respond\n")
+
+class _ControlTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class ControlServer:
+    """Local control channel for the headless recorder (replaces keypresses)
+
+    Commands arrive over a localhost TCP socket (e.g. ``echo info | nc 127.0.0.1 8765``)
+    or as signals: SIGTERM requests a shutdown and SIGHUP reloads the zones file.
+    The frame loop drains them with the non-blocking ``poll()``.
+    """
+    def __init__(self, host: str = CONTROL_HOST, port: int = CONTROL_PORT):
+        self.host = host
+        self.port = port
+        self._commands = queue.Queue()
+        self._server = None
+        self._thread = None
+        self._previous_handlers = {}
+
+    def submit(self, name: str) -> ControlCommand:
+        command = ControlCommand(name)
+        self._commands.put(command)
+        return command
+
+    def poll(self):
+        """All commands received since the last call (never blocks)"""
+        commands = []
+        while True:
+            try:
+                commands.append(self._commands.get_nowait())
+            except queue.Empty:
+                return commands
+
+    def start(self):
+        try:
+            self._server = _ControlTCPServer((self.host, self.port), _ControlHandler)
+            self._server.control = self
+            self._thread = threading.Thread(target=self._server.serve_forever, name="ControlServer", daemon=True)
+            self._thread.start()
+            print(f"Control socket listening on {self.host}:{self.port}")
+        except OSError as e:
+            print(f"Control socket unavailable ({e}); only signals will be handled")
+        self._install_signal_handlers()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+        self._previous_handlers = {}
+
+    def _install_signal_handlers(self):
+        # Signal handlers can only be installed from the main thread
+        if threading.current_thread() is not threading.main_thread():
+            return
+        mapping = {signal.SIGTERM: "shutdown"}
+        if hasattr(signal, "SIGHUP"):  # Not available on Windows
+            mapping[signal.SIGHUP] = "reload"
+        for signum, name in mapping.items():
+            self._previous_handlers[signum] = signal.signal(
+                signum, lambda received, frame, name=name: self.submit(name))
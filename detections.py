@@ -0,0 +1,56 @@
+import numpy as np
+from typing import Optional, Tuple
+
+
+def to_numpy(values) -> Optional[np.ndarray]:
+    """Convert a torch tensor (or anything array-like) to a NumPy array"""
+    if values is None:
+        return None
+    if hasattr(values, 'cpu'):
+        values = values.cpu().numpy()
+    return np.asarray(values)
+
+
+class Detections:
+    """Detection boxes held as plain NumPy arrays
+
+    Mirrors the attribute names of ultralytics' ``Boxes`` (``xyxy``, ``cls``,
+    ``conf``, ``id``) and exposes itself as ``.boxes``, so code written against
+    ``results[0].boxes`` also works on ``[detections]``.
+    """
+    def __init__(self, xyxy, cls=None, conf=None, id=None,
+                 orig_shape: Optional[Tuple[int, int]] = None, names: Optional[dict] = None):
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        count = len(self.xyxy)
+        self.cls = np.zeros(count, np.int32) if cls is None else np.asarray(cls, dtype=np.int32).reshape(-1)
+        self.conf = np.ones(count, np.float32) if conf is None else np.asarray(conf, dtype=np.float32).reshape(-1)
+        self.id = None if id is None else np.asarray(id, dtype=np.int64).reshape(-1)
+        self.orig_shape = orig_shape  # (height, width) of the frame the boxes belong to
+        self.names = names or {}
+
+    @property
+    def boxes(self) -> "Detections":
+        return self
+
+    def __len__(self) -> int:
+        return len(self.xyxy)
+
+    @classmethod
+    def empty(cls, orig_shape=None, names=None) -> "Detections":
+        return cls(np.zeros((0, 4), np.float32), orig_shape=orig_shape, names=names)
+
+    @classmethod
+    def from_results(cls, results) -> "Detections":
+        """Build from the list returned by model.track()/model.predict() (or a Detections list)"""
+        if not results:
+            return cls.empty()
+        result = results[0]
+        if isinstance(result, Detections):
+            return result
+        orig_shape = getattr(result, 'orig_shape', None)
+        names = getattr(result, 'names', None)
+        boxes = getattr(result, 'boxes', None)
+        if boxes is None or getattr(boxes, 'xyxy', None) is None:
+            return cls.empty(orig_shape, names)
+        return cls(to_numpy(boxes.xyxy), to_numpy(boxes.cls), to_numpy(boxes.conf),
+                   to_numpy(getattr(boxes, 'id', None)), orig_shape, names)
@@ -1,39 +1,245 @@
-from ultralytics import YOLO
 from zone_detector import ZoneDetector
+from detections import Detections
+from motion_detector import downscale_gray, frame_difference_score
+from metrics import registry
 import cv2
+import math
+import time
+import numpy as np
 from config import *
 
-def detect_objects(frame, model, zone_detector=None):
+class DetectionStride:
+    """Run the model only every Nth frame and carry tracked boxes forward in between
+
+    In adaptive mode the model also runs early whenever the frame differs from the
+    last inferred frame by more than ``diff_threshold``; ``stride`` then acts as the
+    longest allowed gap between inferences.
+    """
+    def __init__(self, stride: int = DETECTION_STRIDE, adaptive: bool = ADAPTIVE_STRIDE,
+                 diff_threshold: float = STRIDE_DIFF_THRESHOLD):
+        self.stride = max(1, int(stride))
+        self.adaptive = adaptive
+        self.diff_threshold = diff_threshold
+        self.last_detections = None
+        self.velocity = None            # Per-box (dx1, dy1, dx2, dy2) in pixels per frame
+        self.frames_since_inference = 0
+        self._reference_small = None    # Thumbnail of the last inferred frame
+        self.inferred_frames = 0
+        self.carried_frames = 0
+
+    def should_infer(self, frame) -> bool:
+        if self.last_detections is None or self.frames_since_inference + 1 >= self.stride:
+            return True
+        if self.adaptive and self._reference_small is not None:
+            score = frame_difference_score(self._reference_small, downscale_gray(frame))
+            return score > self.diff_threshold
+        return False
+
+    def update(self, results, frame):
+        """Record fresh model output and estimate per-track velocity against the previous inference"""
+        detections = Detections.from_results(results)
+        velocity = np.zeros_like(detections.xyxy)
+        previous = self.last_detections
+        if (previous is not None and previous.id is not None and detections.id is not None
+                and len(previous) and len(detections)):
+            elapsed = self.frames_since_inference + 1
+            previous_rows = {int(track_id): row for row, track_id in enumerate(previous.id)}
+            for row, track_id in enumerate(detections.id):
+                prev_row = previous_rows.get(int(track_id))
+                if prev_row is not None:
+                    velocity[row] = (detections.xyxy[row] - previous.xyxy[prev_row]) / elapsed
+
+        self.last_detections = detections
+        self.velocity = velocity
+        self.frames_since_inference = 0
+        self.inferred_frames += 1
+        if self.adaptive:
+            self._reference_small = downscale_gray(frame)
+
+    def carry_forward(self) -> Detections:
+        """Last tracked boxes extrapolated to the current frame"""
+        self.frames_since_inference += 1
+        self.carried_frames += 1
+        last = self.last_detections
+        xyxy = last.xyxy + self.velocity * self.frames_since_inference
+        if last.orig_shape is not None:
+            height, width = last.orig_shape[:2]
+            xyxy[:, [0, 2]] = np.clip(xyxy[:, [0, 2]], 0, width - 1)
+            xyxy[:, [1, 3]] = np.clip(xyxy[:, [1, 3]], 0, height - 1)
+        return Detections(xyxy, last.cls, last.conf, last.id, last.orig_shape, last.names)
+
+    def get_stride_info(self) -> str:
+        total = self.inferred_frames + self.carried_frames
+        ratio = total / self.inferred_frames if self.inferred_frames else 0.0
+        return (f"Detection stride: inferred {self.inferred_frames}/{total} frames "
+                f"({ratio:.1f}x fewer model calls)")
+
+def roi_rectangles(zone_detector, shape, padding: int = ROI_PADDING, tile_size: int = ROI_TILE_SIZE,
+                   tile_overlap: int = ROI_TILE_OVERLAP):
+    """Crop rectangles (x1, y1, x2, y2) covering all zones: one union rectangle, or tiles of it"""
+    bounds = zone_detector.get_zone_bounds(shape) if zone_detector else None
+    if bounds is None:
+        return []
+    height, width = shape[:2]
+    x1, y1 = max(bounds[0] - padding, 0), max(bounds[1] - padding, 0)
+    x2, y2 = min(bounds[2] + padding, width), min(bounds[3] + padding, height)
+    if tile_size <= 0 or (x2 - x1 <= tile_size and y2 - y1 <= tile_size):
+        return [(x1, y1, x2, y2)]
+
+    step = max(tile_size - tile_overlap, 1)
+    def starts(low, high):
+        # Evenly spaced tile origins, first and last flush with the ROI edges
+        span = high - low
+        if span <= tile_size:
+            return [low]
+        count = math.ceil((span - tile_size) / step) + 1
+        return [low + round(i * (span - tile_size) / (count - 1)) for i in range(count)]
+    return [(tx, ty, min(tx + tile_size, x2), min(ty + tile_size, y2))
+            for ty in starts(y1, y2) for tx in starts(x1, x2)]
+
+def native_imgsz(width: int, height: int) -> int:
+    """Model input size that keeps a crop at its native resolution (multiple of the 32 px stride)"""
+    return int(math.ceil(max(width, height) / 32.0) * 32)
+
+def merge_tile_detections(detections: Detections, iou_threshold: float = 0.5) -> Detections:
+    """Class-aware NMS over boxes from overlapping tiles"""
+    if len(detections) < 2:
+        return detections
+    # Shift each class into its own coordinate range so boxes of different classes never suppress each other
+    offset = detections.cls[:, None].astype(np.float32) * 10000.0
+    shifted = detections.xyxy + offset
+    rects = np.column_stack([shifted[:, :2], shifted[:, 2:] - shifted[:, :2]]).tolist()
+    keep = np.array(cv2.dnn.NMSBoxes(rects, detections.conf.tolist(), 0.0, iou_threshold), dtype=np.intp).reshape(-1)
+    return Detections(detections.xyxy[keep], detections.cls[keep], detections.conf[keep],
+                      None if detections.id is None else detections.id[keep],
+                      detections.orig_shape, detections.names)
+
+def infer_roi(frame, model, rects, max_imgsz: int = None) -> Detections:
+    """Run the model only on the zone crops and map the boxes back to frame coordinates
+
+    Crops run at native resolution, scaled down to ``max_imgsz`` when given (load governor).
+    """
+    crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in rects]
+    imgsz = max(native_imgsz(x2 - x1, y2 - y1) for x1, y1, x2, y2 in rects)
+    if max_imgsz:
+        imgsz = min(imgsz, max_imgsz)
+    if len(rects) == 1:
+        # A single fixed crop keeps a stable coordinate frame, so tracking still works
+        results = model.track(crops[0], classes=DETECTION_CLASSES, persist=True, imgsz=imgsz)
+    else:
+        results = model.predict(crops, classes=DETECTION_CLASSES, imgsz=imgsz, verbose=False)
+
+    parts = []
+    for (x1, y1, _, _), result in zip(rects, results):
+        detections = Detections.from_results([result])
+        detections.xyxy += np.array([x1, y1, x1, y1], dtype=np.float32)
+        parts.append(detections)
+    names = parts[0].names if parts else {}
+    ids = [part.id for part in parts]
+    merged = Detections(np.concatenate([part.xyxy for part in parts]),
+                        np.concatenate([part.cls for part in parts]),
+                        np.concatenate([part.conf for part in parts]),
+                        np.concatenate(ids) if len(parts) == 1 and ids[0] is not None else None,
+                        frame.shape[:2], names)
+    return merge_tile_detections(merged) if len(rects) > 1 else merged
+
+# Time to get a frame's boxes, by how they were obtained
+DETECT_SECONDS = {path: registry.histogram("cctv_detect_seconds", "Time to obtain a frame's detections", {"path": path})
+                  for path in ("model", "roi", "carried", "gated")}
+OVERLAY_SECONDS = registry.histogram("cctv_overlay_seconds", "Time to draw boxes onto a frame")
+
+# Box colors per class (BGR), cycled for classes beyond the palette
+BOX_COLORS = [(255, 128, 0), (0, 200, 255), (255, 0, 255), (0, 255, 128), (128, 0, 255), (255, 255, 0)]
+
+def draw_detections(frame, detections: Detections, color=None):
+    """Draw boxes with class, track ID and confidence labels onto the frame in place"""
+    for row in range(len(detections)):
+        x1, y1, x2, y2 = (int(v) for v in detections.xyxy[row])
+        class_id = int(detections.cls[row])
+        box_color = color or BOX_COLORS[class_id % len(BOX_COLORS)]
+        label = detections.names.get(class_id, str(class_id))
+        if detections.id is not None:
+            label += f" id:{int(detections.id[row])}"
+        label += f" {detections.conf[row]:.2f}"
+        cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, 2)
+        cv2.putText(frame, label, (x1, max(y1 - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, box_color, 2)
+
+def detect_objects(frame, model, zone_detector=None, stride=None, motion_gate=None, draw=RENDER_OVERLAY,
+                   max_imgsz=None):
     """
     Detect objects in frame and optionally check for restricted zone violations
-    
+
     Args:
         frame: Input frame
         model: YOLO model
         zone_detector: Optional ZoneDetector instance for restricted zone checking
-    
+        stride: Optional DetectionStride; frames it skips reuse the last tracked boxes
+        motion_gate: Optional MotionGate; frames without motion skip inference entirely
+        draw: Draw boxes and zones onto the frame (in place); False skips all drawing
+        max_imgsz: Optional upper bound on the input size of zone-ROI crops (load governor)
+
     Returns:
-        detected_frame: Frame with detections drawn
+        detected_frame: The input frame, with detections drawn when draw is True
         results: Detection results for further processing
     """
+    start = time.perf_counter()
+    if motion_gate is not None and not motion_gate.has_motion(frame):
+        # Static scene: no model call; whatever was there last is still there
+        results = [motion_gate.held_detections(frame.shape[:2])]
+        path = "gated"
+    elif stride is not None and not stride.should_infer(frame):
+        # Skipped frame: reuse the last tracked boxes, extrapolated by per-track velocity
+        results = [stride.carry_forward()]
+        path = "carried"
+    else:
+        rects = roi_rectangles(zone_detector, frame.shape) if ENABLE_ROI_INFERENCE else []
+        if rects:
+            # Zone-ROI mode: infer on the zone crops only
+            results = [infer_roi(frame, model, rects, max_imgsz)]
+            path = "roi"
+        else:
+            # Perform tracking with the model using configured classes
+            results = model.track(frame, classes=DETECTION_CLASSES, persist=True)  # Tracking with configured classes
+            path = "model"
+        if stride is not None:
+            stride.update(results, frame)
+    if motion_gate is not None and path != "gated":
+        motion_gate.remember(Detections.from_results(results))
+    detected = time.perf_counter()
+    DETECT_SECONDS[path].observe(detected - start)
 
-    # Perform tracking with the model using configured classes
-    results = model.track(frame, classes=DETECTION_CLASSES)  # Tracking with configured classes
+    # Draw boxes straight onto the frame (no full-frame copy)
+    if draw:
+        draw_detections(frame, Detections.from_results(results))
+        OVERLAY_SECONDS.observe(time.perf_counter() - detected)
 
-    # Draw results on the frame (if results exist)
-    if results and hasattr(results[0], 'plot'):
-        detected_frame = results[0].plot()  # Draw boxes, etc.
-    else:
-        detected_frame = frame.copy()
-    
-    # Check for restricted zone violations if zone detector is provided
+    apply_zones(frame, results, zone_detector, draw)
+
+    return frame, results
+
+def apply_zones(detected_frame, results, zone_detector=None, draw=True):
+    """Check detections against restricted zones and draw the zones and alert banner"""
+    if not zone_detector:
+        return []
+
+    triggered_zones = zone_detector.check_detections(results)
+    if not draw:
+        return triggered_zones
+    zone_detector.draw_zones(detected_frame)
+
+    # Add alert text if zones are triggered
+    if triggered_zones:
+        draw_alert_banner(detected_frame)
+    return triggered_zones
+
+def draw_alert_banner(frame):
+    cv2.putText(frame, "RESTRICTED ZONE VIOLATION!", (10, 60),
+               cv2.FONT_HERSHEY_SIMPLEX, 1, ZONE_ALERT_COLOR, 3)
+
+def draw_overlay(frame, results, zone_detector=None):
+    """Draw boxes, zones and the alert banner for results whose zones were already checked"""
+    draw_detections(frame, Detections.from_results(results))
     if zone_detector:
-        triggered_zones = zone_detector.check_detections(results)
-        zone_detector.draw_zones(detected_frame)
-        
-        # Add alert text if zones are triggered
-        if triggered_zones:
-            cv2.putText(detected_frame, "RESTRICTED ZONE VIOLATION!", (10, 60), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, ZONE_ALERT_COLOR, 3)
-    
-    return detected_frame, results
\ No newline at end of file
+        zone_detector.draw_zones(frame)
+        if any(zone.is_triggered for zone in zone_detector.zones):
+            draw_alert_banner(frame)
@@ -0,0 +1,180 @@
+import cv2
+import os
+import datetime
+import json
+import time
+import collections
+import numpy as np
+from detections import Detections
+from pipeline import FramePacket
+from config import *
+
+def event_state(results, zone_detector=None, trigger: str = EVENT_TRIGGER):
+    """Decide whether a frame is part of an event. Returns (triggered, names of triggered zones)"""
+    zone_names = [zone.name for zone in zone_detector.zones if zone.is_triggered] if zone_detector else []
+    if trigger == "detection":
+        return bool(zone_names) or len(Detections.from_results(results)) > 0, zone_names
+    return bool(zone_names), zone_names
+
+class FrameRingBuffer:
+    """Fixed-size ring of the most recent frames, preallocated so pushing never allocates"""
+    def __init__(self, capacity: int, frame_shape):
+        self.capacity = max(1, capacity)
+        self.frames = np.empty((self.capacity,) + tuple(frame_shape), dtype=np.uint8)
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.start = 0   # Index of the oldest frame
+        self.count = 0
+
+    def push(self, frame, timestamp: float):
+        index = (self.start + self.count) % self.capacity
+        if frame.shape == self.frames.shape[1:]:
+            np.copyto(self.frames[index], frame)
+        else:
+            self.frames[index] = cv2.resize(frame, (self.frames.shape[2], self.frames.shape[1]))
+        self.timestamps[index] = timestamp
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def drain(self):
+        """Yield (frame, timestamp) from oldest to newest and empty the buffer"""
+        for offset in range(self.count):
+            index = (self.start + offset) % self.capacity
+            yield self.frames[index], self.timestamps[index]
+        self.start = 0
+        self.count = 0
+
+class EventRecorder:
+    """Writes a clip per event (pre-roll + event + post-roll) instead of continuous footage
+
+    Frames outside events only go into the pre-roll ring buffer. When a frame is
+    flagged as triggered, the buffered pre-roll is flushed into a new clip and
+    recording continues until ``post_seconds`` pass without another trigger. Every
+    finished clip is appended to a JSON-lines index. With a ``store``
+    (DetectionStore) the boxes of every frame written to a clip are stored under
+    that clip, numbered by their position in it.
+    """
+    def __init__(self, folder: str, fps: float, frame_size, camera_id: str = "camera01",
+                 pre_seconds: float = EVENT_PREROLL_SECONDS, post_seconds: float = EVENT_POSTROLL_SECONDS,
+                 on_clip_closed=None, store=None):
+        self.folder = os.path.join(folder, EVENT_FOLDER)
+        os.makedirs(self.folder, exist_ok=True)
+        self.index_path = os.path.join(self.folder, "index.jsonl")
+        self.fps = fps
+        self.frame_size = tuple(frame_size)
+        self.camera_id = camera_id
+        self.post_seconds = post_seconds
+        self.on_clip_closed = on_clip_closed  # Called with the path of every finished clip
+        self.fourcc = cv2.VideoWriter_fourcc(*VIDEO_CODEC)
+        width, height = self.frame_size
+        self.ring = FrameRingBuffer(int(round(pre_seconds * fps)), (height, width, 3))
+        self.store = store
+        self._preroll_packets = collections.deque(maxlen=self.ring.capacity)  # Boxes of the pre-roll frames
+        self._store_clip = None     # Path of the clip the store is writing rows for
+
+        self.clip = None            # Open clip: dict with writer, path and event details
+        self.event_count = 0
+        # Statistics for the disk savings report
+        self.frames_seen = 0
+        self.frames_written = 0
+        self.bytes_written = 0
+
+    def write_packet(self, packet):
+        """Pipeline entry point: uses the packet's trigger flag and capture time"""
+        clip = self.clip
+        self.write(packet.annotated, packet.triggered, packet.timestamp, packet.zones)
+        if self.store is not None:
+            self._store_packet(packet, clip or self.clip)
+
+    def _store_packet(self, packet, clip):
+        """Store the boxes of a frame under the clip it went into (pre-roll frames wait for their clip)"""
+        if clip is None:
+            # Only the boxes: the frame itself is already in the ring buffer
+            boxes = FramePacket(packet.index, packet.timestamp, None)
+            boxes.results = [Detections.from_results(packet.results)]
+            boxes.box_zones = packet.box_zones
+            self._preroll_packets.append(boxes)
+            return
+        if clip["path"] != self._store_clip:
+            # First frame after the clip opened: its pre-roll comes first
+            self._store_clip = clip["path"]
+            self.store.begin_segment(clip["path"], self.camera_id, clip["start"])
+            for position, boxes in enumerate(self._preroll_packets):
+                self.store.write_packet(boxes, position)
+            self._preroll_packets.clear()
+        self.store.write_packet(packet, clip["frames"] - 1)
+
+    def write(self, frame, triggered: bool = False, timestamp: float = None, zones=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        self.frames_seen += 1
+
+        if self.clip is None:
+            if not triggered:
+                self.ring.push(frame, timestamp)
+                return
+            self._open_clip(timestamp)
+
+        clip = self.clip
+        if triggered:
+            clip["last_trigger"] = timestamp
+            clip["zones"].update(zones or [])
+        clip["writer"].write(frame)
+        clip["frames"] += 1
+        clip["end"] = timestamp
+        self.frames_written += 1
+
+        if not triggered and timestamp - clip["last_trigger"] >= self.post_seconds:
+            self._close_clip()
+
+    def _open_clip(self, timestamp: float):
+        self.event_count += 1
+        stamp = datetime.datetime.fromtimestamp(timestamp).strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.folder, f"{stamp}_{self.camera_id}_event{self.event_count:04d}{VIDEO_EXTENSION}")
+        writer = cv2.VideoWriter(path, self.fourcc, self.fps, self.frame_size)
+        preroll_frames = self.ring.count
+        start = timestamp
+        for frame, frame_time in self.ring.drain():
+            start = min(start, frame_time)
+            writer.write(frame)
+        self.frames_written += preroll_frames
+        self.clip = {"writer": writer, "path": path, "start": start, "trigger": timestamp,
+                     "last_trigger": timestamp, "end": timestamp, "frames": preroll_frames, "zones": set()}
+        print(f"🎬 Event #{self.event_count} started: {os.path.basename(path)} ({preroll_frames} pre-roll frames)")
+
+    def _close_clip(self):
+        clip, self.clip = self.clip, None
+        clip["writer"].release()
+        size = os.path.getsize(clip["path"]) if os.path.exists(clip["path"]) else 0
+        self.bytes_written += size
+        entry = {
+            "file": os.path.basename(clip["path"]),
+            "camera": self.camera_id,
+            "start": clip["start"],
+            "trigger": clip["trigger"],
+            "end": clip["end"],
+            "frames": clip["frames"],
+            "bytes": size,
+            "zones": sorted(clip["zones"]),
+        }
+        with open(self.index_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        print(f"Event clip saved: {entry['file']} ({clip['end'] - clip['start']:.1f}s, {size / 1024:.0f} KB)")
+        if self.on_clip_closed:
+            self.on_clip_closed(clip["path"])
+
+    def release(self):
+        if self.clip is not None:
+            self._close_clip()
+        print(self.get_savings_info())
+
+    def get_savings_info(self) -> str:
+        if not self.frames_written:
+            return f"Event recording: no events in {self.frames_seen} frames (nothing written to disk)"
+        # Continuous recording would have encoded every frame at roughly the same bytes per frame
+        estimated_continuous = self.bytes_written / self.frames_written * self.frames_seen
+        saved = estimated_continuous - self.bytes_written
+        percent = saved / estimated_continuous * 100 if estimated_continuous else 0.0
+        return (f"Event recording: {self.event_count} clips, {self.frames_written}/{self.frames_seen} frames written, "
+                f"{self.bytes_written / 1048576:.1f} MB on disk vs ~{estimated_continuous / 1048576:.1f} MB "
+                f"continuous ({percent:.0f}% saved)")
@@ -0,0 +1,184 @@
+import time
+from metrics import registry
+from config import *
+
+GOVERNOR_ADJUSTMENTS = registry.counter("cctv_governor_adjustments_total", "Settings changed by the load governor")
+
+def imgsz_levels(min_imgsz: int, max_imgsz: int, step: int = GOVERNOR_IMGSZ_STEP):
+    """Model input sizes from largest to smallest, all multiples of 32 (the model stride)"""
+    step = max(32, step // 32 * 32)
+    levels = list(range(max_imgsz // 32 * 32, max(min_imgsz, 32) - 1, -step))
+    return levels or [max_imgsz]
+
+class LoadGovernor:
+    """Holds a target frame rate on an overloaded host by trading quality for speed, within bounds
+
+    Every ``interval`` seconds it compares the frame loop's busy time per frame
+    with the target frame interval and looks for a backlog in the capture
+    queues (dropped frames, or frames waiting). When the loop cannot keep up it
+    lowers the preview JPEG quality first, then runs the model on fewer frames
+    (detection stride), then feeds it smaller images. Once the load has stayed
+    low for ``recover_intervals`` it undoes the last change; a change that is
+    undone and then needed again right away doubles that wait, so settings do
+    not flap. Every adjustment is printed.
+    """
+    def __init__(self, target_fps: float, model=None, stride=None, preview=None, queues=(),
+                 min_imgsz: int = GOVERNOR_MIN_IMGSZ, max_imgsz: int = INFERENCE_IMGSZ,
+                 max_stride: int = GOVERNOR_MAX_STRIDE, min_preview_quality: int = GOVERNOR_MIN_PREVIEW_QUALITY,
+                 max_preview_quality: int = PREVIEW_JPEG_QUALITY,
+                 interval: float = GOVERNOR_INTERVAL_SECONDS, high_load: float = GOVERNOR_HIGH_LOAD,
+                 low_load: float = GOVERNOR_LOW_LOAD, recover_intervals: int = GOVERNOR_RECOVER_INTERVALS):
+        self.target_fps = target_fps
+        self.model = model
+        self.stride = stride          # DetectionStride, or None to leave every frame inferred
+        self.preview = preview        # PreviewServer, or None
+        self.queues = list(queues)    # FrameQueues whose backlog means the loop is behind
+        self.imgsz_levels = imgsz_levels(min_imgsz, max_imgsz) if model is not None else [max_imgsz]
+        self.min_stride = stride.stride if stride is not None else 1
+        self.max_stride = max(max_stride, self.min_stride)
+        self.max_preview_quality = max_preview_quality
+        self.min_preview_quality = min(min_preview_quality, max_preview_quality)
+        self.interval = interval
+        self.high_load = high_load
+        self.low_load = low_load
+        self.base_recover_intervals = max(1, recover_intervals)
+        self.recover_intervals = self.base_recover_intervals
+
+        self.imgsz_level = 0
+        self.load = 0.0
+        self.adjustments = 0
+        self._window_start = None
+        self._busy_seconds = 0.0
+        self._frames = 0
+        self._depth_total = 0
+        self._dropped = self._dropped_count()
+        self._calm_intervals = 0
+        self._last_recovery = -1      # Interval number of the last undone change
+        self._intervals = 0
+        self._at_limits = False
+        # The model and the preview server outlive a session: start again from full quality
+        if model is not None:
+            model.overrides["imgsz"] = self.imgsz
+        if preview is not None:
+            preview.quality = max_preview_quality
+        registry.gauge("cctv_governor_load", "Frame loop busy time relative to the target frame interval",
+                       fn=lambda: self.load)
+        registry.gauge("cctv_governor_imgsz", "Model input size chosen by the load governor", fn=lambda: self.imgsz)
+
+    @property
+    def imgsz(self) -> int:
+        return self.imgsz_levels[self.imgsz_level]
+
+    @property
+    def imgsz_limit(self):
+        """Upper bound for calls that choose their own input size (zone-ROI crops); None at full size"""
+        return self.imgsz if self.imgsz_level > 0 else None
+
+    def _dropped_count(self) -> int:
+        return sum(frame_queue.dropped_count for frame_queue in self.queues)
+
+    def update(self, busy_seconds: float, now: float = None):
+        """Count one iteration of the frame loop that was busy for ``busy_seconds`` (cheap; call every frame)"""
+        self._busy_seconds += busy_seconds
+        self._frames += 1
+        for frame_queue in self.queues:
+            self._depth_total += frame_queue.depth()
+        now = time.time() if now is None else now
+        if self._window_start is None:
+            self._window_start = now
+        elif now - self._window_start >= self.interval:
+            self._evaluate()
+            self._window_start = now
+
+    def _evaluate(self):
+        self._intervals += 1
+        frames, self._frames = self._frames, 0
+        busy, self._busy_seconds = self._busy_seconds, 0.0
+        depth, self._depth_total = self._depth_total, 0
+        dropped = self._dropped_count()
+        new_drops, self._dropped = dropped - self._dropped, dropped
+        if not frames:
+            return
+
+        self.load = busy / frames * self.target_fps
+        capacity = sum(frame_queue.stats()["capacity"] for frame_queue in self.queues)
+        backlog = new_drops > 0 or (capacity and depth / frames > capacity / 2)
+        if self.load > self.high_load or backlog:
+            self._calm_intervals = 0
+            if self._intervals - self._last_recovery <= 1:
+                # The change just undone was still needed: wait longer before trying again
+                self.recover_intervals = min(self.recover_intervals * 2, 64)
+            reason = f"load {self.load:.2f}" + (f", {new_drops} frames dropped" if new_drops else "") + \
+                     (", capture backlog" if backlog and not new_drops else "")
+            if self._degrade(reason):
+                self._at_limits = False
+            elif not self._at_limits:
+                self._at_limits = True
+                print(f"Governor: every setting is at its limit ({reason}, target {self.target_fps:.1f} FPS)")
+        elif self.load < self.low_load:
+            self._calm_intervals += 1
+            if self._calm_intervals >= self.recover_intervals:
+                self._calm_intervals = 0
+                if self._recover(f"load {self.load:.2f}"):
+                    self._last_recovery = self._intervals
+                    self._at_limits = False
+        else:
+            self._calm_intervals = 0
+            if self._intervals - self._last_recovery > 4 * self.recover_intervals:
+                self.recover_intervals = self.base_recover_intervals
+
+    def _degrade(self, reason: str) -> bool:
+        """Apply the next speed-up that still has room; False when everything is at its limit"""
+        if self._preview_watched() and self.preview.quality > self.min_preview_quality:
+            self._set_preview_quality(max(self.min_preview_quality, self.preview.quality - 10), reason)
+        elif self.stride is not None and self.stride.stride < self.max_stride:
+            self._set_stride(self.stride.stride + 1, reason)
+        elif self.imgsz_level < len(self.imgsz_levels) - 1:
+            self._set_imgsz_level(self.imgsz_level + 1, reason)
+        else:
+            return False
+        return True
+
+    def _recover(self, reason: str) -> bool:
+        """Undo the most recent kind of speed-up, in reverse order; False when nothing is degraded"""
+        if self.imgsz_level > 0:
+            self._set_imgsz_level(self.imgsz_level - 1, reason)
+        elif self.stride is not None and self.stride.stride > self.min_stride:
+            self._set_stride(self.stride.stride - 1, reason)
+        elif self.preview is not None and self.preview.quality < self.max_preview_quality:
+            self._set_preview_quality(min(self.max_preview_quality, self.preview.quality + 10), reason)
+        else:
+            return False
+        return True
+
+    def _preview_watched(self) -> bool:
+        """Preview encoding only costs time while someone is watching"""
+        return self.preview is not None and any(channel.viewers for channel in self.preview.channels.values())
+
+    def _set_preview_quality(self, quality: int, reason: str):
+        self._log(f"preview quality {self.preview.quality} -> {quality}", reason)
+        self.preview.quality = quality
+
+    def _set_stride(self, stride: int, reason: str):
+        self._log(f"detection stride {self.stride.stride} -> {stride}", reason)
+        self.stride.stride = stride
+
+    def _set_imgsz_level(self, level: int, reason: str):
+        self._log(f"inference size {self.imgsz} -> {self.imgsz_levels[level]}", reason)
+        self.imgsz_level = level
+        # Calls that do not pass imgsz use the override (see inference_backend.load_model)
+        self.model.overrides["imgsz"] = self.imgsz
+
+    def _log(self, change: str, reason: str):
+        self.adjustments += 1
+        GOVERNOR_ADJUSTMENTS.inc()
+        print(f"Governor: {change} ({reason}, target {self.target_fps:.1f} FPS)")
+
+    def get_governor_info(self) -> str:
+        settings = [f"inference size {self.imgsz}"]
+        if self.stride is not None:
+            settings.append(f"stride {self.stride.stride}")
+        if self.preview is not None:
+            settings.append(f"preview quality {self.preview.quality}")
+        return (f"Governor: {self.adjustments} adjustments, load {self.load:.2f} "
+                f"at {self.target_fps:.1f} FPS target; {', '.join(settings)}")
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import shutil
+import time
+import numpy as np
+from config import *
+
+# Ultralytics export format and the file (or folder) suffix of each exported backend
+BACKEND_FORMATS = {"onnx": ("onnx", ".onnx"), "openvino": ("openvino", "_openvino_model")}
+
+# Models loaded by get_model(), kept for the life of the process
+_models = {}
+
+def model_hash(path: str) -> str:
+    """Short SHA-256 of the weights file; exports are cached per hash so new weights re-export"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def export_path(model_path: str, backend: str, imgsz: int, int8: bool, dynamic: bool,
+                cache_folder: str = MODEL_CACHE_FOLDER) -> str:
+    """Cache location of an export, keyed by weights hash and every export option"""
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    options = f"{imgsz}{'-int8' if int8 else ''}{'-dynamic' if dynamic else ''}"
+    return os.path.join(cache_folder, f"{stem}-{model_hash(model_path)}-{options}{BACKEND_FORMATS[backend][1]}")
+
+def quantize_onnx(source: str, target: str):
+    """Dynamic INT8 weight quantization with ONNX Runtime (ultralytics exports ONNX in FP32 only)"""
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError:
+        raise RuntimeError("INT8 ONNX export needs onnxruntime (pip install onnxruntime)")
+    quantize_dynamic(source, target, weight_type=QuantType.QUInt8)
+
+def export_model(model_path: str = YOLO_MODEL_PATH, backend: str = INFERENCE_BACKEND,
+                 imgsz: int = INFERENCE_IMGSZ, int8: bool = INFERENCE_INT8, dynamic: bool = False) -> str:
+    """Export the weights for a backend once and return the cached export"""
+    from ultralytics import YOLO
+    target = export_path(model_path, backend, imgsz, int8, dynamic)
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    export_format = BACKEND_FORMATS[backend][0]
+    print(f"Exporting {model_path} to {backend} ({imgsz}px{', INT8' if int8 else ''}); this happens once...")
+    start = time.time()
+    options = {"format": export_format, "imgsz": imgsz, "dynamic": dynamic}
+    if int8 and backend == "openvino":
+        options.update(int8=True, data=INFERENCE_INT8_DATA)  # Post-training quantization with NNCF
+    exported = YOLO(model_path).export(**options)
+
+    if int8 and backend == "onnx":
+        quantize_onnx(exported, target + ".tmp")
+        os.remove(exported)
+        exported = target + ".tmp"
+    # Move into the cache only when complete, so an interrupted export is redone
+    shutil.move(exported, target)
+    print(f"Exported {target} in {time.time() - start:.1f} seconds")
+    return target
+
+def warm_up(model, imgsz: int = INFERENCE_IMGSZ, runs: int = 2):
+    """Run a few blank frames so the first real frame does not pay for lazy initialization"""
+    frame = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    start = time.time()
+    for _ in range(runs):
+        model.predict(frame, classes=DETECTION_CLASSES, imgsz=imgsz, verbose=False)
+    print(f"Model warmed up in {time.time() - start:.2f} seconds")
+
+def load_model(backend: str = INFERENCE_BACKEND, imgsz: int = INFERENCE_IMGSZ, int8: bool = INFERENCE_INT8,
+               dynamic: bool = False, model_path: str = YOLO_MODEL_PATH):
+    """Load the detector on a backend ("pytorch", "onnx" or "openvino"), exporting it first if needed
+
+    Exported models keep the ultralytics YOLO interface (track/predict), so the
+    rest of the pipeline does not change. ``dynamic`` exports accept any input
+    size and batch size (ROI crops, multi-camera and batch analysis batches).
+    """
+    from ultralytics import YOLO
+    if backend == "pytorch":
+        model = YOLO(model_path)
+    elif backend in BACKEND_FORMATS:
+        model = YOLO(export_model(model_path, backend, imgsz, int8, dynamic), task="detect")
+    else:
+        raise ValueError(f"Unknown inference backend '{backend}' (expected pytorch, {', '.join(BACKEND_FORMATS)})")
+    model.overrides["imgsz"] = imgsz  # Input size used when a call does not pass one
+    return model
+
+def get_model(backend: str = INFERENCE_BACKEND, imgsz: int = INFERENCE_IMGSZ, int8: bool = INFERENCE_INT8,
+              dynamic: bool = ENABLE_ROI_INFERENCE):
+    """Process-wide model: loaded and warmed up on first use, then reused by every recording cycle"""
+    key = (backend, imgsz, int8, dynamic)
+    if key not in _models:
+        start = time.time()
+        model = load_model(backend, imgsz, int8, dynamic)
+        print(f"Loaded {backend} model ({imgsz}px{', INT8' if int8 else ''}) in {time.time() - start:.2f} seconds")
+        if INFERENCE_WARMUP:
+            warm_up(model, imgsz)
+        _models[key] = model
+    return _models[key]
+
+def reset_tracking(model):
+    """Forget the tracks of the previous session (model.track(persist=True) keeps them on the predictor)"""
+    predictor = getattr(model, "predictor", None)
+    for tracker in getattr(predictor, "trackers", None) or []:
+        tracker.reset()
@@ -0,0 +1,333 @@
+import cv2
+import datetime
+import json
+import os
+import sqlite3
+import time
+from detections import Detections
+from config import *
+
+def detections_to_rows(detections: Detections):
+    """Compact per-box rows: [x1, y1, x2, y2, class, confidence, track_id]"""
+    rows = []
+    for row in range(len(detections)):
+        x1, y1, x2, y2 = (round(float(v), 1) for v in detections.xyxy[row])
+        track_id = int(detections.id[row]) if detections.id is not None else -1
+        rows.append([x1, y1, x2, y2, int(detections.cls[row]), round(float(detections.conf[row]), 3), track_id])
+    return rows
+
+def rows_to_detections(rows, orig_shape=None, names=None) -> Detections:
+    if not rows:
+        return Detections.empty(orig_shape, names)
+    xyxy = [row[:4] for row in rows]
+    track_ids = [row[6] for row in rows]
+    return Detections(xyxy, [row[4] for row in rows], [row[5] for row in rows],
+                      None if all(t < 0 for t in track_ids) else track_ids, orig_shape, names)
+
+class DetectionSidecar:
+    """Writes every frame's detections to a JSON-lines file next to the recording
+
+    One line per inferred frame: frame index in the recording, capture time, boxes
+    and the triggered zones. Used as a pipeline writer (``write_packet``) on its own
+    thread. With segmented recordings ``open()`` starts the sidecar of each segment.
+    """
+    def __init__(self, path: str = None):
+        self.path = None
+        self._file = None
+        self.frames_written = 0
+        if path:
+            self.open(path)
+
+    def open(self, path: str):
+        """Close the current file and write to ``path`` from now on"""
+        if self._file:
+            self._file.close()
+        self.path = path
+        self._file = open(path, "a")
+
+    def write_packet(self, packet, frame: int = None):
+        """Write one frame's entry; ``frame`` is its position in the recording (default: the packet index)"""
+        if self._file is None:
+            return  # No recording to attach the boxes to yet
+        entry = {
+            "frame": packet.index if frame is None else frame,
+            "t": round(packet.timestamp, 3),
+            "boxes": detections_to_rows(Detections.from_results(packet.results)),
+            "zones": packet.zones,
+        }
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self.frames_written += 1
+
+    def release(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+def to_timestamp(value) -> float:
+    """Epoch seconds from a number, a datetime or a "YYYY-MM-DD HH:MM[:SS]" string (local time)"""
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+def daily_windows(start, end, time_of_day):
+    """(start, end) epoch pairs for a local "HH:MM"-"HH:MM" window on every day between start and end"""
+    start, end = to_timestamp(start), to_timestamp(end)
+    first, last = (datetime.datetime.strptime(value, "%H:%M").time() for value in time_of_day)
+    windows = []
+    # Start a day early in case the window crosses midnight into the range
+    day = datetime.datetime.fromtimestamp(start).date() - datetime.timedelta(days=1)
+    while True:
+        window_start = datetime.datetime.combine(day, first)
+        window_end = datetime.datetime.combine(day, last)
+        if window_end <= window_start:  # Window crosses midnight, e.g. 22:00-06:00
+            window_end += datetime.timedelta(days=1)
+        if window_start.timestamp() >= end:
+            return windows
+        if window_end.timestamp() > start:
+            windows.append((max(start, window_start.timestamp()), min(end, window_end.timestamp())))
+        day += datetime.timedelta(days=1)
+
+class DetectionStore:
+    """Append-only SQLite store of every inferred frame's boxes and zone hits
+
+    Rows are keyed by recording file (segment) and frame position in that file and carry the
+    capture time, so footage can be searched without decoding video. Inserts are
+    buffered and written in one transaction per batch; time-indexed tables keep
+    queries over weeks of footage in the millisecond range. Used as a pipeline
+    writer (``write_packet``) on its own thread.
+    """
+    def __init__(self, path: str = METADATA_DB_PATH, batch_frames: int = METADATA_BATCH_FRAMES,
+                 flush_seconds: float = 1.0):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.batch_frames = batch_frames
+        self.flush_seconds = flush_seconds
+        # Written from the writer thread, read and closed from the main thread once it has stopped
+        # Several processes may append at once (batch analysis); wait for the write lock instead of failing
+        self.conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+        self.segment_id = None
+        self.class_names = dict(self.conn.execute("SELECT id, name FROM classes"))
+        self._detection_rows = []
+        self._hit_rows = []
+        self._pending_frames = 0
+        self._last_flush = time.time()
+        self.frames_written = 0
+        self.segments_written = 0
+        self.detections_written = 0
+        self.hits_written = 0
+
+    def _create_schema(self):
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS segments (
+                    id INTEGER PRIMARY KEY, file TEXT UNIQUE, camera TEXT, start REAL);
+                CREATE TABLE IF NOT EXISTS classes (id INTEGER PRIMARY KEY, name TEXT);
+                CREATE TABLE IF NOT EXISTS detections (
+                    segment INTEGER, frame INTEGER, t REAL, track INTEGER, cls INTEGER, conf REAL,
+                    x1 REAL, y1 REAL, x2 REAL, y2 REAL);
+                CREATE TABLE IF NOT EXISTS zone_hits (
+                    segment INTEGER, frame INTEGER, t REAL, track INTEGER, cls INTEGER, zone TEXT);
+                CREATE INDEX IF NOT EXISTS detections_time ON detections (t);
+                CREATE INDEX IF NOT EXISTS detections_class_time ON detections (cls, t);
+                CREATE INDEX IF NOT EXISTS zone_hits_zone_time ON zone_hits (zone, t);
+            """)
+
+    def begin_segment(self, file: str, camera_id: str = "camera01", start: float = None):
+        """Rows written from now on belong to this recording file"""
+        self.flush()
+        self.segments_written += 1
+        file = os.path.basename(file)
+        start = time.time() if start is None else start
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO segments (file, camera, start) VALUES (?, ?, ?)",
+                              (file, camera_id, start))
+        self.segment_id = self.conn.execute("SELECT id FROM segments WHERE file = ?", (file,)).fetchone()[0]
+
+    def delete_segment(self, file: str):
+        """Remove everything stored for a recording file (before it is analyzed again)"""
+        file = os.path.basename(file)
+        row = self.conn.execute("SELECT id FROM segments WHERE file = ?", (file,)).fetchone()
+        if row is None:
+            return
+        with self.conn:
+            self.conn.execute("DELETE FROM detections WHERE segment = ?", row)
+            self.conn.execute("DELETE FROM zone_hits WHERE segment = ?", row)
+            self.conn.execute("DELETE FROM segments WHERE id = ?", row)
+
+    def write_packet(self, packet, frame: int = None):
+        """Buffer one frame's rows; ``frame`` is its position in the recording (default: the packet index)"""
+        detections = Detections.from_results(packet.results)
+        for class_id, name in detections.names.items():
+            if class_id not in self.class_names:
+                self.class_names[class_id] = name
+                self.conn.execute("INSERT OR REPLACE INTO classes (id, name) VALUES (?, ?)", (class_id, name))
+
+        timestamp = packet.timestamp
+        box_zones = packet.box_zones or []
+        frame = packet.index if frame is None else frame
+        for row, (x1, y1, x2, y2, class_id, conf, track_id) in enumerate(detections_to_rows(detections)):
+            self._detection_rows.append((self.segment_id, frame, timestamp, track_id, class_id, conf,
+                                         x1, y1, x2, y2))
+            if row < len(box_zones):
+                for zone_name in box_zones[row]:
+                    self._hit_rows.append((self.segment_id, frame, timestamp, track_id, class_id, zone_name))
+        self._pending_frames += 1
+        self.frames_written += 1
+
+        if self._pending_frames >= self.batch_frames or timestamp - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered rows in one transaction"""
+        if self._detection_rows or self._hit_rows:
+            with self.conn:
+                self.conn.executemany("INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                      self._detection_rows)
+                self.conn.executemany("INSERT INTO zone_hits VALUES (?, ?, ?, ?, ?, ?)", self._hit_rows)
+            self.detections_written += len(self._detection_rows)
+            self.hits_written += len(self._hit_rows)
+        self._detection_rows = []
+        self._hit_rows = []
+        self._pending_frames = 0
+        self._last_flush = time.time()
+
+    def release(self):
+        self.flush()
+        # Keep planner statistics current so time-window queries stay on the time indexes
+        self.conn.execute("PRAGMA analysis_limit=1000")
+        self.conn.execute("PRAGMA optimize")
+        self.conn.close()
+
+    def class_id(self, cls) -> int:
+        """Class ID from an ID or a class name such as 'person'"""
+        if isinstance(cls, str):
+            for class_id, name in self.class_names.items():
+                if name == cls:
+                    return class_id
+            raise ValueError(f"Unknown class '{cls}' (known: {', '.join(self.class_names.values())})")
+        return int(cls)
+
+    def query_tracks(self, cls=None, zone: str = None, start=None, end=None, camera: str = None,
+                     time_of_day=None):
+        """Tracks matching all given filters, one row per (segment, track, class) in time order
+
+        Args:
+            cls: Class ID or name, e.g. 0 or "person"
+            zone: Only boxes inside this zone (e.g. "Zone 2")
+            start, end: Time range (epoch seconds, datetime or "YYYY-MM-DD HH:MM")
+            camera: Camera ID, e.g. "camera01"
+            time_of_day: ("HH:MM", "HH:MM") local-time window applied to every day in the range
+
+        Returns:
+            List of dicts with segment, camera, track, cls, name, first/last time and frame, and the
+            number of frames the track matched. Untracked boxes share track -1.
+        """
+        table = "zone_hits" if zone is not None else "detections"
+        conditions, params = [], []
+        if zone is not None:
+            conditions.append("zone = ?")
+            params.append(zone)
+        if cls is not None:
+            conditions.append("cls = ?")
+            params.append(self.class_id(cls))
+
+        if time_of_day is not None:
+            if start is None or end is None:
+                raise ValueError("time_of_day needs both start and end")
+            windows = daily_windows(start, end, time_of_day)
+        else:
+            windows = [(None if start is None else to_timestamp(start), None if end is None else to_timestamp(end))]
+        # One indexed range scan per window (an OR of ranges makes SQLite fall back to wider scans)
+        selects, select_params = [], []
+        for window_start, window_end in windows:
+            window_conditions, window_params = list(conditions), list(params)
+            if window_start is not None:
+                window_conditions.append("t >= ?")
+                window_params.append(window_start)
+            if window_end is not None:
+                window_conditions.append("t < ?")
+                window_params.append(window_end)
+            where = f" WHERE {' AND '.join(window_conditions)}" if window_conditions else ""
+            selects.append(f"SELECT segment, frame, t, track, cls FROM {table}{where}")
+            select_params.extend(window_params)
+        if not selects:
+            return []
+        camera_filter = ""
+        if camera is not None:
+            camera_filter = "WHERE s.camera = ?"
+            select_params.append(camera)
+
+        rows = self.conn.execute(f"""
+            SELECT s.file, s.camera, h.track, h.cls, MIN(h.t), MAX(h.t), MIN(h.frame), MAX(h.frame), COUNT(*)
+            FROM ({" UNION ALL ".join(selects)}) h JOIN segments s ON s.id = h.segment
+            {camera_filter}
+            GROUP BY h.segment, h.track, h.cls
+            ORDER BY MIN(h.t)""", select_params).fetchall()
+        return [{"segment": file, "camera": camera_id, "track": track_id, "cls": class_id,
+                 "name": self.class_names.get(class_id, str(class_id)), "first_time": first_time,
+                 "last_time": last_time, "first_frame": first_frame, "last_frame": last_frame, "frames": frames}
+                for file, camera_id, track_id, class_id, first_time, last_time, first_frame, last_frame, frames
+                in rows]
+
+    def get_store_info(self) -> str:
+        """What this store wrote (no table scans: the database may hold months of footage)"""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return (f"Detection store {self.path}: {self.segments_written} segments, {self.frames_written} frames, "
+                f"{self.detections_written} detections, {self.hits_written} zone hits written "
+                f"({size / 1048576:.1f} MB on disk)")
+
+def load_sidecar(path: str) -> dict:
+    """Read a sidecar into {frame_index: entry}"""
+    entries = {}
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entries[entry["frame"]] = entry
+    return entries
+
+def render_annotations(video_path: str, sidecar_path: str, output_path: str, zones_file: str = None):
+    """Re-render boxes (and zones) from a sidecar onto a raw recording, without running the model"""
+    from detector import draw_detections
+    from zone_detector import ZoneDetector
+
+    entries = load_sidecar(sidecar_path)
+    zone_detector = None
+    if zones_file and os.path.exists(zones_file):
+        zone_detector = ZoneDetector()
+        zone_detector.load_zones(zones_file)
+
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or TARGET_FPS
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*VIDEO_CODEC), fps, size)
+
+    frame_index = 0
+    last_boxes = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        entry = entries.get(frame_index)
+        if entry is not None:
+            last_boxes = entry["boxes"]
+        # Frames that were not inferred keep the last known boxes
+        draw_detections(frame, rows_to_detections(last_boxes, frame.shape[:2]))
+        if zone_detector:
+            for zone in zone_detector.zones:
+                zone.is_triggered = entry is not None and zone.name in entry["zones"]
+            zone_detector.draw_zones(frame)
+        out.write(frame)
+        frame_index += 1
+
+    cap.release()
+    out.release()
+    print(f"Rendered {frame_index} frames with annotations to {output_path}")
@@ -0,0 +1,229 @@
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import *
+
+# Default histogram buckets (seconds), from sub-millisecond stages up to slow inference
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Buckets for counts such as inference batch sizes
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+class Counter:
+    """Monotonic count, e.g. frames or zone triggers"""
+    kind = "counter"
+
+    def __init__(self, registry, labels=None):
+        self.registry = registry
+        self.labels = labels or {}
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        if self.registry.enabled:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+class Gauge:
+    """Current value; with ``fn`` it is read at scrape time (e.g. a queue depth) and costs nothing per frame"""
+    kind = "gauge"
+
+    def __init__(self, registry, labels=None, fn=None):
+        self.registry = registry
+        self.labels = labels or {}
+        self.fn = fn
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def snapshot(self):
+        return self.fn() if self.fn else self.value
+
+class Histogram:
+    """Cumulative buckets for Prometheus plus a rolling window of recent samples for quantiles"""
+    kind = "histogram"
+
+    def __init__(self, registry, labels=None, buckets=LATENCY_BUCKETS, window: int = METRICS_WINDOW):
+        self.registry = registry
+        self.labels = labels or {}
+        self.bounds = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.bounds) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.window = [0.0] * window
+        self.position = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self.bucket_counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.total += value
+            self.window[self.position % len(self.window)] = value
+            self.position += 1
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)) -> dict:
+        with self._lock:
+            recent = sorted(self.window[:min(self.position, len(self.window))])
+        if not recent:
+            return {q: 0.0 for q in qs}
+        return {q: recent[min(len(recent) - 1, int(q * len(recent)))] for q in qs}
+
+    def snapshot(self):
+        quantiles = self.quantiles()
+        return {"count": self.count, "sum": self.total,
+                "p50": quantiles[0.5], "p95": quantiles[0.95], "p99": quantiles[0.99]}
+
+class MetricsRegistry:
+    """All metrics of the process, rendered as Prometheus text or a JSON snapshot"""
+    def __init__(self, enabled: bool = ENABLE_METRICS):
+        self.enabled = enabled
+        self._families = {}  # name -> (kind, help, {label key: metric})
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help_text: str, labels=None, **kwargs):
+        key = format_labels(labels)
+        with self._lock:
+            kind, _, series = self._families.setdefault(name, (cls.kind, help_text, {}))
+            if kind != cls.kind:
+                raise ValueError(f"Metric {name} is already registered as a {kind}")
+            if key not in series:
+                series[key] = cls(self, labels, **kwargs)
+            return series[key]
+
+    def counter(self, name: str, help_text: str, labels=None) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels=None, fn=None) -> Gauge:
+        gauge = self._get(Gauge, name, help_text, labels)
+        if fn is not None:
+            gauge.fn = fn  # A new session's queue replaces the previous one
+        return gauge
+
+    def histogram(self, name: str, help_text: str, labels=None, buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            families = list(self._families.items())
+        for name, (kind, help_text, series) in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            series = list(series.items())
+            for key, metric in series:
+                if kind != "histogram":
+                    lines.append(f"{name}{key} {metric.snapshot()}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.bounds + ("+Inf",), metric.bucket_counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(dict(metric.labels, le=bound))} {cumulative}")
+                lines.append(f"{name}_sum{key} {metric.total}")
+                lines.append(f"{name}_count{key} {metric.count}")
+            if kind == "histogram":
+                # Rolling quantiles over the last METRICS_WINDOW samples, as a gauge family of their own
+                lines.append(f"# HELP {name}_recent {help_text} (quantiles of the last {METRICS_WINDOW} samples)")
+                lines.append(f"# TYPE {name}_recent gauge")
+                for _, metric in series:
+                    for q, value in metric.quantiles().items():
+                        lines.append(f"{name}_recent{format_labels(dict(metric.labels, quantile=q))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            families = list(self._families.items())
+        return {f"{name}{key}": metric.snapshot()
+                for name, (_, _, series) in families for key, metric in list(series.items())}
+
+# Process-wide registry used by the recorder, detector, zone detector and pipeline
+registry = MetricsRegistry()
+
+def watch_queue(frame_queue):
+    """Expose a FrameQueue's depth and drop count, read at scrape time"""
+    labels = {"queue": frame_queue.name}
+    registry.gauge("cctv_queue_depth", "Frames waiting in a pipeline queue", labels, fn=frame_queue.depth)
+    registry.gauge("cctv_queue_dropped", "Frames dropped by a pipeline queue this session", labels,
+                   fn=lambda: frame_queue.dropped_count)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, content_type = json.dumps(registry.snapshot()).encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, content_type = registry.render().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the console
+
+class MetricsServer:
+    """Local HTTP endpoint: /metrics (Prometheus text) and /metrics.json
+
+    Optionally also appends a JSON snapshot every ``log_interval`` seconds to
+    ``log_file`` (or prints it when log_file is "-").
+    """
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT,
+                 log_file: str = METRICS_LOG_FILE, log_interval: float = METRICS_LOG_INTERVAL):
+        self.host = host
+        self.port = port
+        self.log_file = log_file
+        self.log_interval = log_interval
+        self._server = None
+        self._stop = threading.Event()
+        self._logger = None
+
+    def start(self):
+        if self.port:
+            try:
+                self._server = ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+                self._server.daemon_threads = True
+                threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True).start()
+                print(f"Metrics endpoint: http://{self.host}:{self.port}/metrics")
+            except OSError as e:
+                print(f"Metrics endpoint unavailable ({e})")
+        if self.log_file:
+            self._stop.clear()
+            self._logger = threading.Thread(target=self._log_loop, name="MetricsLogger", daemon=True)
+            self._logger.start()
+
+    def _log_loop(self):
+        while not self._stop.wait(self.log_interval):
+            self.log_snapshot()
+
+    def log_snapshot(self):
+        line = json.dumps({"t": round(time.time(), 3), "metrics": registry.snapshot()})
+        if self.log_file == "-":
+            print(line)
+        else:
+            with open(self.log_file, "a") as f:
+                f.write(line + "\n")
+
+    def stop(self):
+        if self._logger:
+            self._stop.set()
+            self._logger.join()
+            self.log_snapshot()  # Final state of the session
+            self._logger = None
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+from detections import Detections
+from config import *
+
+def downscale_gray(frame, size=(64, 48)):
+    """Cheap grayscale thumbnail used for frame-difference scoring"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+def frame_difference_score(previous_small, current_small) -> float:
+    """Mean absolute difference between two thumbnails, scaled to 0..1"""
+    return float(cv2.absdiff(previous_small, current_small).mean()) / 255.0
+
+class MotionGate:
+    """Cheap motion pre-filter that decides whether a frame is worth running the model on
+
+    Works on a small grayscale thumbnail, either by differencing against the previous
+    frame ("diff") or with a MOG2 background model ("mog2"). Once motion is seen the
+    gate stays open for ``cooldown_frames`` so slow or briefly still objects keep
+    being tracked. Frames it gates reuse the boxes of the last inferred frame
+    (``held_detections()``), so an object standing still is not reported gone.
+    """
+    def __init__(self, method: str = MOTION_METHOD, min_area: float = MOTION_MIN_AREA,
+                 pixel_threshold: int = MOTION_PIXEL_THRESHOLD, cooldown_frames: int = MOTION_COOLDOWN_FRAMES,
+                 size=MOTION_FRAME_SIZE):
+        if method not in ("diff", "mog2"):
+            raise ValueError(f"Unknown motion method: {method}")
+        self.method = method
+        self.min_area = min_area
+        self.pixel_threshold = pixel_threshold
+        self.cooldown_frames = cooldown_frames
+        self.size = tuple(size)
+        self._previous_small = None
+        self._subtractor = None
+        if method == "mog2":
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=pixel_threshold,
+                                                                  detectShadows=False)
+        self._cooldown_remaining = 0
+        self.last_motion_ratio = 0.0
+        self.last_detections = None  # Boxes of the last frame that was not gated
+        # Statistics
+        self.frames_seen = 0
+        self.frames_gated = 0
+
+    def motion_ratio(self, frame) -> float:
+        """Fraction of thumbnail pixels that changed"""
+        small = downscale_gray(frame, self.size)
+        if self.method == "mog2":
+            foreground = self._subtractor.apply(small)
+            return float(np.count_nonzero(foreground)) / foreground.size
+
+        small = cv2.GaussianBlur(small, (3, 3), 0)
+        previous, self._previous_small = self._previous_small, small
+        if previous is None:
+            return 1.0  # First frame: always let it through
+        changed = cv2.absdiff(previous, small) > self.pixel_threshold
+        return float(np.count_nonzero(changed)) / changed.size
+
+    def has_motion(self, frame) -> bool:
+        """True if the frame should be sent to the model"""
+        self.frames_seen += 1
+        self.last_motion_ratio = self.motion_ratio(frame)
+        if self.last_motion_ratio >= self.min_area:
+            self._cooldown_remaining = self.cooldown_frames
+            return True
+        if self._cooldown_remaining > 0:
+            self._cooldown_remaining -= 1
+            return True
+        self.frames_gated += 1
+        return False
+
+    def remember(self, detections):
+        """Keep the boxes of a frame that went through, for the gated frames after it"""
+        self.last_detections = detections
+
+    def held_detections(self, orig_shape):
+        """Boxes for a gated frame: nothing moved, so the last boxes still stand"""
+        if self.last_detections is None:
+            return Detections.empty(orig_shape)
+        return self.last_detections
+
+    def get_gate_info(self) -> str:
+        ratio = self.frames_gated / self.frames_seen * 100 if self.frames_seen else 0.0
+        return (f"Motion gate ({self.method}): skipped inference on {self.frames_gated}/{self.frames_seen} "
+                f"frames ({ratio:.1f}%)")
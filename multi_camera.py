@@ -0,0 +1,282 @@
+import cv2
+import os
+import time
+import queue
+import threading
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+from ultralytics.utils.checks import check_yaml
+from inference_backend import get_model
+from detector import draw_detections, apply_zones
+from detections import Detections
+from zone_detector import ZoneFileWatcher, load_camera_zones
+from pipeline import FrameQueue, FrameGrabber, FrameWriter, END_OF_STREAM, BLOCK
+from recorder import create_output_folder, generate_filename
+from metadata_store import DetectionStore
+from metrics import registry, watch_queue, MetricsServer, SIZE_BUCKETS
+from alerts import AlertBus
+from preview_server import get_preview_server
+from seek_index import open_video_writer
+from segment_writer import SegmentTimeline, SegmentFollower, TimelineWriter
+from governor import LoadGovernor
+from retention import get_retention_manager
+from event_recorder import event_state
+from config import *
+
+def create_tracker(frame_rate: float):
+    """Create an independent tracker so every camera keeps its own track IDs"""
+    tracker_cfg = IterableSimpleNamespace(**yaml_load(check_yaml(TRACKER_CONFIG)))
+    return BYTETracker(args=tracker_cfg, frame_rate=int(round(frame_rate)))
+
+def track_result(tracker, result, frame) -> Detections:
+    """Run a tracker on one frame's raw model detections"""
+    boxes = result.boxes.cpu().numpy()
+    tracks = tracker.update(boxes, frame)
+    if len(tracks) == 0:
+        return Detections.empty(frame.shape[:2], result.names)
+    # Track rows are [x1, y1, x2, y2, track_id, score, class, detection_index]
+    return Detections(tracks[:, :4], tracks[:, 6], tracks[:, 5], tracks[:, 4], frame.shape[:2], result.names)
+
+class CameraWorker:
+    """One camera feed: capture thread, tracker state, zones and recording"""
+    def __init__(self, camera_number: int, source):
+        self.camera_id = f"camera{camera_number:02d}"
+        self.window_name = f"Camera-{camera_number:02d}"
+        self.source = source
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+
+        self.cap = cv2.VideoCapture(source)
+        if not self.is_file:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+            self.cap.set(cv2.CAP_PROP_FPS, TARGET_FPS)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or TARGET_FPS
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        self.filename = generate_filename(self.camera_id)
+        path = os.path.join(OUTPUT_FOLDER, self.filename)
+        fourcc = cv2.VideoWriter_fourcc(*VIDEO_CODEC)
+        # The store numbers its rows by the frames actually in the file (capture drops leave no gaps)
+        self.timeline = SegmentTimeline()
+        self.out = TimelineWriter(open_video_writer(path, fourcc, self.fps, (width, height)), path, self.timeline)
+
+        # Video files are replayed without dropping frames so results are reproducible
+        self.stop_event = threading.Event()
+        policy = BLOCK if self.is_file else CAPTURE_DROP_POLICY
+        self.capture_queue = FrameQueue(CAPTURE_QUEUE_SIZE, policy, name=f"{self.camera_id} capture")
+        self.writer_queue = FrameQueue(WRITER_QUEUE_SIZE, WRITER_DROP_POLICY, name=f"{self.camera_id} writer")
+        self.grabber = FrameGrabber(self.cap, self.capture_queue, self.stop_event)
+        watch_queue(self.capture_queue)
+        watch_queue(self.writer_queue)
+        self.writer = FrameWriter(self.out, self.writer_queue)
+        # Boxes and zone hits of every frame go to the shared metadata database (own connection per camera)
+        self.store = self.store_queue = self.store_writer = None
+        if ENABLE_METADATA_STORE:
+            self.store = DetectionStore()
+            follower = SegmentFollower(self.store, self.timeline,
+                                       lambda path: self.store.begin_segment(path, self.camera_id))
+            self.store_queue = FrameQueue(WRITER_QUEUE_SIZE, BLOCK, name=f"{self.camera_id} metadata store")
+            watch_queue(self.store_queue)
+            self.store_writer = FrameWriter(follower, self.store_queue, name=f"{self.camera_id} MetadataStore")
+
+        self.tracker = create_tracker(self.fps)
+        # Zones are saved per camera as they are drawn, and edits to the file are picked up while running
+        self.zone_detector = load_camera_zones(self.camera_id)
+        self.zone_watcher = ZoneFileWatcher(self.zone_detector.zones_file)
+        self.finished = False
+        self.frames_processed = 0
+
+        print(f"{self.camera_id}: {source} ({width}x{height} @ {self.fps:.1f} FPS) -> {self.filename}")
+
+    def start(self):
+        self.grabber.start()
+        self.writer.start()
+        if self.store_writer:
+            self.store_writer.start()
+        self.zone_watcher.start()
+
+    def track(self, result, frame) -> Detections:
+        """Run this camera's tracker on the shared model's raw detections"""
+        return track_result(self.tracker, result, frame)
+
+    def stop(self):
+        self.stop_event.set()
+        self.capture_queue.close()
+        self.grabber.join(timeout=2.0)
+        self.writer_queue.put(END_OF_STREAM)
+        self.writer.join()
+        self.out.release()  # Also closes the timeline, so the store does not wait for frames never written
+        if self.store_writer:
+            self.store_queue.put(END_OF_STREAM)
+            self.store_writer.join()
+            self.store_writer.writer.release()
+        self.zone_watcher.stop()
+        self.zone_detector.cache_geometry()
+        self.cap.release()
+
+class BatchInferenceServer:
+    """Shared model that runs one batched inference call over the latest frame of every camera"""
+    def __init__(self, model, workers, batch_timeout: float = MULTI_CAMERA_BATCH_TIMEOUT_MS / 1000.0, alert_bus=None,
+                 retention=None):
+        self.model = model
+        self.workers = workers
+        self.batch_timeout = batch_timeout
+        self.alert_bus = alert_bus
+        self.retention = retention    # RetentionManager told about zone events, or None
+        self.batch_count = 0
+        self.batched_frames = 0
+        self.batch_sizes = registry.histogram("cctv_inference_batch_size", "Frames per batched inference call",
+                                              buckets=SIZE_BUCKETS)
+        self.batch_seconds = registry.histogram("cctv_inference_batch_seconds", "Time of one batched inference call")
+
+    def collect_batch(self):
+        """Take at most one frame from each active camera, waiting up to batch_timeout in total"""
+        batch = []
+        deadline = time.time() + self.batch_timeout
+        for worker in self.workers:
+            if worker.finished:
+                continue
+            try:
+                packet = worker.capture_queue.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                continue
+            if packet is END_OF_STREAM:
+                worker.finished = True
+                print(f"{worker.camera_id}: end of stream")
+                continue
+            batch.append((worker, packet))
+        return batch
+
+    def process_batch(self, batch):
+        frames = [packet.frame for _, packet in batch]
+        start = time.perf_counter()
+        results = self.model.predict(frames, classes=DETECTION_CLASSES, verbose=False)
+        self.batch_seconds.observe(time.perf_counter() - start)
+        self.batch_sizes.observe(len(frames))
+        self.batch_count += 1
+        self.batched_frames += len(frames)
+
+        for (worker, packet), result in zip(batch, results):
+            detections = worker.track(result, packet.frame)
+            if RENDER_OVERLAY:
+                draw_detections(packet.frame, detections)
+            apply_zones(packet.frame, [detections], worker.zone_detector, RENDER_OVERLAY)
+            packet.annotated, packet.results = packet.frame, [detections]
+            packet.triggered, packet.zones = event_state(packet.results, worker.zone_detector)
+            if self.retention and packet.triggered:
+                self.retention.mark_event(worker.camera_id, packet.timestamp)
+            if self.alert_bus or worker.store:
+                packet.box_zones = worker.zone_detector.box_zone_names()
+            if self.alert_bus:
+                self.alert_bus.publish_frame(packet, worker.zone_detector, worker.camera_id)
+            if worker.store:
+                worker.store_queue.put(packet)
+            worker.writer_queue.put(packet)
+            worker.frames_processed += 1
+
+    def get_batch_info(self) -> str:
+        average = self.batched_frames / self.batch_count if self.batch_count else 0.0
+        return f"Inference batches: {self.batch_count} (average batch size {average:.2f})"
+
+def run_multi_camera(sources=None):
+    """Run every configured camera through one shared, batched model"""
+    sources = CAMERA_SOURCES if sources is None else sources
+    create_output_folder()
+
+    print(f"=== Smart CCTV Multi-Camera Mode ({len(sources)} sources) ===")
+    workers = [CameraWorker(number, source) for number, source in enumerate(sources, 1)]
+
+    # One model instance shared by all cameras
+    model = get_model(dynamic=True)  # Batches of one frame per camera need a dynamic export
+    alert_bus = None
+    if ENABLE_ALERT_BUS:
+        # One bus for all cameras; debouncing and rate limits are kept per camera
+        alert_bus = AlertBus()
+        alert_bus.start()
+        for worker in workers:
+            worker.zone_detector.print_alerts = False
+    retention = get_retention_manager() if ENABLE_DAILY_ORGANIZATION else None
+    server = BatchInferenceServer(model, workers, alert_bus=alert_bus, retention=retention)
+
+    if MULTI_CAMERA_SHOW_WINDOWS:
+        for worker in workers:
+            cv2.namedWindow(worker.window_name)
+            cv2.setMouseCallback(worker.window_name, worker.zone_detector.mouse_callback)
+        print("Draw zones in each camera window (click points, right-click to finish); press 'c' to clear, 'i' for info, 'q' to quit")
+
+    metrics_server = None
+    if ENABLE_METRICS:
+        metrics_server = MetricsServer()
+        metrics_server.start()
+    preview = get_preview_server() if ENABLE_PREVIEW_SERVER else None
+    # One batch holds a frame of every camera, so the batch loop has to keep up with the fastest camera
+    governor = None
+    if ENABLE_GOVERNOR:
+        target_fps = GOVERNOR_TARGET_FPS or max(worker.fps for worker in workers)
+        governor = LoadGovernor(target_fps, model, preview=preview,
+                                queues=[worker.capture_queue for worker in workers])
+        print(f"Load governor: holding {target_fps:.1f} FPS per camera")
+
+    start_time = time.time()
+    for worker in workers:
+        worker.start()
+
+    try:
+        while not all(worker.finished for worker in workers):
+            batch = server.collect_batch()
+            if batch:
+                batch_start = time.perf_counter()
+                server.process_batch(batch)
+                if governor:
+                    governor.update(time.perf_counter() - batch_start)
+                if preview:
+                    for worker, packet in batch:
+                        if preview.wants_frame(worker.camera_id, packet.timestamp):
+                            preview.publish(worker.camera_id, packet.annotated, packet.timestamp)
+            for worker in workers:
+                if worker.zone_watcher.changed():
+                    worker.zone_detector.reload_if_changed()
+
+            if MULTI_CAMERA_SHOW_WINDOWS:
+                for worker, packet in batch:
+                    cv2.imshow(worker.window_name, packet.annotated)
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord('q'):
+                    break
+                elif key == ord('c'):
+                    for worker in workers:
+                        worker.zone_detector.clear_zones()
+                elif key == ord('i'):
+                    for worker in workers:
+                        print(f"\n{worker.camera_id}\n" + worker.zone_detector.get_zone_info())
+    except KeyboardInterrupt:
+        print("\nMulti-camera mode stopped by user")
+    finally:
+        for worker in workers:
+            worker.stop()
+        if retention:
+            for worker in workers:
+                retention.submit(os.path.join(OUTPUT_FOLDER, worker.filename))
+            retention.flush()
+        if metrics_server:
+            metrics_server.stop()
+        if alert_bus:
+            alert_bus.stop()
+        cv2.destroyAllWindows()
+
+    duration = time.time() - start_time
+    total_frames = sum(worker.frames_processed for worker in workers)
+    print(f"Processed {total_frames} frames from {len(workers)} cameras in {duration:.2f} seconds")
+    print(f"Aggregate FPS: {total_frames / duration:.2f}")
+    print(server.get_batch_info())
+    if governor:
+        print(governor.get_governor_info())
+    if alert_bus:
+        print(alert_bus.get_alert_info())
+    for worker in workers:
+        print(f"  - {worker.camera_id}: {worker.frames_processed} frames -> {worker.filename}")
+        print(f"    {worker.capture_queue.get_stats_info()}")
+
+if __name__ == "__main__":
+    run_multi_camera()
@@ -0,0 +1,210 @@
+import cv2
+import queue
+import threading
+import time
+from metrics import registry
+
+# Drop policies for bounded frame queues
+DROP_OLDEST = "oldest"  # Discard the oldest queued frame to make room (keeps latency low)
+DROP_NEWEST = "newest"  # Discard the incoming frame (keeps already queued frames)
+BLOCK = "block"         # Never drop; the producer waits (use for video files)
+
+# Marker put on a queue when the producer has no more frames
+END_OF_STREAM = None
+
+
+class FramePacket:
+    """A single captured frame travelling through the pipeline stages"""
+    __slots__ = ("index", "timestamp", "frame", "annotated", "results", "triggered", "zones", "box_zones")
+
+    def __init__(self, index: int, timestamp: float, frame):
+        self.index = index          # Sequential frame number from the grabber
+        self.timestamp = timestamp  # Wall-clock capture time (time.time())
+        self.frame = frame          # Raw frame as read from the camera
+        self.annotated = None       # Frame with detections drawn (set by inference stage)
+        self.results = None         # Detection results (set by inference stage)
+        self.triggered = False      # Frame is part of an event (set by inference stage)
+        self.zones = []             # Names of the zones triggered in this frame
+        self.box_zones = None       # Per box, the names of the zones it is in
+
+
+class FrameQueue:
+    """Bounded queue between two pipeline stages with a configurable drop policy"""
+    def __init__(self, maxsize: int, drop_policy: str = DROP_OLDEST, name: str = "queue"):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.name = name
+        self.drop_policy = drop_policy
+        self._queue = queue.Queue(maxsize=max(1, maxsize))
+        self._lock = threading.Lock()
+        self._closed = False
+        # Metrics
+        self.put_count = 0
+        self.dropped_count = 0
+        self.max_depth = 0
+        self._depth_total = 0
+
+    def put(self, item) -> bool:
+        """Put an item on the queue. Returns False if a frame was dropped."""
+        if self.drop_policy == BLOCK:
+            # Wait for room, but give up once the consumer has closed the queue
+            while not self._closed:
+                try:
+                    self._queue.put(item, timeout=0.1)
+                except queue.Full:
+                    continue
+                self._record_put(item)
+                return True
+            return False
+
+        # The end-of-stream marker is never dropped, so it always evicts the oldest frame
+        policy = DROP_OLDEST if item is END_OF_STREAM else self.drop_policy
+        with self._lock:
+            try:
+                self._queue.put_nowait(item)
+                self._record_put(item)
+                return True
+            except queue.Full:
+                pass
+            self.dropped_count += 1
+            if policy == DROP_NEWEST:
+                return False
+            # DROP_OLDEST: make room by discarding the frame at the head
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(item)
+            self._record_put(item)
+            return False
+
+    def close(self):
+        """Stop accepting frames and release any producer blocked on a full queue"""
+        self._closed = True
+
+    def get(self, timeout: float = None):
+        """Get the next item, raising queue.Empty on timeout"""
+        return self._queue.get(timeout=timeout)
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def _record_put(self, item):
+        if item is END_OF_STREAM:
+            return
+        depth = self._queue.qsize()
+        self.put_count += 1
+        self._depth_total += depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def stats(self) -> dict:
+        avg_depth = self._depth_total / self.put_count if self.put_count else 0.0
+        return {
+            "name": self.name,
+            "policy": self.drop_policy,
+            "capacity": self._queue.maxsize,
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "avg_depth": avg_depth,
+            "frames_in": self.put_count,
+            "dropped": self.dropped_count,
+        }
+
+    def get_stats_info(self) -> str:
+        s = self.stats()
+        return (f"{s['name']}: in={s['frames_in']} dropped={s['dropped']} "
+                f"depth={s['depth']}/{s['capacity']} max={s['max_depth']} avg={s['avg_depth']:.2f} "
+                f"(policy: {s['policy']})")
+
+
+class FrameGrabber(threading.Thread):
+    """Grabber stage: reads frames from a cv2.VideoCapture as fast as the source delivers them
+
+    An optional ``tee`` queue receives every packet too (e.g. a raw archival writer),
+    independently of what the main output queue drops.
+    """
+    def __init__(self, cap, output: FrameQueue, stop_event: threading.Event, tee: FrameQueue = None):
+        super().__init__(name="FrameGrabber", daemon=True)
+        self.cap = cap
+        self.output = output
+        self.tee = tee
+        self.stop_event = stop_event
+        self.frames_read = 0
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set() and self.cap.isOpened():
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                packet = FramePacket(self.frames_read, time.time(), frame)
+                if self.tee is not None:
+                    self.tee.put(packet)
+                self.output.put(packet)
+                self.frames_read += 1
+        finally:
+            if self.tee is not None:
+                self.tee.put(END_OF_STREAM)
+            self.output.put(END_OF_STREAM)
+
+
+class FrameWriter(threading.Thread):
+    """Writer stage: encodes annotated frames to a cv2.VideoWriter off the inference thread
+
+    Writers that need more than the pixels (e.g. the event recorder) implement
+    ``write_packet(packet)`` and receive the whole FramePacket instead; writers
+    that index what they write (seek index) implement ``write_frame(frame, timestamp)``
+    and also get the capture time. ``field`` selects which frame is written
+    ("annotated" or the untouched "frame").
+    """
+    def __init__(self, writer, source: FrameQueue, field: str = "annotated", name: str = "FrameWriter"):
+        super().__init__(name=name, daemon=True)
+        self.writer = writer
+        self.source = source
+        self.field = field
+        self.frames_written = 0
+        self._write_packet = getattr(writer, "write_packet", None)
+        self._write_frame = getattr(writer, "write_frame", None)
+        self._write_seconds = registry.histogram("cctv_writer_seconds", "Time to encode or store one frame",
+                                                 {"writer": name})
+        # Encoder lag: capture to written, i.e. how far the writer trails the camera
+        self._lag_seconds = registry.histogram("cctv_writer_lag_seconds", "Time from capture until the frame is written",
+                                               {"writer": name})
+
+    def run(self):
+        while True:
+            packet = self.source.get()
+            if packet is END_OF_STREAM:
+                break
+            start = time.perf_counter()
+            if self._write_packet:
+                self._write_packet(packet)
+            elif self._write_frame:
+                self._write_frame(getattr(packet, self.field), packet.timestamp)
+            else:
+                self.writer.write(getattr(packet, self.field))
+            self._write_seconds.observe(time.perf_counter() - start)
+            self._lag_seconds.observe(time.time() - packet.timestamp)
+            self.frames_written += 1
+
+
+class ResizingWriter:
+    """Wraps a video writer and scales every frame to its frame size before encoding"""
+    def __init__(self, writer, frame_size):
+        self.writer = writer
+        self.frame_size = tuple(frame_size)
+
+    def write_frame(self, frame, timestamp: float):
+        if (frame.shape[1], frame.shape[0]) != self.frame_size:
+            frame = cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_AREA)
+        if hasattr(self.writer, "write_frame"):
+            self.writer.write_frame(frame, timestamp)
+        else:
+            self.writer.write(frame)
+
+    def write(self, frame):
+        self.write_frame(frame, time.time())
+
+    def release(self):
+        self.writer.release()
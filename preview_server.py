@@ -0,0 +1,222 @@
+import socket
+import threading
+import time
+import cv2
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from metrics import registry
+from config import *
+
+BOUNDARY = "frame"
+
+PREVIEW_ENCODE_SECONDS = registry.histogram("cctv_preview_encode_seconds", "Time to scale and JPEG-encode a preview frame")
+
+class PreviewChannel:
+    """Newest frame of one camera and its JPEG, shared by every viewer of that camera"""
+    def __init__(self, camera_id: str):
+        self.camera_id = camera_id
+        self.frame = None        # Newest frame from the frame loop, waiting for the encoder
+        self.jpeg = None         # Newest encoded preview
+        self.sequence = 0        # Increases with every new JPEG
+        self.last_publish = 0.0
+        self.viewers = 0
+        self.encoded = 0
+        self.replaced = 0        # Frames replaced by a newer one before they were encoded
+        registry.gauge("cctv_preview_viewers", "Connected preview viewers", {"camera": camera_id},
+                       fn=lambda: self.viewers)
+
+class _PreviewHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        preview = self.server.preview
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "":
+            self._send(200, "text/html", preview.index_page().encode())
+        elif path.startswith("/stream/") and path[8:] in preview.channels:
+            self._stream(preview, preview.channels[path[8:]])
+        elif path.startswith("/snapshot/") and path[10:].rsplit(".", 1)[0] in preview.channels:
+            jpeg = preview.snapshot(path[10:].rsplit(".", 1)[0])
+            if jpeg is None:
+                self.send_error(503, "No frame yet")
+            else:
+                self._send(200, "image/jpeg", jpeg)
+        else:
+            self.send_error(404)
+
+    def _send(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, preview, channel):
+        # A small send buffer keeps a slow viewer from queueing up old frames in the kernel
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, PREVIEW_SEND_BUFFER)
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        sequence = 0
+        preview.add_viewer(channel)
+        try:
+            while True:
+                jpeg, sequence = preview.wait_for_jpeg(channel, sequence)
+                if jpeg is None:
+                    if preview.stopping:
+                        return
+                    continue
+                self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                 f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass  # Viewer closed the page
+        finally:
+            preview.remove_viewer(channel)
+
+    def log_message(self, format, *args):
+        pass  # One line per viewer request would flood the console
+
+class PreviewServer:
+    """Live MJPEG preview over HTTP: http://host:port/ lists the cameras, /stream/<camera_id> streams one
+
+    The frame loop only hands over a reference to its newest annotated frame
+    (``publish()``), and only while someone is watching and the preview frame
+    rate allows. One encoder thread scales and JPEG-encodes each handed-over
+    frame once, however many viewers there are. Each viewer thread then sends
+    the newest JPEG; frames a slow viewer missed are skipped, never queued.
+    """
+    def __init__(self, host: str = PREVIEW_HOST, port: int = PREVIEW_PORT, scale: float = PREVIEW_SCALE,
+                 fps: float = PREVIEW_FPS, quality: int = PREVIEW_JPEG_QUALITY):
+        self.host = host
+        self.port = port
+        self.scale = scale
+        self.fps = fps
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.quality = quality
+        self.channels = {}  # camera_id -> PreviewChannel
+        self.stopping = False
+        self._lock = threading.Lock()              # Hand-over of frames between the frame loop and the encoder
+        self._encoded = threading.Condition()      # Signals viewers that a new JPEG is ready
+        self._pending = threading.Event()          # Signals the encoder that a frame was handed over
+        self._server = None
+        self._encoder = None
+
+    def channel(self, camera_id: str) -> PreviewChannel:
+        if camera_id not in self.channels:
+            self.channels[camera_id] = PreviewChannel(camera_id)
+        return self.channels[camera_id]
+
+    def wants_frame(self, camera_id: str, timestamp: float) -> bool:
+        """True when a frame of this camera would be shown now (lets the loop skip drawing otherwise)"""
+        channel = self.channel(camera_id)
+        return channel.viewers > 0 and timestamp - channel.last_publish >= self.interval
+
+    def publish(self, camera_id: str, frame, timestamp: float):
+        """Hand a frame to the encoder without copying or waiting; the frame must not be modified afterwards"""
+        channel = self.channel(camera_id)
+        with self._lock:
+            if channel.frame is not None:
+                channel.replaced += 1
+            channel.frame = frame
+        channel.last_publish = timestamp
+        self._pending.set()
+
+    def _encode_loop(self):
+        while not self.stopping:
+            if not self._pending.wait(timeout=0.5):
+                continue
+            self._pending.clear()
+            for channel in list(self.channels.values()):
+                with self._lock:
+                    frame, channel.frame = channel.frame, None
+                if frame is not None:
+                    self._encode(channel, frame)
+
+    def _encode(self, channel: PreviewChannel, frame):
+        start = time.perf_counter()
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        PREVIEW_ENCODE_SECONDS.observe(time.perf_counter() - start)
+        with self._encoded:
+            channel.jpeg = jpeg.tobytes()
+            channel.sequence += 1
+            channel.encoded += 1
+            self._encoded.notify_all()
+
+    def wait_for_jpeg(self, channel: PreviewChannel, seen: int, timeout: float = 5.0):
+        """Newest JPEG newer than sequence ``seen`` as (jpeg, sequence), or (None, seen) on timeout"""
+        with self._encoded:
+            if not self._encoded.wait_for(lambda: channel.sequence != seen or self.stopping, timeout):
+                return None, seen
+            if self.stopping:
+                return None, seen
+            return channel.jpeg, channel.sequence
+
+    def add_viewer(self, channel: PreviewChannel):
+        with self._encoded:
+            channel.viewers += 1
+            channel.last_publish = 0.0  # Send the next frame right away
+
+    def remove_viewer(self, channel: PreviewChannel):
+        with self._encoded:
+            channel.viewers -= 1
+
+    def snapshot(self, camera_id: str, timeout: float = 2.0):
+        """A fresh JPEG of one camera (counts as a viewer until it arrives)"""
+        channel = self.channels[camera_id]
+        self.add_viewer(channel)
+        try:
+            jpeg, _ = self.wait_for_jpeg(channel, channel.sequence, timeout)
+        finally:
+            self.remove_viewer(channel)
+        return jpeg or channel.jpeg
+
+    def index_page(self) -> str:
+        images = "".join(f'<h3>{camera_id}</h3><img src="/stream/{camera_id}">' for camera_id in sorted(self.channels))
+        return (f"<html><head><title>Smart CCTV Preview</title></head>"
+                f"<body>{images or '<p>No cameras yet</p>'}</body></html>")
+
+    def start(self):
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), _PreviewHandler)
+        except OSError as e:
+            print(f"Preview server unavailable ({e})")
+            return
+        self._server.daemon_threads = True
+        self._server.preview = self
+        self.stopping = False
+        threading.Thread(target=self._server.serve_forever, name="PreviewServer", daemon=True).start()
+        self._encoder = threading.Thread(target=self._encode_loop, name="PreviewEncoder", daemon=True)
+        self._encoder.start()
+        print(f"Live preview: http://{self.host}:{self.port}/ "
+              f"({self.scale:.0%} scale, {f'up to {self.fps:.0f} FPS' if self.fps > 0 else 'every frame'})")
+
+    def stop(self):
+        with self._encoded:
+            self.stopping = True
+            self._encoded.notify_all()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._encoder:
+            self._encoder.join()
+            self._encoder = None
+
+    def get_preview_info(self) -> str:
+        return ", ".join(f"{channel.camera_id}: {channel.encoded} previews encoded, "
+                         f"{channel.replaced} skipped, {channel.viewers} viewers"
+                         for channel in self.channels.values()) or "No preview channels"
+
+# Server shared by all recording cycles of the process, so viewers stay connected across restarts
+_preview_server = None
+
+def get_preview_server() -> PreviewServer:
+    global _preview_server
+    if _preview_server is None:
+        _preview_server = PreviewServer()
+        _preview_server.start()
+    return _preview_server
@@ -2,39 +2,107 @@ import cv2
 import os
 import datetime
 import time
-from ultralytics import YOLO
-from detector import detect_objects
-from zone_detector import ZoneDetector
+import queue
+import threading
+from inference_backend import get_model, reset_tracking
+from detector import detect_objects, draw_overlay, DetectionStride
+from motion_detector import MotionGate
+from zone_detector import ZoneFileWatcher, load_camera_zones
+from pipeline import FrameQueue, FrameGrabber, FrameWriter, ResizingWriter, END_OF_STREAM, BLOCK
+from metadata_store import DetectionSidecar, DetectionStore
+from control import ControlServer
+from metrics import registry, watch_queue, MetricsServer
+from alerts import AlertBus
+from preview_server import get_preview_server
+from segment_writer import SegmentWriter, SegmentTimeline, SegmentFollower, TimelineWriter
+from seek_index import open_video_writer
+from governor import LoadGovernor
+from retention import get_retention_manager
+from event_recorder import EventRecorder, event_state
 from config import *
 
+# Inference-loop metrics (stage timings live in detector.py, zone_detector.py and pipeline.py)
+FRAMES_TOTAL = registry.counter("cctv_frames_total", "Frames processed by the inference loop")
+FRAME_SECONDS = registry.histogram("cctv_frame_seconds", "Inference loop time per frame, excluding the wait for a frame")
+CAPTURE_AGE_SECONDS = registry.histogram("cctv_capture_age_seconds", "Time a frame waited between capture and inference")
+
 # ===== CONFIGURATION SECTION =====
 # All settings are now imported from config.py
 # Modify config.py to change system behavior
 # =================================
 
+# Keys in the interactive window and the control commands they map to
+KEY_COMMANDS = {ord('q'): "quit", ord('c'): "clear", ord('i'): "info"}
+
 def create_output_folder():
     """Create the output folder if it doesn't exist"""
     if not os.path.exists(OUTPUT_FOLDER):
         os.makedirs(OUTPUT_FOLDER)
         print(f"Created output folder: {OUTPUT_FOLDER}")
 
-def generate_filename():
+def generate_filename(camera_id="camera01"):
     """Generate a unique filename with timestamp"""
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    return f"{timestamp}_camera01{VIDEO_EXTENSION}"
+    return f"{timestamp}_{camera_id}{VIDEO_EXTENSION}"
+
+def setup_zone_detection(headless=False):
+    """Load the camera's saved zones and set up the mouse callback to draw more (unless headless)"""
+    zone_detector = load_camera_zones("camera01")
+    if not zone_detector.zones:
+        print(f"No zones saved in {zone_detector.zones_file}" + ("; running without zones" if headless else ""))
+
+    if headless:
+        # No window to draw in: zones come from the zones file (edits to it are reloaded)
+        return zone_detector
 
-def setup_zone_detection():
-    """Setup zone detection with mouse callback"""
-    zone_detector = ZoneDetector()
-    
     # Create a window and set mouse callback
     cv2.namedWindow("Camera-01")
     cv2.setMouseCallback("Camera-01", zone_detector.mouse_callback)
     
     return zone_detector
 
-def capture():
-    """Capture video with object detection and save to folder"""
+def handle_command(command, zone_detector, frame_count=0):
+    """Apply a control command (from a keypress or the control socket) and return the reply"""
+    if command == "quit":
+        return "Stopping recording session"
+    if command == "shutdown":
+        return "Shutting down"
+    if command == "status":
+        return f"Frames processed: {frame_count}"
+    if not zone_detector:
+        return "Zone detection is disabled"
+    if command == "clear":
+        zone_detector.clear_zones()
+        return "All restricted zones cleared"
+    if command == "info":
+        return zone_detector.get_zone_info()
+    zones_file = zone_detector.zones_file
+    if command == "save":
+        zone_detector.save_zones()
+        return f"Zones saved to {zones_file}"
+    if command == "reload":
+        if not os.path.exists(zones_file):
+            return f"No zones file found at {zones_file}"
+        count = zone_detector.load_zones()
+        return f"Reloaded {count} zones from {zones_file}"
+    return f"Unknown command: {command}"
+
+def poll_control(control, zone_detector, frame_count=0):
+    """Answer the pending control commands; returns "quit" or "shutdown" when one asked to stop"""
+    stop_command = None
+    for command in control.poll():
+        command.reply(handle_command(command.name, zone_detector, frame_count))
+        if command.name in ("quit", "shutdown"):
+            stop_command = command.name
+    return stop_command
+
+def capture(headless=HEADLESS_MODE, continuous=False):
+    """Capture video with object detection and save to folder
+
+    In continuous mode the session runs until stopped, rolling over to a new
+    segment file every SEGMENT_DURATION_MINUTES instead of ending.
+    Returns True when a shutdown was requested (control socket or SIGTERM).
+    """
     # Create output folder
     create_output_folder()
     
@@ -42,7 +110,10 @@ def capture():
     filename = generate_filename()
     filepath = os.path.join(OUTPUT_FOLDER, filename)
     
-    print(f"Starting new recording session: {filename}")
+    if continuous:
+        print("Starting continuous recording session")
+    else:
+        print(f"Starting new recording session: {filename}")
     
     cap = cv2.VideoCapture(CAMERA_INDEX)
     
@@ -65,107 +136,315 @@ def capture():
     print(f"Recording FPS: {recording_fps}")
 
     fourcc = cv2.VideoWriter_fourcc(*VIDEO_CODEC)
-    out = cv2.VideoWriter(filepath, fourcc, recording_fps, (width, height))
+    # Finished files go to the retention manager, which files them by date off this thread
+    retention = get_retention_manager() if ENABLE_DAILY_ORGANIZATION else None
+    on_segment_closed = retention.submit if retention else None
+    session_files = [filepath]  # Files of a non-continuous session, handed over when it ends
+    raw_out = sidecar = None
+    # Sidecar and store follow the main recording (raw stream in dual-stream mode) through its timeline,
+    # so their frame numbers are positions in the file even when frames are dropped before the writer
+    timeline = None
+    if DUAL_STREAM_RECORDING:
+        # Archival stream of untouched frames at the camera's own rate; boxes go to a sidecar file
+        raw_fps = actual_fps if actual_fps > 0 else TARGET_FPS
+        timeline = SegmentTimeline()
+        if continuous:
+            raw_out = SegmentWriter(OUTPUT_FOLDER, raw_fps, (width, height), on_segment_closed=on_segment_closed,
+                                    timeline=timeline, field="frame")
+        else:
+            raw_out = TimelineWriter(open_video_writer(filepath, fourcc, raw_fps, (width, height)), filepath,
+                                     timeline, field="frame")
+        # One sidecar per recording file, named after it, so it is filed and deleted with it
+        sidecar = DetectionSidecar()
+        print(f"Dual-stream recording: raw at {raw_fps:.1f} FPS, detections in a .jsonl file next to it")
+
+        # Optional low-rate, downscaled annotated stream
+        out = None
+        if ANNOTATED_STREAM_FPS > 0:
+            annotated_size = (int(width * ANNOTATED_STREAM_SCALE), int(height * ANNOTATED_STREAM_SCALE))
+            if continuous:
+                annotated_out = SegmentWriter(OUTPUT_FOLDER, ANNOTATED_STREAM_FPS, annotated_size,
+                                              camera_id="camera01_annotated", on_segment_closed=on_segment_closed)
+            else:
+                annotated_path = os.path.join(OUTPUT_FOLDER, generate_filename("camera01_annotated"))
+                session_files.append(annotated_path)
+                annotated_out = open_video_writer(annotated_path, fourcc, ANNOTATED_STREAM_FPS, annotated_size)
+            out = ResizingWriter(annotated_out, annotated_size)
+            print(f"Annotated stream: {annotated_size[0]}x{annotated_size[1]} at {ANNOTATED_STREAM_FPS} FPS")
+    elif EVENT_RECORDING:
+        # Only clips around events (with pre-roll) are written; each is filed as it closes
+        session_files = []
+        out = EventRecorder(OUTPUT_FOLDER, recording_fps, (width, height),
+                            on_clip_closed=retention.submit_event_clip if retention else None)
+        print(f"Event recording: {EVENT_PREROLL_SECONDS}s pre-roll, {EVENT_POSTROLL_SECONDS}s post-roll")
+    elif continuous:
+        # Finished segments are filed into daily folders as soon as they close
+        timeline = SegmentTimeline()
+        out = SegmentWriter(OUTPUT_FOLDER, recording_fps, (width, height), on_segment_closed=on_segment_closed,
+                            timeline=timeline)
+    else:
+        timeline = SegmentTimeline()
+        out = TimelineWriter(open_video_writer(filepath, fourcc, recording_fps, (width, height)), filepath, timeline)
 
-    # Load YOLO model
-    model = YOLO(YOLO_MODEL_PATH)
+    # The model is loaded and warmed up once per process; only the tracks start over
+    model = get_model()
+    reset_tracking(model)
     
     # Setup zone detection if enabled
     zone_detector = None
-    if ENABLE_ZONE_DETECTION:
+    if ENABLE_ZONE_DETECTION and headless:
+        zone_detector = setup_zone_detection(headless=True)
+        print("Zone detection enabled (headless)")
+    elif ENABLE_ZONE_DETECTION:
         zone_detector = setup_zone_detection()
         print("Zone detection enabled!")
         print("Instructions:")
-        print("  - Click and drag to draw restricted zones")
+        print("  - Click points to draw a restricted zone, right-click to finish (Shift: exclude zone)")
         print("  - Press 'c' to clear all zones")
         print("  - Press 'i' to show zone information")
         print("  - Press 'q' to quit recording")
 
-    # Frame timing for consistent playback
-    frame_interval = 1.0 / recording_fps
+    # Edits to the zones file (by hand or by another tool) are applied between frames
+    zone_watcher = None
+    if zone_detector:
+        zone_watcher = ZoneFileWatcher(zone_detector.zones_file)
+        zone_watcher.start()
+
+    # Zone alerts are delivered off the frame loop
+    alert_bus = None
+    if ENABLE_ALERT_BUS and zone_detector:
+        alert_bus = AlertBus()
+        alert_bus.start()
+        zone_detector.print_alerts = False
+
+    # Skip inference on some frames and carry tracked boxes forward (the governor may raise the stride)
+    stride = None
+    if DETECTION_STRIDE > 1 or ADAPTIVE_STRIDE or ENABLE_GOVERNOR:
+        stride = DetectionStride()
+        print(f"Detection stride: every {stride.stride} frames{' (adaptive)' if ADAPTIVE_STRIDE else ''}")
+
+    # Skip inference on frames without motion
+    motion_gate = None
+    if ENABLE_MOTION_GATING:
+        motion_gate = MotionGate()
+        print(f"Motion gating enabled ({MOTION_METHOD}, min area {MOTION_MIN_AREA:.3f})")
+
+    # Staged pipeline: grabber thread -> inference (this thread) -> writer thread(s)
+    stop_event = threading.Event()
+    capture_queue = FrameQueue(CAPTURE_QUEUE_SIZE, CAPTURE_DROP_POLICY, name="capture")
+    writer_queue = FrameQueue(WRITER_QUEUE_SIZE, WRITER_DROP_POLICY, name="writer")
+    writers = []  # (queue, FrameWriter) pairs, each encoding on its own thread
+    if out is not None:
+        writers.append((writer_queue, FrameWriter(out, writer_queue)))
+    raw_queue = sidecar_queue = None
+    if raw_out is not None:
+        raw_queue = FrameQueue(WRITER_QUEUE_SIZE, BLOCK, name="raw writer")
+        sidecar_queue = FrameQueue(WRITER_QUEUE_SIZE, BLOCK, name="sidecar")
+        writers.append((raw_queue, FrameWriter(raw_out, raw_queue, field="frame", name="RawWriter")))
+        sidecar_writer = SegmentFollower(sidecar, timeline,
+                                         lambda path: sidecar.open(os.path.splitext(path)[0] + ".jsonl"))
+        writers.append((sidecar_queue, FrameWriter(sidecar_writer, sidecar_queue, name="SidecarWriter")))
+    grabber = FrameGrabber(cap, capture_queue, stop_event, tee=raw_queue)
+
+    # Every inferred frame's boxes and zone hits also go to the searchable metadata store
+    metadata_queues = [sidecar_queue] if sidecar_queue else []
+    store = None
+    if ENABLE_METADATA_STORE:
+        store = DetectionStore()
+        if timeline:
+            # Rows are keyed by recording file and numbered by their position in it
+            store_writer = SegmentFollower(store, timeline, lambda path: store.begin_segment(path, "camera01"))
+            store_queue = FrameQueue(WRITER_QUEUE_SIZE, BLOCK, name="metadata store")
+            writers.append((store_queue, FrameWriter(store_writer, store_queue, name="MetadataStore")))
+            metadata_queues.append(store_queue)
+        else:
+            # Event recording: there is no session file, rows are keyed to each event clip as it is written
+            out.store = store
+
+    for frame_queue in [capture_queue, raw_queue] + [writer_input for writer_input, _ in writers]:
+        if frame_queue is not None:
+            watch_queue(frame_queue)
+    metrics_server = None
+    if ENABLE_METRICS:
+        metrics_server = MetricsServer()
+        metrics_server.start()
+
+    # Browser preview of the annotated frames (the server outlives this session)
+    preview = get_preview_server() if ENABLE_PREVIEW_SERVER else None
+
+    # Hold the target frame rate by lowering preview quality, raising the stride and shrinking the model input
+    governor = None
+    if ENABLE_GOVERNOR:
+        target_fps = GOVERNOR_TARGET_FPS or (actual_fps if actual_fps > 0 else TARGET_FPS)
+        # Fixed-size ONNX/OpenVINO exports only accept the size they were exported at
+        resizable = INFERENCE_BACKEND == "pytorch" or ENABLE_ROI_INFERENCE
+        governor = LoadGovernor(target_fps, model if resizable else None, stride, preview, [capture_queue])
+        print(f"Load governor: holding {target_fps:.1f} FPS")
+
+    # Headless: commands arrive over the control socket or as signals instead of keypresses
+    control = None
+    if headless:
+        control = ControlServer()
+        control.start()
+
     start_time = time.time()
     frame_count = 0
-    last_frame_time = start_time
-
-    while cap.isOpened():
-        current_time = time.time()
-        
-        # Read frame
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        # Detect objects and check zones
-        detected_frame, results = detect_objects(frame, model, zone_detector)
-
-        # Display frame
-        cv2.imshow("Camera-01", detected_frame)
-        
-        # Write frame to video
-        out.write(detected_frame)
-        
-        frame_count += 1
-        
-        # Handle key presses
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord('q'):
-            break
-        elif key == ord('c') and zone_detector:
-            zone_detector.clear_zones()
-        elif key == ord('i') and zone_detector:
-            print("\n" + zone_detector.get_zone_info())
-        
-        # Maintain consistent timing by sleeping if needed
-        elapsed_since_last = current_time - last_frame_time
-        if elapsed_since_last < frame_interval:
-            sleep_time = frame_interval - elapsed_since_last
-            time.sleep(sleep_time)
-        
-        last_frame_time = time.time()
-
-    cap.release()
-    out.release()
-    cv2.destroyAllWindows()
+    stop_command = None
+    last_annotated_time = 0.0
+    grabber.start()
+    for _, writer in writers:
+        writer.start()
+
+    try:
+        while True:
+            try:
+                packet = capture_queue.get(timeout=1.0)
+            except queue.Empty:
+                # A stalled camera must not make the session deaf to quit/shutdown (SIGTERM)
+                if control:
+                    stop_command = poll_control(control, zone_detector, frame_count)
+                    if stop_command:
+                        break
+                continue
+            if packet is END_OF_STREAM:
+                break
+            frame_start = time.perf_counter()
+            CAPTURE_AGE_SECONDS.observe(time.time() - packet.timestamp)
+
+            # Detect objects and check zones (nothing is burned into the raw stream)
+            packet.annotated, packet.results = detect_objects(packet.frame, model, zone_detector,
+                                                                stride, motion_gate,
+                                                                draw=RENDER_OVERLAY and raw_out is None,
+                                                                max_imgsz=governor.imgsz_limit if governor else None)
+            packet.triggered, packet.zones = event_state(packet.results, zone_detector)
+            if retention and packet.triggered:
+                retention.mark_event("camera01", packet.timestamp)
+            packet.box_zones = zone_detector.box_zone_names() if zone_detector else None
+            if alert_bus:
+                alert_bus.publish_frame(packet, zone_detector)
+            for metadata_queue in metadata_queues:
+                metadata_queue.put(packet)
+
+            preview_due = preview is not None and preview.wants_frame("camera01", packet.timestamp)
+            if raw_out is not None:
+                # Annotate a copy only for frames that are displayed or due in the annotated stream
+                annotated_due = (out is not None and
+                                 packet.timestamp - last_annotated_time >= 1.0 / ANNOTATED_STREAM_FPS)
+                if annotated_due or preview_due or not headless:
+                    packet.annotated = packet.frame.copy()
+                    draw_overlay(packet.annotated, packet.results, zone_detector)
+                if annotated_due:
+                    last_annotated_time = packet.timestamp
+                    writer_queue.put(packet)
+            else:
+                # Hand the frame to the encoder thread
+                writer_queue.put(packet)
+            if preview_due:
+                preview.publish("camera01", packet.annotated, packet.timestamp)
+            frame_count += 1
+            FRAMES_TOTAL.inc()
+            frame_seconds = time.perf_counter() - frame_start
+            FRAME_SECONDS.observe(frame_seconds)
+            if governor:
+                governor.update(frame_seconds)
+
+            if zone_watcher and zone_watcher.changed():
+                zone_detector.reload_if_changed()
+
+            if headless:
+                # No GUI calls in the hot loop, just a non-blocking queue check
+                stop_command = poll_control(control, zone_detector, frame_count)
+            else:
+                # Display frame
+                cv2.imshow("Camera-01", packet.annotated)
+
+                # Handle key presses
+                command = KEY_COMMANDS.get(cv2.waitKey(1) & 0xFF)
+                if command == "quit":
+                    stop_command = command
+                elif command and zone_detector:
+                    print("\n" + handle_command(command, zone_detector, frame_count))
+            if stop_command:
+                break
+    finally:
+        # Stop the grabber, then let the writers drain what is already queued
+        stop_event.set()
+        capture_queue.close()
+        grabber.join(timeout=2.0)
+        for writer_input, writer in writers:
+            writer_input.put(END_OF_STREAM)
+            writer.join()
+        if control:
+            control.stop()
+        if zone_watcher:
+            zone_watcher.stop()
+            zone_detector.cache_geometry()
+        if metrics_server:
+            metrics_server.stop()
+        if alert_bus:
+            alert_bus.stop()
+            zone_detector.print_alerts = True
+
+        # Finalize the recordings even when stopped with Ctrl+C (the last segment, its index and metadata)
+        cap.release()
+        if store:
+            store.flush()
+            print(store.get_store_info())
+        # Followers of the segment timeline (sidecar, store) first, so the last segment is complete when it is filed
+        for _, writer in reversed(writers):
+            writer.writer.release()
+        if store and not timeline:
+            store.release()  # Fed by the event recorder, not a writer of its own
+        if retention and not continuous:
+            for path in session_files:
+                retention.submit(path)
+
+    if not headless:
+        cv2.destroyAllWindows()
     
     # Calculate actual recording duration
     actual_duration = time.time() - start_time
-    print(f"Recording session completed: {filename}")
-    print(f"Frames recorded: {frame_count}")
+    if DUAL_STREAM_RECORDING:
+        print(f"Dual-stream recording session completed: {filename}")
+    elif EVENT_RECORDING:
+        print(f"Event recording session completed: {out.event_count} clips")
+    elif continuous:
+        print(f"Continuous recording completed: {out.segment_index + 1} segments")
+    else:
+        print(f"Recording session completed: {filename}")
+    print(f"Frames captured: {grabber.frames_read}")
+    for _, writer in writers:
+        print(f"Frames recorded ({writer.name}): {writer.frames_written}")
     print(f"Actual duration: {actual_duration:.2f} seconds")
     print(f"Effective FPS: {frame_count/actual_duration:.2f}")
+    print("Pipeline queues:")
+    print(f"  - {capture_queue.get_stats_info()}")
+    for writer_input, _ in writers:
+        print(f"  - {writer_input.get_stats_info()}")
+    if stride:
+        print(stride.get_stride_info())
+    if governor:
+        print(governor.get_governor_info())
+    if motion_gate:
+        print(motion_gate.get_gate_info())
+    if alert_bus:
+        print(alert_bus.get_alert_info())
+    if retention:
+        print(retention.get_retention_info())
+
+    return stop_command == "shutdown"
 
 def organize_daily_footage():
-    """Organize footage into daily folders"""
-    if not ENABLE_DAILY_ORGANIZATION or not os.path.exists(OUTPUT_FOLDER):
+    """Hand any recordings still at the top of the output folder to the retention manager"""
+    if not ENABLE_DAILY_ORGANIZATION:
         return
-        
-    # Get current date for folder naming
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-    daily_folder = os.path.join(OUTPUT_FOLDER, current_date)
-    
-    # Create daily folder if it doesn't exist
-    if not os.path.exists(daily_folder):
-        os.makedirs(daily_folder)
-        print(f"Created daily folder: {daily_folder}")
-    
-    # Move all video files from recordings folder to daily folder
-    moved_count = 0
-    for filename in os.listdir(OUTPUT_FOLDER):
-        if filename.endswith(VIDEO_EXTENSION) and filename != current_date:
-            source_path = os.path.join(OUTPUT_FOLDER, filename)
-            dest_path = os.path.join(daily_folder, filename)
-            
-            try:
-                os.rename(source_path, dest_path)
-                moved_count += 1
-                print(f"Moved: {filename} -> {daily_folder}")
-            except Exception as e:
-                print(f"Error moving {filename}: {e}")
-    
-    if moved_count > 0:
-        print(f"Organized {moved_count} files into daily folder: {daily_folder}")
+    retention = get_retention_manager()
+    count = retention.adopt_loose_files()
+    if count:
+        print(f"Filing {count} recordings into daily folders")
     else:
         print("No files to organize")
+    retention.flush()
 
 def main():
     """Main function with restart loop and daily save interval"""
@@ -177,9 +456,27 @@ def main():
     print(f"  - Zone detection: {'Enabled' if ENABLE_ZONE_DETECTION else 'Disabled'}")
     print(f"  - Daily organization: {'Enabled' if ENABLE_DAILY_ORGANIZATION else 'Disabled'}")
     print(f"  - Video format: {VIDEO_CODEC} ({VIDEO_EXTENSION})")
-    print(f"  - Press 'q' to quit any recording session")
+    if HEADLESS_MODE:
+        print(f"  - Headless mode: zones from {ZONES_FOLDER}/, control socket {CONTROL_HOST}:{CONTROL_PORT}")
+    else:
+        print(f"  - Press 'q' to quit any recording session")
+    print(f"  - Inference: {INFERENCE_BACKEND} at {INFERENCE_IMGSZ}px{' (INT8)' if INFERENCE_INT8 else ''}")
     print("==================================")
-    
+
+    # Load (and export, the first time) the model before the first session starts
+    get_model()
+
+    if CONTINUOUS_RECORDING:
+        # One long session: camera and model stay loaded, files roll over without gaps
+        print(f"  - Continuous recording: {SEGMENT_DURATION_MINUTES}-minute segments")
+        try:
+            capture(continuous=True)
+        except KeyboardInterrupt:
+            print("\nSystem stopped by user")
+        print("Organizing any remaining footage...")
+        organize_daily_footage()
+        return
+
     # Calculate intervals
     restart_interval_seconds = RESTART_INTERVAL_MINUTES * 60
     save_interval_seconds = SAVE_INTERVAL_HOURS * 3600
@@ -203,7 +500,11 @@ def main():
                 minutes_until_save = int((time_until_save % 3600) / 60)
                 print(f"Time until next daily save: {hours_until_save}h {minutes_until_save}m")
             
-            capture()
+            if capture():
+                print("\nShutdown requested")
+                print("Organizing any remaining footage...")
+                organize_daily_footage()
+                break
             
             # Check if it's time for daily save
             if current_time - last_save_time >= save_interval_seconds:
@@ -0,0 +1,255 @@
+import datetime
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+from config import *
+
+# Files next to a recording that share its name and go wherever it goes (detection sidecar, seek index)
+COMPANION_EXTENSIONS = (".jsonl", ".seek")
+
+def parse_recording_name(path: str):
+    """(camera_id, recorded_at) from a generate_filename(), segment or event clip name, or None"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    try:
+        recorded_at = datetime.datetime.strptime(stem[:15], "%Y%m%d_%H%M%S").timestamp()
+    except ValueError:
+        return None
+    parts = stem[16:].split("_")
+    # Drop the segment index ("00003") or event number ("event0004")
+    if len(parts) > 1 and (parts[-1].isdigit() or parts[-1].startswith("event")):
+        parts = parts[:-1]
+    return "_".join(parts) or "camera01", recorded_at
+
+class RetentionManager:
+    """Files finished recordings into daily folders and keeps disk usage within limits
+
+    Recordings are handed over with ``submit()`` when their writer closes them;
+    a background thread moves each one into the folder of the day it was
+    recorded and adds it to a SQLite index (camera, recording time, size, and
+    the time it may be kept until). Quotas and ages are enforced from the index
+    alone, oldest first per camera, so no directory is ever rescanned. Clips
+    with zone events get a longer age limit, which also puts them last in line
+    when a quota forces evictions.
+    """
+    def __init__(self, folder: str = OUTPUT_FOLDER, index_path: str = RETENTION_INDEX_PATH,
+                 max_age_days: float = RETENTION_MAX_AGE_DAYS, event_max_age_days: float = RETENTION_EVENT_MAX_AGE_DAYS,
+                 camera_quota_gb: float = RETENTION_CAMERA_QUOTA_GB, min_free_gb: float = RETENTION_MIN_FREE_GB,
+                 check_seconds: float = RETENTION_CHECK_SECONDS):
+        self.folder = folder
+        self.index_path = index_path
+        self.max_age = max_age_days * 86400 if max_age_days else float("inf")
+        self.event_max_age = event_max_age_days * 86400 if event_max_age_days else float("inf")
+        self.camera_quota = int(camera_quota_gb * 1024 ** 3)
+        self.min_free = int(min_free_gb * 1024 ** 3)
+        self.check_seconds = check_seconds
+        self._queue = queue.Queue()
+        self._thread = None
+        self._db = None
+        self._camera_bytes = {}   # camera -> indexed bytes, kept in step with the index
+        self._events = {}         # camera -> [start, end] spans of zone events seen by the frame loop
+        # Statistics
+        self.filed = 0
+        self.evicted = 0
+        self.evicted_bytes = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="RetentionManager", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """File what was submitted, then stop"""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def flush(self):
+        """Wait until every submitted recording is filed"""
+        self._queue.join()
+
+    def submit(self, path: str, events: bool = False):
+        """Hand over a finished recording (never blocks; safe from writer threads)"""
+        self._queue.put((path, events))
+
+    def submit_event_clip(self, path: str):
+        self.submit(path, events=True)
+
+    def mark_event(self, camera_id: str, timestamp: float):
+        """Note a frame with a zone event; segments overlapping it are kept as event footage"""
+        spans = self._events.setdefault(camera_id, [])
+        if spans and timestamp - spans[-1][1] <= 1.0:
+            spans[-1][1] = timestamp
+            return
+        if len(spans) >= 1000:
+            del spans[:500]  # Old spans belong to segments that were filed long ago
+        spans.append([timestamp, timestamp])
+
+    def _had_events(self, camera_id: str, start: float, end: float) -> bool:
+        spans = list(self._events.get(camera_id, []))
+        return any(span_start <= end and span_end >= start for span_start, span_end in spans)
+
+    def _connect(self):
+        folder = os.path.dirname(self.index_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._db = sqlite3.connect(self.index_path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS recordings (
+                path TEXT PRIMARY KEY,
+                camera TEXT NOT NULL,
+                recorded_at REAL NOT NULL,
+                ended_at REAL NOT NULL,
+                bytes INTEGER NOT NULL,
+                events INTEGER NOT NULL,
+                keep_until REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS recordings_camera_keep ON recordings (camera, keep_until);
+            CREATE INDEX IF NOT EXISTS recordings_keep ON recordings (keep_until);
+        """)
+        self._camera_bytes = dict(self._db.execute("SELECT camera, SUM(bytes) FROM recordings GROUP BY camera"))
+
+    def _run(self):
+        self._connect()
+        last_check = 0.0
+        while True:
+            try:
+                item = self._queue.get(timeout=self.check_seconds)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                self._queue.task_done()
+                break
+            try:
+                if item:
+                    try:
+                        self.file_recording(*item)
+                    except OSError as e:
+                        print(f"Retention: could not file {item[0]}: {e}")
+                if time.time() - last_check >= self.check_seconds or item:
+                    self.enforce()
+                    last_check = time.time()
+            except Exception as e:
+                # One bad file or database error must not stop filing (or hang flush())
+                print(f"Retention: error while {'filing ' + item[0] if item else 'enforcing limits'}: {e!r}")
+            finally:
+                if item:
+                    self._queue.task_done()
+        self._db.close()
+
+    def file_recording(self, path: str, events: bool = False):
+        """Move a recording into the daily folder of its recording date and index it"""
+        if not os.path.exists(path):
+            return
+        stat = os.stat(path)
+        parsed = parse_recording_name(path)
+        camera_id, recorded_at = parsed if parsed else ("camera01", stat.st_mtime)
+        events = events or self._had_events(camera_id, recorded_at, stat.st_mtime)
+
+        # Event clips stay in their own folder; everything else goes into a daily folder
+        daily_folder = os.path.join(self.folder, datetime.datetime.fromtimestamp(recorded_at).strftime("%Y-%m-%d"))
+        folder = os.path.dirname(os.path.abspath(path))
+        target = path
+        if os.path.basename(folder) != EVENT_FOLDER:
+            if folder != os.path.abspath(daily_folder):
+                os.makedirs(daily_folder, exist_ok=True)
+                target = os.path.join(daily_folder, os.path.basename(path))
+                os.rename(path, target)
+                for companion in self._companions(path):
+                    os.rename(companion, os.path.join(daily_folder, os.path.basename(companion)))
+
+        keep_until = recorded_at + (self.event_max_age if events else self.max_age)
+        keep_until = min(keep_until, 1e18)  # "Forever" as a sortable number
+        with self._db:
+            previous = self._db.execute("SELECT bytes, camera FROM recordings WHERE path = ?", (target,)).fetchone()
+            if previous:
+                self._camera_bytes[previous[1]] -= previous[0]
+            self._db.execute("INSERT OR REPLACE INTO recordings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (target, camera_id, recorded_at, stat.st_mtime, stat.st_size, int(events), keep_until))
+        self._camera_bytes[camera_id] = self._camera_bytes.get(camera_id, 0) + stat.st_size
+        self.filed += 1
+
+    def _companions(self, path: str):
+        stem = os.path.splitext(path)[0]
+        return [stem + extension for extension in COMPANION_EXTENSIONS if os.path.exists(stem + extension)]
+
+    def enforce(self, now: float = None):
+        """Delete expired recordings, then the oldest ones of cameras over quota or while disk space is low"""
+        now = time.time() if now is None else now
+        for path, camera_id, size in self._db.execute(
+                "SELECT path, camera, bytes FROM recordings WHERE keep_until < ? ORDER BY keep_until", (now,)).fetchall():
+            self._evict(path, camera_id, size, "expired")
+
+        # Recordings that cannot be deleted (in use, no permission) stay at the front of the order:
+        # skip past them for the rest of this pass instead of selecting them again forever
+        if self.camera_quota:
+            for camera_id, total in list(self._camera_bytes.items()):
+                failed = 0
+                while total > self.camera_quota:
+                    row = self._db.execute("SELECT path, bytes FROM recordings WHERE camera = ? "
+                                           "ORDER BY keep_until, recorded_at LIMIT 1 OFFSET ?", (camera_id, failed)).fetchone()
+                    if row is None:
+                        break
+                    if not self._evict(row[0], camera_id, row[1], "over quota"):
+                        failed += 1
+                    total = self._camera_bytes.get(camera_id, 0)
+
+        if self.min_free:
+            failed = 0
+            while shutil.disk_usage(self.folder).free < self.min_free:
+                row = self._db.execute("SELECT path, camera, bytes FROM recordings ORDER BY keep_until, recorded_at "
+                                       "LIMIT 1 OFFSET ?", (failed,)).fetchone()
+                if row is None:
+                    break
+                if not self._evict(*row, "low disk space"):
+                    failed += 1
+
+    def _evict(self, path: str, camera_id: str, size: int, reason: str) -> bool:
+        """Delete a recording and its companion files; False (and still indexed) when a file cannot be deleted"""
+        for victim in [path] + self._companions(path):
+            try:
+                os.remove(victim)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Retention: could not delete {victim}: {e}")
+                return False
+        with self._db:
+            self._db.execute("DELETE FROM recordings WHERE path = ?", (path,))
+        self._camera_bytes[camera_id] = self._camera_bytes.get(camera_id, 0) - size
+        self.evicted += 1
+        self.evicted_bytes += size
+        print(f"Retention: deleted {os.path.basename(path)} ({reason}, {size / 1024 ** 2:.1f} MB)")
+        try:
+            os.rmdir(os.path.dirname(path))  # Only succeeds once a daily folder is empty
+        except OSError:
+            pass
+        return True
+
+    def adopt_loose_files(self):
+        """Submit recordings left at the top of the output folder (e.g. from before a crash)"""
+        if not os.path.isdir(self.folder):
+            return 0
+        loose = [entry.path for entry in os.scandir(self.folder)
+                 if entry.is_file() and entry.name.endswith(VIDEO_EXTENSION)]
+        for path in loose:
+            self.submit(path)
+        return len(loose)
+
+    def get_retention_info(self) -> str:
+        usage = ", ".join(f"{camera}: {total / 1024 ** 3:.2f} GB" for camera, total in sorted(self._camera_bytes.items()))
+        return (f"Retention: {self.filed} filed, {self.evicted} deleted ({self.evicted_bytes / 1024 ** 3:.2f} GB)"
+                f"{'; ' + usage if usage else ''}")
+
+# Manager shared by all recording cycles of the process
+_retention_manager = None
+
+def get_retention_manager() -> RetentionManager:
+    global _retention_manager
+    if _retention_manager is None:
+        _retention_manager = RetentionManager()
+        _retention_manager.start()
+    return _retention_manager
@@ -0,0 +1,275 @@
+import datetime
+import glob
+import os
+import sqlite3
+import struct
+import time
+import cv2
+import numpy as np
+from retention import parse_recording_name
+from config import *
+
+# Index file next to each recording: <recording stem>.seek
+SEEK_EXTENSION = ".seek"
+SEEK_MAGIC = b"CCTVSEEK"
+SEEK_VERSION = 1
+# magic, version, fps, frame count, thumbnail count, thumbnail width, thumbnail height (padded to 64 bytes)
+HEADER = struct.Struct("<8sIdqqII")
+HEADER_SIZE = 64
+THUMBNAIL_DTYPE = np.dtype([("frame", "<i8"), ("time", "<f8"), ("offset", "<i8"), ("length", "<i8")])
+
+def seek_index_path(video_path: str) -> str:
+    return os.path.splitext(video_path)[0] + SEEK_EXTENSION
+
+class SeekIndexBuilder:
+    """Collects the capture time of every written frame and a small JPEG every few seconds
+
+    ``add()`` runs on the writer thread: it appends one timestamp, and every
+    ``interval`` seconds scales the frame to a thumbnail and encodes it.
+    ``save()`` writes the .seek file once the recording is closed.
+    """
+    def __init__(self, video_path: str, fps: float, interval: float = SEEK_THUMBNAIL_INTERVAL,
+                 thumbnail_width: int = SEEK_THUMBNAIL_WIDTH, quality: int = SEEK_THUMBNAIL_QUALITY):
+        self.video_path = video_path
+        self.fps = fps
+        self.interval = interval
+        self.thumbnail_width = thumbnail_width
+        self.quality = quality
+        self.thumbnail_size = (0, 0)
+        self.frame_times = []
+        self.thumbnails = []      # (frame index, time, jpeg bytes)
+        self._next_thumbnail = 0.0
+
+    def add(self, frame, timestamp: float):
+        frame_index = len(self.frame_times)
+        self.frame_times.append(timestamp)
+        if timestamp < self._next_thumbnail:
+            return
+        self._next_thumbnail = timestamp + self.interval
+        height, width = frame.shape[:2]
+        size = (self.thumbnail_width, max(1, round(height * self.thumbnail_width / width)))
+        thumbnail = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        ok, jpeg = cv2.imencode(".jpg", thumbnail, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if ok:
+            self.thumbnail_size = size
+            self.thumbnails.append((frame_index, timestamp, jpeg.tobytes()))
+
+    def save(self, path: str = None) -> str:
+        """Write the index atomically; returns its path (None when no frame was added)"""
+        if not self.frame_times:
+            return None
+        path = path or seek_index_path(self.video_path)
+        table = np.zeros(len(self.thumbnails), dtype=THUMBNAIL_DTYPE)
+        blob_start = HEADER_SIZE + 8 * len(self.frame_times) + table.nbytes
+        offset = blob_start
+        for row, (frame_index, timestamp, jpeg) in enumerate(self.thumbnails):
+            table[row] = (frame_index, timestamp, offset, len(jpeg))
+            offset += len(jpeg)
+        header = HEADER.pack(SEEK_MAGIC, SEEK_VERSION, self.fps, len(self.frame_times), len(self.thumbnails),
+                             *self.thumbnail_size)
+        with open(path + ".tmp", "wb") as f:
+            f.write(header.ljust(HEADER_SIZE, b"\0"))
+            f.write(np.asarray(self.frame_times, dtype="<f8").tobytes())
+            f.write(table.tobytes())
+            for _, _, jpeg in self.thumbnails:
+                f.write(jpeg)
+        os.replace(path + ".tmp", path)
+        return path
+
+class SeekIndex:
+    """Read side of a .seek file, memory-mapped so opening one costs almost nothing"""
+    def __init__(self, path: str):
+        self.path = path
+        self.video_path = None
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, self.fps, frame_count, thumbnail_count, width, height = \
+            HEADER.unpack(self._map[:HEADER.size].tobytes())
+        if magic != SEEK_MAGIC or version > SEEK_VERSION:
+            raise ValueError(f"{path} is not a seek index this version can read")
+        self.thumbnail_size = (width, height)
+        times_end = HEADER_SIZE + 8 * frame_count
+        self.frame_times = self._map[HEADER_SIZE:times_end].view("<f8")
+        self.thumbnails = self._map[times_end:times_end + thumbnail_count * THUMBNAIL_DTYPE.itemsize].view(THUMBNAIL_DTYPE)
+
+    @property
+    def start(self) -> float:
+        return float(self.frame_times[0])
+
+    @property
+    def end(self) -> float:
+        return float(self.frame_times[-1])
+
+    def frame_at(self, timestamp: float) -> int:
+        """Index of the last frame captured at or before ``timestamp``"""
+        return max(0, int(np.searchsorted(self.frame_times, timestamp, side="right")) - 1)
+
+    def thumbnail_at(self, timestamp: float) -> int:
+        """Row of the thumbnail closest to ``timestamp``"""
+        times = self.thumbnails["time"]
+        row = int(np.searchsorted(times, timestamp))
+        if row > 0 and (row == len(times) or timestamp - times[row - 1] <= times[row] - timestamp):
+            row -= 1
+        return row
+
+    def thumbnail(self, row: int):
+        """Decoded thumbnail image of a table row"""
+        entry = self.thumbnails[row]
+        jpeg = self._map[int(entry["offset"]):int(entry["offset"]) + int(entry["length"])]
+        return cv2.imdecode(np.asarray(jpeg), cv2.IMREAD_COLOR)
+
+def build_seek_index(video_path: str, interval: float = SEEK_THUMBNAIL_INTERVAL) -> str:
+    """Index an existing recording; times come from its filename and frame rate
+
+    Every frame is grabbed but only thumbnail frames are converted to images.
+    """
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or TARGET_FPS
+    parsed = parse_recording_name(video_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    start = parsed[1] if parsed else os.path.getmtime(video_path) - total_frames / fps
+    builder = SeekIndexBuilder(video_path, fps, interval)
+    frame_index = 0
+    while cap.grab():
+        timestamp = start + frame_index / fps
+        if timestamp >= builder._next_thumbnail:
+            ok, frame = cap.retrieve()
+            if ok:
+                builder.add(frame, timestamp)
+        else:
+            builder.frame_times.append(timestamp)
+        frame_index += 1
+    cap.release()
+    return builder.save()
+
+class IndexedWriter:
+    """Wraps a cv2.VideoWriter and builds the recording's seek index from the frames written to it"""
+    def __init__(self, writer, path: str, fps: float):
+        self.writer = writer
+        self.index = SeekIndexBuilder(path, fps)
+
+    def write_frame(self, frame, timestamp: float):
+        self.writer.write(frame)
+        self.index.add(frame, timestamp)
+
+    def write(self, frame):
+        self.write_frame(frame, time.time())
+
+    def release(self):
+        self.writer.release()
+        self.index.save()
+
+def open_video_writer(path: str, fourcc, fps: float, frame_size, index: bool = ENABLE_SEEK_INDEX):
+    """cv2.VideoWriter for a whole-session recording, indexed while it is written when ``index`` is set"""
+    writer = cv2.VideoWriter(path, fourcc, fps, frame_size)
+    return IndexedWriter(writer, path, fps) if index else writer
+
+def find_indexes(start: float, end: float, camera: str = None, folder: str = OUTPUT_FOLDER):
+    """Seek indexes of recordings overlapping [start, end], oldest first
+
+    Uses the retention index when there is one, otherwise the daily folders of
+    the dates in the range (one directory listing per day).
+    """
+    if os.path.exists(RETENTION_INDEX_PATH):
+        with sqlite3.connect(RETENTION_INDEX_PATH) as db:
+            query = "SELECT path FROM recordings WHERE recorded_at <= ? AND ended_at >= ?"
+            params = [end, start]
+            if camera:
+                query += " AND camera = ?"
+                params.append(camera)
+            paths = [row[0] for row in db.execute(query + " ORDER BY recorded_at", params)]
+    else:
+        paths = []
+        day = datetime.date.fromtimestamp(start)
+        while day <= datetime.date.fromtimestamp(end):
+            paths.extend(glob.glob(os.path.join(folder, day.isoformat(), f"*{VIDEO_EXTENSION}")))
+            day += datetime.timedelta(days=1)
+        paths.extend(glob.glob(os.path.join(folder, f"*{VIDEO_EXTENSION}")))
+    indexes = []
+    for path in paths:
+        parsed = parse_recording_name(path)
+        if camera and parsed and parsed[0] != camera:
+            continue
+        if os.path.exists(seek_index_path(path)):
+            index = SeekIndex(seek_index_path(path))
+            # The last frame is shown until one frame interval after it was captured
+            if index.start <= end and index.end + 1.0 / index.fps >= start:
+                index.video_path = path
+                indexes.append(index)
+    return sorted(indexes, key=lambda index: index.start)
+
+def seek(timestamp: float, camera: str = None):
+    """(frame, video path, frame index) of the recorded frame at a wall-clock time, or None"""
+    for index in find_indexes(timestamp, timestamp, camera):
+        frame_index = index.frame_at(timestamp)
+        cap = cv2.VideoCapture(index.video_path)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)  # Decodes from the nearest keyframe before it
+        ok, frame = cap.read()
+        cap.release()
+        if ok:
+            return frame, index.video_path, frame_index
+    return None
+
+def render_timeline(start: float, end: float, count: int = 24, camera: str = None, columns: int = 8):
+    """Grid of thumbnails at ``count`` evenly spaced times, each labelled with its time, or None"""
+    indexes = find_indexes(start, end, camera)
+    if not indexes:
+        return None
+    tiles = []
+    for step in range(count):
+        timestamp = start + (end - start) * step / max(count - 1, 1)
+        # Recording (and thumbnail within it) closest to this time
+        index = min(indexes, key=lambda index: max(index.start - timestamp, timestamp - index.end, 0.0))
+        if not len(index.thumbnails):
+            continue
+        row = index.thumbnail_at(timestamp)
+        tile = index.thumbnail(row)
+        label = datetime.datetime.fromtimestamp(float(index.thumbnails[row]["time"])).strftime("%H:%M:%S")
+        cv2.putText(tile, label, (4, tile.shape[0] - 6), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+        tiles.append(tile)
+    if not tiles:
+        return None
+    height, width = tiles[0].shape[:2]
+    tiles = [cv2.resize(tile, (width, height)) if tile.shape[:2] != (height, width) else tile for tile in tiles]
+    columns = min(columns, len(tiles))
+    tiles += [np.zeros_like(tiles[0])] * (-len(tiles) % columns)
+    return np.vstack([np.hstack(tiles[row:row + columns]) for row in range(0, len(tiles), columns)])
+
+if __name__ == "__main__":
+    import argparse
+    from metadata_store import to_timestamp
+    parser = argparse.ArgumentParser(description="Jump to a recorded time or render a thumbnail timeline")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Index existing recordings")
+    build.add_argument("videos", nargs="+")
+    at = commands.add_parser("seek", help="Save the frame recorded at a time, e.g. '2026-10-17 14:30:00'")
+    at.add_argument("time")
+    at.add_argument("--camera")
+    at.add_argument("-o", "--output", default="frame.jpg")
+    timeline = commands.add_parser("timeline", help="Save a grid of thumbnails between two times")
+    timeline.add_argument("start")
+    timeline.add_argument("end")
+    timeline.add_argument("--camera")
+    timeline.add_argument("--count", type=int, default=24)
+    timeline.add_argument("-o", "--output", default="timeline.jpg")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "build":
+        for video in args.videos:
+            print(f"Indexed {video} -> {build_seek_index(video)}")
+    elif args.command == "seek":
+        found = seek(to_timestamp(args.time), args.camera)
+        if found is None:
+            print("No recording at that time")
+        else:
+            frame, video, frame_index = found
+            cv2.imwrite(args.output, frame)
+            print(f"{video} frame {frame_index} -> {args.output}")
+    else:
+        image = render_timeline(to_timestamp(args.start), to_timestamp(args.end), args.count, args.camera)
+        if image is None:
+            print("No indexed recordings in that range")
+        else:
+            cv2.imwrite(args.output, image)
+            print(f"Timeline -> {args.output}")
+    print(f"Done in {time.perf_counter() - started:.3f} seconds")
@@ -0,0 +1,308 @@
+import bisect
+import cv2
+import os
+import datetime
+import threading
+import time
+from seek_index import SeekIndexBuilder
+from config import *
+
+def segment_filename(camera_id: str, segment_index: int, when: float) -> str:
+    """generate_filename()-style name with a monotonic segment index"""
+    timestamp = datetime.datetime.fromtimestamp(when).strftime("%Y%m%d_%H%M%S")
+    return f"{timestamp}_{camera_id}_{segment_index:05d}{VIDEO_EXTENSION}"
+
+class SegmentTimeline:
+    """Where each segment of a SegmentWriter starts, so writers on other threads can follow its rollovers
+
+    The SegmentWriter records the grabber index of every frame it writes, per
+    segment. Followers (metadata store, detection sidecar) look up the segment of
+    each packet they handle and its position in that file, waiting for the video
+    writer to reach it if they are ahead. Positions count the frames actually
+    written, so frames dropped before the writer leave no gaps. A segment is
+    handed over only once every follower has moved past it (or
+    ``follower_timeout`` passed), so its files are complete when they are filed.
+    """
+    def __init__(self, follower_timeout: float = 10.0):
+        self.follower_timeout = follower_timeout
+        self._condition = threading.Condition()
+        self._first_frames = []   # Grabber index of the first frame of every segment
+        self._paths = []
+        self._frames = []         # Grabber indexes written to every segment (None once it is handed over)
+        self._written = -1        # Grabber index of the last frame written
+        self._closed = False
+        self._followers = {}      # follower -> first frame of the segment it is in
+
+    def begin(self, first_frame: int, path: str):
+        with self._condition:
+            self._first_frames.append(first_frame)
+            self._paths.append(path)
+            self._frames.append([])
+            self._condition.notify_all()
+
+    def written(self, frame_index: int):
+        with self._condition:
+            self._frames[-1].append(frame_index)
+            self._written = frame_index
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def segment_of(self, frame_index: int, timeout: float = 5.0):
+        """(path, first frame) of the segment holding a frame, or None before the first segment"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._written >= frame_index or self._closed, timeout)
+            position = bisect.bisect_right(self._first_frames, frame_index) - 1
+            if position < 0:
+                position = 0 if self._first_frames else -1  # Dropped before the first written frame
+            if position < 0:
+                return None
+            return self._paths[position], self._first_frames[position]
+
+    def position_of(self, frame_index: int) -> int:
+        """Frame number within its segment file (of the next written frame if this one was dropped)"""
+        with self._condition:
+            position = max(0, bisect.bisect_right(self._first_frames, frame_index) - 1)
+            frames = self._frames[position] if self._frames else None
+            if frames is None:
+                # Segment already handed over to a follower that timed out: best guess
+                return max(0, frame_index - self._first_frames[position]) if self._first_frames else 0
+            return bisect.bisect_left(frames, frame_index)
+
+    def follow(self, follower, first_frame: int):
+        with self._condition:
+            self._followers[follower] = first_frame
+            self._condition.notify_all()
+
+    def unfollow(self, follower):
+        with self._condition:
+            self._followers.pop(follower, None)
+            self._condition.notify_all()
+
+    def wait_for_followers(self, first_frame: int):
+        """Wait until no follower is still in the segment starting at ``first_frame``"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: all(position > first_frame for position in self._followers.values()),
+                                            self.follower_timeout):
+                print(f"Segment followers did not finish in {self.follower_timeout:.0f}s; handing the segment over anyway")
+            position = bisect.bisect_left(self._first_frames, first_frame)
+            if position < len(self._frames):
+                self._frames[position] = None  # Followers are past it: free the frame list
+
+class SegmentFollower:
+    """Pipeline writer wrapper that tells ``on_segment(path)`` when the recording moves to a new segment
+
+    Packets are passed on as ``writer.write_packet(packet, frame)``, where ``frame``
+    is the packet's position in the segment file.
+    """
+    def __init__(self, writer, timeline: SegmentTimeline, on_segment):
+        self.writer = writer
+        self.timeline = timeline
+        self.on_segment = on_segment
+        self.segment = None
+
+    def write_packet(self, packet):
+        segment = self.timeline.segment_of(packet.index)
+        if segment is not None and segment != self.segment:
+            self.segment = segment
+            self.on_segment(segment[0])
+            self.timeline.follow(self, segment[1])
+        self.writer.write_packet(packet, self.timeline.position_of(packet.index))
+
+    def release(self):
+        self.writer.release()
+        self.timeline.unfollow(self)
+
+class TimelineWriter:
+    """Pipeline writer for a single recording file that reports what it writes to a SegmentTimeline
+
+    The whole-session counterpart of SegmentWriter(timeline=...): one segment,
+    so followers number their rows by the frames actually in the file.
+    """
+    def __init__(self, writer, path: str, timeline: SegmentTimeline, field: str = "annotated"):
+        self.writer = writer
+        self.path = path
+        self.timeline = timeline
+        self.field = field
+        self._write_frame = getattr(writer, "write_frame", None)
+        self._started = False
+
+    def write_packet(self, packet):
+        if not self._started:
+            self.timeline.begin(packet.index, self.path)
+            self._started = True
+        frame = getattr(packet, self.field)
+        if self._write_frame:
+            self._write_frame(frame, packet.timestamp)
+        else:
+            self.writer.write(frame)
+        self.timeline.written(packet.index)
+
+    def release(self):
+        self.timeline.close()
+        self.writer.release()
+
+class SegmentWriter:
+    """Drop-in replacement for cv2.VideoWriter that rolls over to new files without dropping frames
+
+    A segment ends when it has run ``segment_seconds`` of wall-clock time or reached
+    ``max_bytes`` on disk. The next cv2.VideoWriter is opened on a helper thread
+    shortly before the boundary and the finished one is released on another, so the
+    writer thread only ever swaps two references. With ``index`` every segment gets
+    its own seek index, saved next to it before it is handed to ``on_segment_closed``.
+    With a ``timeline`` (and packets written through ``write_packet``) other writers
+    can follow the segment boundaries; ``field`` picks the frame of each packet.
+    """
+    def __init__(self, folder: str, fps: float, frame_size, camera_id: str = "camera01",
+                 segment_seconds: float = SEGMENT_DURATION_MINUTES * 60, max_bytes: int = int(SEGMENT_MAX_MB * 1024 * 1024),
+                 preopen_seconds: float = SEGMENT_PREOPEN_SECONDS, on_segment_closed=None,
+                 index: bool = ENABLE_SEEK_INDEX, timeline: SegmentTimeline = None, field: str = "annotated"):
+        self.folder = folder
+        self.fps = fps
+        self.frame_size = tuple(frame_size)
+        self.camera_id = camera_id
+        self.segment_seconds = segment_seconds
+        self.max_bytes = max_bytes
+        self.preopen_seconds = preopen_seconds
+        self.on_segment_closed = on_segment_closed  # Called with the path of every finished segment
+        self.fourcc = cv2.VideoWriter_fourcc(*VIDEO_CODEC)
+        self.index = index
+        self.timeline = timeline
+        self.field = field
+
+        self.segment_index = 0
+        self.current = None          # (writer, path)
+        self.current_index = None    # SeekIndexBuilder of the current segment
+        self.current_first_frame = 0 # Grabber index of the current segment's first frame
+        self.segment_start = 0.0
+        self.frames_in_segment = 0
+        self._next = None            # Pre-opened (writer, path, index)
+        self._opening = None         # Thread currently pre-opening the next writer
+        self._closing = []           # Threads releasing finished writers
+        self._last_size = 0
+        self.segments_closed = 0
+
+    def _open(self, segment_index: int, when: float):
+        path = os.path.join(self.folder, segment_filename(self.camera_id, segment_index, when))
+        return cv2.VideoWriter(path, self.fourcc, self.fps, self.frame_size), path, segment_index
+
+    def _preopen(self, when: float):
+        def work():
+            self._next = self._open(self.segment_index + 1, when)
+        self._opening = threading.Thread(target=work, name="SegmentOpener", daemon=True)
+        self._opening.start()
+
+    def _new_index(self, path: str):
+        return SeekIndexBuilder(path, self.fps) if self.index else None
+
+    def _close_in_background(self, writer, path: str, index=None, first_frame: int = 0):
+        def work():
+            writer.release()
+            if index is not None:
+                index.save()
+            if self.timeline is not None:
+                self.timeline.wait_for_followers(first_frame)
+            self.segments_closed += 1
+            print(f"Segment closed: {os.path.basename(path)}")
+            if self.on_segment_closed:
+                try:
+                    self.on_segment_closed(path)
+                except Exception as e:
+                    print(f"Error handling closed segment {path}: {e}")
+        thread = threading.Thread(target=work, name="SegmentCloser", daemon=True)
+        thread.start()
+        self._closing = [t for t in self._closing if t.is_alive()] + [thread]
+
+    def _segment_full(self, now: float) -> bool:
+        if now - self.segment_start >= self.segment_seconds:
+            return True
+        # Checking the size is a cheap stat(), done about once per second of video
+        if self.max_bytes and self.frames_in_segment % max(int(self.fps), 1) == 0:
+            path = self.current[1]
+            self._last_size = os.path.getsize(path) if os.path.exists(path) else 0
+            return self._last_size >= self.max_bytes
+        return False
+
+    def rotate(self):
+        """Switch to the next segment (pre-opened if possible) and close the current one off this thread"""
+        now = time.time()
+        if self._opening is None:
+            self._preopen(now)
+        self._opening.join()
+        writer, path, index = self._next
+        self._next = self._opening = None
+
+        previous, previous_index, previous_first_frame = self.current, self.current_index, self.current_first_frame
+        self.current = (writer, path)
+        self.current_index = self._new_index(path)
+        self.segment_index = index
+        self.segment_start = now
+        self.frames_in_segment = 0
+        self._last_size = 0
+        print(f"Recording segment #{index}: {os.path.basename(path)}")
+        if previous:
+            self._close_in_background(*previous, previous_index, previous_first_frame)
+
+    def write(self, frame):
+        self.write_frame(frame, time.time())
+
+    def write_packet(self, packet):
+        self.write_frame(getattr(packet, self.field), packet.timestamp, packet.index)
+
+    def write_frame(self, frame, timestamp: float, frame_index: int = None):
+        """Write a frame captured at ``timestamp``; segment boundaries still follow the wall clock"""
+        now = time.time()
+        new_segment = False
+        if self.current is None:
+            writer, path, _ = self._open(self.segment_index, now)
+            self.current = (writer, path)
+            self.current_index = self._new_index(path)
+            self.segment_start = now
+            new_segment = True
+            print(f"Recording segment #{self.segment_index}: {os.path.basename(path)}")
+        elif self._segment_full(now):
+            self.rotate()
+            new_segment = True
+        if new_segment and frame_index is not None:
+            self.current_first_frame = frame_index
+            if self.timeline is not None:
+                self.timeline.begin(frame_index, self.current[1])
+
+        # Get the next file ready shortly before the time (or size) boundary
+        remaining = self.segment_seconds - (now - self.segment_start)
+        if self._opening is None:
+            if remaining <= self.preopen_seconds:
+                self._preopen(self.segment_start + self.segment_seconds)
+            elif self.max_bytes and self._last_size >= 0.9 * self.max_bytes:
+                self._preopen(now)
+
+        self.current[0].write(frame)
+        if self.current_index is not None:
+            self.current_index.add(frame, timestamp)
+        self.frames_in_segment += 1
+        if self.timeline is not None and frame_index is not None:
+            self.timeline.written(frame_index)
+
+    def release(self):
+        """Close the current segment and wait for background opens/closes to finish"""
+        if self.timeline is not None:
+            self.timeline.close()
+        if self._opening is not None:
+            self._opening.join()
+            # The pre-opened file was never written to
+            writer, path, _ = self._next
+            writer.release()
+            if os.path.exists(path):
+                os.remove(path)
+            self._next = self._opening = None
+        if self.current:
+            writer, path = self.current
+            self.current = None
+            self._close_in_background(writer, path, self.current_index, self.current_first_frame)
+            self.current_index = None
+        for thread in self._closing:
+            thread.join()
+        self._closing = []
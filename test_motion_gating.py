@@ -0,0 +1,35 @@
+import numpy as np
+from detections import Detections
+from detector import detect_objects
+from motion_detector import MotionGate
+from zone_detector import ZoneDetector
+from config import *
+
+class StaticModel:
+    """Stands in for the YOLO model: one tracked person standing still at the same spot"""
+    def __init__(self):
+        self.calls = 0
+
+    def track(self, frame, **kwargs):
+        self.calls += 1
+        return [Detections([[100, 100, 140, 200]], cls=[0], conf=[0.9], id=[7], orig_shape=frame.shape[:2])]
+
+def test_static_box_in_zone_survives_gated_frames():
+    """A person standing still in a zone stays detected and inside once the motion gate closes"""
+    zone_detector = ZoneDetector()
+    zone_detector.add_zone([(50, 50), (250, 50), (250, 250), (50, 250)])
+    model = StaticModel()
+    gate = MotionGate(method="diff", cooldown_frames=2)
+    frame = np.zeros((320, 320, 3), dtype=np.uint8)
+
+    gated_frames = ZONE_ENTER_FRAMES + ZONE_EXIT_FRAMES + 5
+    for _ in range(3 + gated_frames):
+        # Identical frames: no motion after the first, so the gate closes after its cooldown
+        _, results = detect_objects(frame.copy(), model, zone_detector, motion_gate=gate, draw=False)
+
+    assert gate.frames_gated >= ZONE_EXIT_FRAMES
+    assert model.calls == 3
+    assert len(Detections.from_results(results)) == 1
+    assert zone_detector.zones[0].is_triggered
+    assert [track_id for track_id, _ in zone_detector.track_states.occupants(0, 0.0)] == [7]
+    assert not any(event.kind == "exit" for event in zone_detector.last_events)
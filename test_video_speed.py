@@ -154,6 +154,58 @@ def analyze_video_file(video_path):
     
     cap.release()
 
+def measure_display_overhead(video_path, max_frames=300):
+    """Measure the per-frame cost of the end of capture()'s frame loop: interactive vs headless
+
+    Interactive: cv2.imshow + cv2.waitKey and the key lookup. Headless: the
+    non-blocking control command poll. Frames come from a recording and no model
+    runs, so the difference is the cost of the GUI calls alone.
+    """
+    from recorder import KEY_COMMANDS, poll_control
+    from control import ControlServer
+
+    if not os.path.exists(video_path):
+        print(f"Video file not found: {video_path}")
+        return
+
+    print(f"\n=== Display Overhead Test: {video_path} ===")
+    control = ControlServer()  # Not started: no socket or signal handlers, only the command queue
+
+    def run_loop(show):
+        cap = cv2.VideoCapture(video_path)
+        frames = 0
+        start_time = time.time()
+        while frames < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if show:
+                cv2.imshow("Display Overhead Test", frame)
+                KEY_COMMANDS.get(cv2.waitKey(1) & 0xFF)
+            else:
+                poll_control(control, None, frames)
+            frames += 1
+        duration = time.time() - start_time
+        cap.release()
+        return frames, duration
+
+    headless_frames, headless_duration = run_loop(show=False)
+    try:
+        gui_frames, gui_duration = run_loop(show=True)
+        cv2.destroyAllWindows()
+    except cv2.error as e:
+        print(f"Interactive loop unavailable (no display?): {e}")
+        print(f"Headless: {headless_frames / headless_duration:.2f} FPS")
+        return
+
+    headless_fps = headless_frames / headless_duration
+    gui_fps = gui_frames / gui_duration
+    per_frame_ms = (gui_duration / gui_frames - headless_duration / headless_frames) * 1000
+
+    print(f"Interactive (imshow + waitKey): {gui_fps:.2f} FPS")
+    print(f"Headless (control poll):        {headless_fps:.2f} FPS")
+    print(f"GUI overhead: {per_frame_ms:.2f} ms per frame ({headless_fps / gui_fps:.2f}x throughput headless)")
+
 def list_recorded_videos():
     """List all recorded videos for testing"""
     if not os.path.exists(OUTPUT_FOLDER):
@@ -187,5 +239,8 @@ if __name__ == "__main__":
         
         # Test playback
         test_video_playback(latest_video)
+
+        # Compare the GUI and control-poll tails of the frame loop
+        measure_display_overhead(latest_video)
     else:
         print("\nNo recorded videos found. Run recorder.py first to create test videos.") 
\ No newline at end of file
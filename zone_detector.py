@@ -2,23 +2,51 @@ import cv2
 import numpy as np
 from typing import List, Tuple, Optional
 from config import *
+from detections import to_numpy
+from metrics import registry
+from zone_tracking import ZoneStateMachine, UNTRACKED
+import datetime
+import hashlib
 import json
 import os
+import threading
+import time
+
+# Zone file format written by save_zones() (files without a version are version 1)
+ZONE_FILE_VERSION = 3
+# "include" zones raise alerts; boxes inside an "exclude" zone are ignored by every zone
+ZONE_KINDS = ("include", "exclude")
+
+ZONE_CHECK_SECONDS = registry.histogram("cctv_zone_check_seconds", "Time to check a frame's detections against the zones")
 
 class RestrictedZone:
-    """Class to represent a flexible (quadrilateral) restricted zone"""
-    def __init__(self, points: List[Tuple[int, int]], name: str = "Restricted Zone"):
-        if len(points) != 4:
-            raise ValueError("A restricted zone must have exactly 4 points.")
-        self.points = points  # List of 4 (x, y) tuples
+    """Class to represent a flexible (polygon) restricted zone"""
+    def __init__(self, points: List[Tuple[int, int]], name: str = "Restricted Zone", kind: str = "include",
+                 classes: Optional[List[int]] = None):
+        if len(points) < 3:
+            raise ValueError("A restricted zone must have at least 3 points.")
+        if kind not in ZONE_KINDS:
+            raise ValueError(f"Unknown zone kind '{kind}' (expected one of {', '.join(ZONE_KINDS)})")
+        if classes is not None:
+            missing = [cls for cls in classes if cls not in DETECTION_CLASSES]
+            if missing:
+                raise ValueError(f"Zone classes {missing} are not in DETECTION_CLASSES {DETECTION_CLASSES}")
+        self.points = points  # List of (x, y) tuples
         self.name = name
+        self.kind = kind
+        self.classes = list(classes) if classes is not None else None  # Class ids this zone applies to (None = all)
         self.is_triggered = False
         self.trigger_count = 0
+        # Precomputed geometry (zones never change after creation)
+        self.contour = np.array(points, dtype=np.int32)
+        self.edge_starts = self.contour.astype(np.float64)
+        self.edge_ends = np.roll(self.edge_starts, -1, axis=0)
+        x, y, w, h = cv2.boundingRect(self.contour)
+        self.bbox = (x, y, x + w - 1, y + h - 1)  # Inclusive bounding box of the polygon
 
     def contains_point(self, x: int, y: int) -> bool:
         # Use cv2.pointPolygonTest for point-in-polygon
-        contour = np.array(self.points, dtype=np.int32)
-        return cv2.pointPolygonTest(contour, (x, y), False) >= 0
+        return cv2.pointPolygonTest(self.contour, (x, y), False) >= 0
 
     def contains_bbox(self, bbox: Tuple[int, int, int, int]) -> bool:
         # Check if any corner of the bbox is inside the polygon
@@ -29,8 +57,7 @@ class RestrictedZone:
             (bbox_x2, bbox_y2),
             (bbox_x1, bbox_y2)
         ]
-        contour = np.array(self.points, dtype=np.int32)
-        return any(cv2.pointPolygonTest(contour, pt, False) >= 0 for pt in corners)
+        return any(cv2.pointPolygonTest(self.contour, pt, False) >= 0 for pt in corners)
 
     def draw(self, frame: np.ndarray, color: Tuple[int, int, int] = ZONE_ALERT_COLOR, thickness: int = 2):
         # Draw polygon
@@ -38,24 +65,286 @@ class RestrictedZone:
         cv2.polylines(frame, [pts], isClosed=True, color=color, thickness=thickness)
         # Draw label near the first point
         label = f"{self.name} (Triggered: {self.trigger_count})" if self.is_triggered else self.name
+        if self.kind == "exclude":
+            label = f"{self.name} (excluded)"
         cv2.putText(frame, label, (self.points[0][0], self.points[0][1] - 10),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
 
+def points_in_zones(points: np.ndarray, edge_starts: np.ndarray, edge_ends: np.ndarray,
+                    zone_offsets: np.ndarray) -> np.ndarray:
+    """Test every point against every zone polygon in one batched operation
+
+    Args:
+        points: (P, 2) array of x, y test points
+        edge_starts, edge_ends: (E, 2) polygon edges of all zones, grouped by zone
+        zone_offsets: (Z,) index of each zone's first edge
+
+    Returns:
+        (P, Z) bool array; points on an edge count as inside, like cv2.pointPolygonTest(...) >= 0
+    """
+    px = points[:, 0:1].astype(np.float64)
+    py = points[:, 1:2].astype(np.float64)
+    crossings, on_edge = edge_tests(px, py, edge_starts, edge_ends)
+    inside = np.add.reduceat(crossings, zone_offsets, axis=1, dtype=np.int32) % 2 == 1
+    return inside | np.logical_or.reduceat(on_edge, zone_offsets, axis=1)
+
+def edge_tests(px: np.ndarray, py: np.ndarray, edge_starts: np.ndarray, edge_ends: np.ndarray):
+    """Per (point, edge) pair: whether a ray towards +x crosses the edge, and whether the point is on it"""
+    x1, y1 = edge_starts[..., 0], edge_starts[..., 1]
+    x2, y2 = edge_ends[..., 0], edge_ends[..., 1]
+
+    # Even-odd rule: count edges crossed by a ray cast from the point towards +x
+    spans_y = (y1 > py) != (y2 > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    crossings = spans_y & (px < crossing_x)
+
+    # Points lying exactly on an edge
+    cross = (x2 - x1) * (py - y1) - (y2 - y1) * (px - x1)
+    on_edge = ((cross == 0)
+               & (px >= np.minimum(x1, x2)) & (px <= np.maximum(x1, x2))
+               & (py >= np.minimum(y1, y2)) & (py <= np.maximum(y1, y2)))
+    return crossings, on_edge
+
+def expand_runs(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenation of range(start, start + count) for every run, without a Python loop"""
+    total = int(counts.sum())
+    run_offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + (np.arange(total) - run_offsets)
+
+class ZoneGrid:
+    """Uniform grid over the zones' bounding boxes (a spatial index)
+
+    Each cell lists the zones whose bounding box overlaps it, so a point is only
+    tested against the polygons of the zones in its cell. With zones spread over
+    the frame the work per point stays flat as the zone count grows.
+    """
+    def __init__(self, zones: List[RestrictedZone], cell_size: int = ZONE_GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.zone_count = len(zones)
+        self.bboxes = np.array([zone.bbox for zone in zones], dtype=np.float64).reshape(-1, 4)
+        self.origin = self.bboxes[:, :2].min(axis=0)
+        cells = ((self.bboxes - np.tile(self.origin, 2)) // cell_size).astype(np.intp)
+        self.columns = int(cells[:, 2].max()) + 1
+        self.rows = int(cells[:, 3].max()) + 1
+
+        cell_lists = [[] for _ in range(self.rows * self.columns)]
+        for zone_index, (cx1, cy1, cx2, cy2) in enumerate(cells.tolist()):
+            for cy in range(cy1, cy2 + 1):
+                for cell in range(cy * self.columns + cx1, cy * self.columns + cx2 + 1):
+                    cell_lists[cell].append(zone_index)
+        # Cell lists in CSR form: zones of cell c are cell_zones[cell_starts[c]:cell_starts[c + 1]]
+        self.cell_starts = np.concatenate([[0], np.cumsum([len(zones) for zones in cell_lists])]).astype(np.intp)
+        self.cell_zones = np.array([zone for zones in cell_lists for zone in zones], dtype=np.intp)
+
+    def candidates(self, points: np.ndarray):
+        """(point index, zone index) pairs whose zone bounding box contains the point"""
+        cx = np.floor((points[:, 0] - self.origin[0]) / self.cell_size).astype(np.intp)
+        cy = np.floor((points[:, 1] - self.origin[1]) / self.cell_size).astype(np.intp)
+        in_grid = (cx >= 0) & (cx < self.columns) & (cy >= 0) & (cy < self.rows)
+        cell = np.where(in_grid, cy * self.columns + cx, 0)
+        starts = self.cell_starts[cell]
+        counts = np.where(in_grid, self.cell_starts[cell + 1] - starts, 0)
+        point_index = np.repeat(np.arange(len(points)), counts)
+        zone_index = self.cell_zones[expand_runs(starts, counts)]
+        # Cells are coarse: keep the pairs whose point lies in the zone's own bounding box
+        px, py = points[point_index, 0], points[point_index, 1]
+        bboxes = self.bboxes[zone_index]
+        inside = (px >= bboxes[:, 0]) & (px <= bboxes[:, 2]) & (py >= bboxes[:, 1]) & (py <= bboxes[:, 3])
+        return point_index[inside], zone_index[inside]
+
+    def points_in_zones(self, points: np.ndarray, edge_starts: np.ndarray, edge_ends: np.ndarray,
+                        zone_offsets: np.ndarray) -> np.ndarray:
+        """Same result as points_in_zones(), testing only the candidate zones of each point"""
+        hits = np.zeros((len(points), self.zone_count), dtype=bool)
+        points = points.astype(np.float64)
+        point_index, zone_index = self.candidates(points)
+        if len(point_index) == 0:
+            return hits
+        # One row per (candidate pair, edge of its zone)
+        edge_counts = np.diff(np.append(zone_offsets, len(edge_starts)))[zone_index]
+        edge_index = expand_runs(zone_offsets[zone_index], edge_counts)
+        pair_points = points[np.repeat(point_index, edge_counts)]
+        crossings, on_edge = edge_tests(pair_points[:, 0], pair_points[:, 1],
+                                        edge_starts[edge_index], edge_ends[edge_index])
+        pair_offsets = np.cumsum(edge_counts) - edge_counts
+        inside = np.add.reduceat(crossings, pair_offsets, dtype=np.int32) % 2 == 1
+        inside |= np.logical_or.reduceat(on_edge, pair_offsets)
+        hits[point_index[inside], zone_index[inside]] = True
+        return hits
+
+def bbox_corners(xyxy: np.ndarray) -> np.ndarray:
+    """(B, 4) boxes -> (B * 4, 2) corner points in the order used by RestrictedZone.contains_bbox"""
+    x1, y1, x2, y2 = xyxy[:, 0], xyxy[:, 1], xyxy[:, 2], xyxy[:, 3]
+    return np.stack([x1, y1, x2, y1, x2, y2, x1, y2], axis=1).reshape(-1, 2)
+
+def box_test_points(xyxy: np.ndarray, test_point: str):
+    """Points checked per box: the 4 corners or the bottom-center footprint. Returns (points, points_per_box)"""
+    xyxy = np.trunc(xyxy)  # int() truncation, as in the per-box check
+    if test_point == "bottom_center":
+        return np.stack([np.trunc((xyxy[:, 0] + xyxy[:, 2]) / 2), xyxy[:, 3]], axis=1), 1
+    return bbox_corners(xyxy), 4
+
+def mask_dtype(zone_count: int):
+    """Smallest unsigned type that holds one bit per zone (None if there are too many zones)"""
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if zone_count <= np.iinfo(dtype).bits:
+            return dtype
+    return None
+
+class ZoneMask:
+    """Zones rasterized at one frame resolution: one bit per zone, so overlapping zones are kept"""
+    def __init__(self, zones: List[RestrictedZone], shape: Tuple[int, int], bits: Optional[np.ndarray] = None):
+        self.shape = tuple(shape[:2])
+        self.zone_count = len(zones)
+        dtype = mask_dtype(self.zone_count)
+        if dtype is None:
+            raise ValueError(f"Cannot rasterize more than 64 zones into a bitmask ({self.zone_count} given)")
+        include_bits = dtype(sum(1 << index for index, zone in enumerate(zones) if zone.kind == "include"))
+        if bits is not None:
+            self.bits = bits.astype(dtype, copy=False)  # Restored from a geometry cache
+        else:
+            self.bits = np.zeros(self.shape, dtype=dtype)
+            layer = np.zeros(self.shape, dtype=np.uint8)
+            for zone_index, zone in enumerate(zones):
+                layer[:] = 0
+                cv2.fillPoly(layer, [zone.contour], 1)
+                self.bits[layer > 0] |= dtype(1 << zone_index)
+        self.binary = ((self.bits & include_bits) > 0).astype(np.uint8) * 255  # Union of the include zones (cv2 mask format)
+        self._bounds = None
+        if self.binary.any():
+            x, y, w, h = cv2.boundingRect(self.binary)
+            self._bounds = (x, y, x + w, y + h)
+
+    def lookup(self, points: np.ndarray) -> np.ndarray:
+        """(P, 2) points -> (P, Z) bool membership by array indexing"""
+        height, width = self.shape
+        x = points[:, 0].astype(np.intp)
+        y = points[:, 1].astype(np.intp)
+        in_frame = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        bits = np.zeros(len(points), dtype=np.uint64)
+        bits[in_frame] = self.bits[y[in_frame], x[in_frame]]
+        return ((bits[:, None] >> np.arange(self.zone_count, dtype=np.uint64)) & 1).astype(bool)
+
+    def overlap(self, xyxy: np.ndarray) -> np.ndarray:
+        """(B, 4) boxes -> (B, Z) fraction of each box's area covered by each zone"""
+        height, width = self.shape
+        x1 = np.clip(np.floor(xyxy[:, 0]), 0, width).astype(np.intp)
+        y1 = np.clip(np.floor(xyxy[:, 1]), 0, height).astype(np.intp)
+        x2 = np.clip(np.ceil(xyxy[:, 2]), 0, width).astype(np.intp)
+        y2 = np.clip(np.ceil(xyxy[:, 3]), 0, height).astype(np.intp)
+        zone_bits = np.arange(self.zone_count, dtype=np.uint64)
+        inside = np.zeros((len(xyxy), self.zone_count))
+        for box in range(len(xyxy)):
+            # A box crop holds only a few distinct zone combinations: count pixels per combination
+            values, counts = np.unique(self.bits[y1[box]:y2[box], x1[box]:x2[box]], return_counts=True)
+            members = (values.astype(np.uint64)[:, None] >> zone_bits) & 1
+            inside[box] = counts @ members
+        area = np.maximum((x2 - x1) * (y2 - y1), 1)
+        return inside / area[:, None]
+
+    def bounds(self):
+        """Bounding rectangle (x1, y1, x2, y2) of the include zones, or None if the mask is empty"""
+        return self._bounds
+
+class ZoneOverlay:
+    """Zone outlines and labels rendered once, then pasted onto each frame through a mask"""
+    def __init__(self):
+        self.key = None
+        self.shape = None
+        self.render_count = 0
+        self._layer = None
+        self._mask = None
+
+    def paste(self, frame: np.ndarray, key, render):
+        """Copy the cached overlay onto the frame in place, re-rendering only when the key changes"""
+        if key != self.key or frame.shape != self.shape:
+            self._layer = np.zeros(frame.shape, dtype=np.uint8)
+            render(self._layer)
+            self._mask = self._layer.any(axis=2).astype(np.uint8)
+            self.key, self.shape = key, frame.shape
+            self.render_count += 1
+        cv2.copyTo(self._layer, self._mask, frame)
+
+def zone_file_path(camera_id: str = "camera01") -> str:
+    """Zones file of one camera"""
+    return os.path.join(ZONES_FOLDER, f"{camera_id}.json")
+
+def geometry_cache_path(zones_path: str) -> str:
+    return os.path.splitext(zones_path)[0] + ".geometry.npz"
+
+class ZoneFileWatcher:
+    """Polls a zones file on a background thread; the frame loop checks ``changed()`` without blocking"""
+    def __init__(self, path: str, interval: float = ZONES_WATCH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._signature = self._stat()
+        self._changed = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="ZoneFileWatcher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            signature = self._stat()
+            if signature is not None and signature != self._signature:
+                self._signature = signature
+                self._changed.set()
+
+    def changed(self) -> bool:
+        """True once after every modification of the file"""
+        if self._changed.is_set():
+            self._changed.clear()
+            return True
+        return False
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
 class ZoneDetector:
     """Class to manage multiple flexible restricted zones"""
-    def __init__(self):
+    def __init__(self, zones_file: Optional[str] = None):
         self.zones: List[RestrictedZone] = []
+        self.zones_file = zones_file  # Zones drawn or cleared interactively are saved here
+        self.revision = 0             # Revision of the zones file these zones came from (or were saved as)
+        self.file_signature = None    # SHA-1 of the zones file contents these zones came from (or were saved as)
         self.drawing_mode = False
         self.current_zone_points: List[Tuple[int, int]] = []
         self.zone_counter = 1
+        self.hit_method = ZONE_HIT_METHOD
+        self.test_point = ZONE_TEST_POINT
+        self.min_overlap = ZONE_MIN_OVERLAP
+        self._zone_edges = None  # Cached (edge_starts, edge_ends, zone_offsets) for all zones
+        self._zone_masks = {}    # Cached ZoneMask per frame resolution
+        self._zone_grid = None   # Cached ZoneGrid spatial index
+        self._zone_rules = None  # Cached (exclude columns, class table) applied to raw hits
+        self._overlay = ZoneOverlay()
+        self.last_hits = np.zeros((0, 0), dtype=bool)  # Box x zone hits from the last check_detections()
+        self.print_alerts = True  # Off when an AlertBus reports the alerts instead
+        self.track_states = ZoneStateMachine()
+        self.last_events = []     # Enter/exit events of the last check_detections()
 
-    def add_zone(self, points: List[Tuple[int, int]], name: Optional[str] = None):
+    def add_zone(self, points: List[Tuple[int, int]], name: Optional[str] = None, kind: str = "include",
+                 classes: Optional[List[int]] = None):
         if name is None:
             name = f"Zone {self.zone_counter}"
             self.zone_counter += 1
-        zone = RestrictedZone(points, name)
+        zone = RestrictedZone(points, name, kind, classes)
         self.zones.append(zone)
-        print(f"Added restricted zone: {name} with points {points}")
+        self._invalidate_geometry()
+        print(f"Added {'exclude' if kind == 'exclude' else 'restricted'} zone: {name} with points {points}")
 
     def mouse_callback(self, event, x, y, flags, param):
         if event == cv2.EVENT_LBUTTONDOWN:
@@ -67,55 +356,343 @@ class ZoneDetector:
             else:
                 self.current_zone_points.append((x, y))
                 print(f"Added point ({x}, {y}) to current zone")
-                if len(self.current_zone_points) == 4:
-                    # Finish drawing the zone
-                    self.drawing_mode = False
-                    self.add_zone(self.current_zone_points)
-                    self.current_zone_points = []
-                    print(f"Finished drawing zone with 4 points")
-
-    def check_detections(self, detections) -> List[RestrictedZone]:
-        """Check if any detections are in restricted zones"""
-        triggered_zones = []
+        elif event == cv2.EVENT_RBUTTONDOWN and self.drawing_mode and len(self.current_zone_points) >= 3:
+            # Finish drawing the zone; Shift makes it an exclude zone
+            kind = "exclude" if flags & cv2.EVENT_FLAG_SHIFTKEY else "include"
+            points = self.current_zone_points
+            self.drawing_mode = False
+            self.current_zone_points = []
+            self.add_zone(points, kind=kind)
+            print(f"Finished drawing zone with {len(points)} points")
+            if self.zones_file:
+                self.save_zones()
+
+    def get_zone_edges(self):
+        """Edges of all zones stacked into flat arrays (rebuilt only when zones change)"""
+        if self._zone_edges is None:
+            edge_starts = np.concatenate([zone.edge_starts for zone in self.zones])
+            edge_ends = np.concatenate([zone.edge_ends for zone in self.zones])
+            sizes = [len(zone.edge_starts) for zone in self.zones]
+            zone_offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+            self._zone_edges = (edge_starts, edge_ends, zone_offsets)
+        return self._zone_edges
+
+    def _invalidate_geometry(self):
+        self._zone_edges = None
+        self._zone_masks = {}
+        self._zone_grid = None
+        self._zone_rules = None
+
+    def get_zone_grid(self) -> ZoneGrid:
+        """Spatial index over the zones (rebuilt only when zones change)"""
+        if self._zone_grid is None:
+            self._zone_grid = ZoneGrid(self.zones)
+        return self._zone_grid
+
+    def get_zone_rules(self):
+        """(exclude zone columns, class table or None) used to filter raw hits"""
+        if self._zone_rules is None:
+            exclude = np.array([i for i, zone in enumerate(self.zones) if zone.kind == "exclude"], dtype=np.intp)
+            class_table = None
+            filtered = [(i, zone.classes) for i, zone in enumerate(self.zones) if zone.classes is not None]
+            if filtered:
+                # Row c says which zones apply to class c; the last row is for classes no zone names
+                rows = max([cls for _, classes in filtered for cls in classes], default=-1) + 2
+                class_table = np.ones((rows, len(self.zones)), dtype=bool)
+                for zone_index, classes in filtered:
+                    class_table[:, zone_index] = False
+                    class_table[classes, zone_index] = True
+            self._zone_rules = (exclude, class_table)
+        return self._zone_rules
+
+    def apply_zone_rules(self, hits: np.ndarray, classes=None) -> np.ndarray:
+        """Drop hits of zones filtered to other classes, and every hit of boxes in an exclude zone"""
+        exclude, class_table = self.get_zone_rules()
+        if class_table is not None and classes is not None:
+            classes = np.asarray(classes).astype(np.intp)
+            other = len(class_table) - 1
+            hits = hits & class_table[np.where((classes >= 0) & (classes < other), classes, other)]
+        if len(exclude):
+            hits = hits & ~hits[:, exclude].any(axis=1, keepdims=True)
+            hits[:, exclude] = False
+        return hits
+
+    def get_zone_mask(self, shape) -> Optional[ZoneMask]:
+        """Rasterized zones for a frame shape, built once per resolution (None if too many zones)"""
+        shape = tuple(shape[:2])
+        if not self.zones or mask_dtype(len(self.zones)) is None:
+            return None
+        if shape not in self._zone_masks:
+            self._zone_masks[shape] = ZoneMask(self.zones, shape)
+        return self._zone_masks[shape]
+
+    def hit_matrix(self, xyxy: np.ndarray, frame_shape=None, classes=None) -> np.ndarray:
+        """(B, 4) boxes -> (B, Z) bool matrix of which boxes hit which zone
+
+        A box hits a zone when one of its test points (corners or bottom-center) lies
+        inside it, or in "overlap" mode when at least ``min_overlap`` of its area does.
+        The raster mask is used when the frame shape is known and the method is "mask"
+        (always for "overlap"); otherwise points are tested against the polygons, through
+        the spatial index once there are ZONE_GRID_MIN_ZONES zones. Class filters apply
+        when the boxes' ``classes`` are given; exclude zones never count as hit.
+        """
+        if len(xyxy) == 0 or not self.zones:
+            return np.zeros((len(xyxy), len(self.zones)), dtype=bool)
+
+        zone_mask = None
+        if frame_shape is not None and (self.hit_method == "mask" or self.test_point == "overlap"):
+            zone_mask = self.get_zone_mask(frame_shape)
+        if self.test_point == "overlap" and zone_mask is not None:
+            return self.apply_zone_rules(zone_mask.overlap(xyxy) >= self.min_overlap, classes)
+
+        points, points_per_box = box_test_points(xyxy, self.test_point)
+        if zone_mask is not None:
+            hits = zone_mask.lookup(points)
+        elif len(self.zones) >= ZONE_GRID_MIN_ZONES:
+            hits = self.get_zone_grid().points_in_zones(points, *self.get_zone_edges())
+        else:
+            hits = points_in_zones(points, *self.get_zone_edges())
+        hits = hits.reshape(len(xyxy), points_per_box, len(self.zones)).any(axis=1)
+        return self.apply_zone_rules(hits, classes)
+
+    def mask_frame(self, frame: np.ndarray) -> np.ndarray:
+        """Copy of the frame with everything outside the zones blacked out"""
+        zone_mask = self.get_zone_mask(frame.shape)
+        if zone_mask is None:
+            return frame
+        return cv2.bitwise_and(frame, frame, mask=zone_mask.binary)
+
+    def get_zone_bounds(self, shape):
+        """Bounding rectangle (x1, y1, x2, y2) around the include zones for a frame shape, or None"""
+        zone_mask = self.get_zone_mask(shape)
+        if zone_mask is not None:
+            return zone_mask.bounds()
+        # Too many zones for a bitmask: union of the include zones' bounding boxes
+        boxes = [zone.bbox for zone in self.zones if zone.kind == "include"]
+        if not boxes:
+            return None
+        height, width = shape[:2]
+        x1, y1 = max(min(box[0] for box in boxes), 0), max(min(box[1] for box in boxes), 0)
+        x2, y2 = min(max(box[2] for box in boxes) + 1, width), min(max(box[3] for box in boxes) + 1, height)
+        return (x1, y1, x2, y2) if x1 < x2 and y1 < y2 else None
+
+    def check_detections(self, detections, timestamp: Optional[float] = None) -> List[RestrictedZone]:
+        """Check detections against the zones and update the per-track zone states
+
+        A zone is triggered while at least one track is inside it; tracks enter and
+        leave with hysteresis (see ZoneStateMachine). Returns the triggered zones.
+        """
+        start = time.perf_counter()
+        now = time.time() if timestamp is None else timestamp
+        hits = np.zeros((0, len(self.zones)), dtype=bool)
+        track_ids = confidences = classes = None
 
         if detections and hasattr(detections[0], 'boxes') and detections[0].boxes is not None:
             boxes = detections[0].boxes
-            if hasattr(boxes, 'xyxy') and boxes.xyxy is not None:
-                for box in boxes.xyxy:
-                    x1, y1, x2, y2 = int(box[0]), int(box[1]), int(box[2]), int(box[3])
-
-                    for zone in self.zones:
-                        if zone.contains_bbox((x1, y1, x2, y2)):
-                            if not zone.is_triggered:
-                                zone.is_triggered = True
-                                zone.trigger_count += 1
-                                print(f"⚠️  ALERT: Person detected in {zone.name}!")
-                            triggered_zones.append(zone)
-                        else:
-                            zone.is_triggered = False
+            if hasattr(boxes, 'xyxy') and boxes.xyxy is not None and self.zones:
+                frame_shape = getattr(detections[0], 'orig_shape', None)
+                classes = to_numpy(getattr(boxes, 'cls', None))
+                hits = self.hit_matrix(to_numpy(boxes.xyxy).reshape(-1, 4), frame_shape, classes)
+                track_ids = to_numpy(getattr(boxes, 'id', None))
+                confidences = to_numpy(getattr(boxes, 'conf', None))
+        self.last_hits = hits
 
+        self.last_events = self.track_states.update(hits, track_ids, confidences, now)
+        for event in self.last_events:
+            if event.kind != "enter":
+                continue
+            zone = self.zones[event.zone_index]
+            zone.trigger_count += 1
+            registry.counter("cctv_zone_triggers_total", "Tracks entering a zone",
+                             {"zone": zone.name}).inc()
+            if self.print_alerts:
+                track = f" (track {event.track_id})" if event.track_id != UNTRACKED else ""
+                print(f"⚠️  ALERT: Person detected in {zone.name}!{track}")
+
+        occupancy = self.track_states.occupancy
+        triggered_zones = []
+        for zone_index, zone in enumerate(self.zones):
+            zone.is_triggered = occupancy.get(zone_index, 0) > 0
+            if zone.is_triggered:
+                triggered_zones.append(zone)
+
+        ZONE_CHECK_SECONDS.observe(time.perf_counter() - start)
         return triggered_zones
 
+    def box_zone_names(self) -> List[List[str]]:
+        """Names of the zones each box of the last checked frame is in"""
+        return [[self.zones[zone_index].name for zone_index in np.flatnonzero(row)] for row in self.last_hits]
+
     def draw_zones(self, frame: np.ndarray):
+        # Zones only look different when they are edited or change trigger state
+        key = (tuple((id(zone), zone.is_triggered, zone.trigger_count) for zone in self.zones),
+               self.drawing_mode, tuple(self.current_zone_points))
+        self._overlay.paste(frame, key, self._render_zones)
+
+    def _render_zones(self, frame: np.ndarray):
         for zone in self.zones:
-            color = ZONE_ALERT_COLOR if zone.is_triggered else ZONE_NORMAL_COLOR
+            if zone.kind == "exclude":
+                color = ZONE_EXCLUDE_COLOR
+            else:
+                color = ZONE_ALERT_COLOR if zone.is_triggered else ZONE_NORMAL_COLOR
             zone.draw(frame, color)
         # Draw current zone being created
         if self.drawing_mode and self.current_zone_points:
             pts = np.array(self.current_zone_points, np.int32).reshape((-1, 1, 2))
             cv2.polylines(frame, [pts], isClosed=False, color=ZONE_DRAWING_COLOR, thickness=2)
-            cv2.putText(frame, f"Drawing zone... ({len(self.current_zone_points)}/4)", (10, 30),
+            cv2.putText(frame, f"Drawing zone... ({len(self.current_zone_points)} points, right-click to finish)", (10, 30),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, ZONE_DRAWING_COLOR, 2)
 
     def clear_zones(self):
         self.zones.clear()
         self.zone_counter = 1
+        self._invalidate_geometry()
+        self.track_states.reset()
         print("All restricted zones cleared")
+        if self.zones_file:
+            self.save_zones()
+
+    def geometry_key(self) -> str:
+        """Hash of the zone shapes; a geometry cache is only valid for the same key"""
+        shapes = [[zone.name, [list(point) for point in zone.points]] for zone in self.zones]
+        return hashlib.sha1(json.dumps(shapes).encode()).hexdigest()
+
+    def save_zones(self, path: Optional[str] = None):
+        """Write the zones to a versioned JSON file, plus their precomputed geometry next to it"""
+        path = path or self.zones_file
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.revision += 1
+        data = {"version": ZONE_FILE_VERSION,
+                "revision": self.revision,
+                "saved": datetime.datetime.now().isoformat(timespec="seconds"),
+                "zones": [{"name": zone.name, "points": [list(point) for point in zone.points],
+                           "kind": zone.kind, "classes": zone.classes}
+                          for zone in self.zones]}
+        contents = json.dumps(data, indent=2).encode()
+        # Write to a temporary file first so a watcher never reads a half-written file
+        with open(path + ".tmp", "wb") as f:
+            f.write(contents)
+        os.replace(path + ".tmp", path)
+        self.file_signature = hashlib.sha1(contents).hexdigest()
+        self.save_geometry(geometry_cache_path(path))
+        print(f"Saved {len(self.zones)} zones to {path} (revision {self.revision})")
+
+    def save_geometry(self, path: str):
+        """Cache the stacked edges and every zone mask built so far"""
+        if not self.zones:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        arrays = dict(zip(("edge_starts", "edge_ends", "zone_offsets"), self.get_zone_edges()))
+        for (height, width), zone_mask in self._zone_masks.items():
+            arrays[f"mask_{height}x{width}"] = zone_mask.bits
+        with open(path + ".tmp", "wb") as f:
+            np.savez_compressed(f, key=np.array(self.geometry_key()), **arrays)
+        os.replace(path + ".tmp", path)
+
+    def cache_geometry(self):
+        """Refresh the geometry cache of the zones file, e.g. with masks built during a session"""
+        if self.zones_file and os.path.exists(self.zones_file):
+            self.save_geometry(geometry_cache_path(self.zones_file))
+
+    def load_geometry(self, path: str) -> bool:
+        """Install cached geometry if it matches the current zones; returns True when used"""
+        if not self.zones or not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as cache:
+                if str(cache["key"]) != self.geometry_key():
+                    return False
+                self._zone_edges = (cache["edge_starts"], cache["edge_ends"], cache["zone_offsets"])
+                for name in cache.files:
+                    if name.startswith("mask_"):
+                        height, width = (int(v) for v in name[5:].split("x"))
+                        self._zone_masks[(height, width)] = ZoneMask(self.zones, (height, width), cache[name])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring zone geometry cache {path}: {e}")
+            self._invalidate_geometry()
+            return False
+        return True
+
+    def load_zones(self, path: Optional[str] = None, contents: Optional[bytes] = None) -> int:
+        """Replace the current zones with those in a file written by save_zones()
+
+        The whole file is parsed and validated first; if any zone is invalid this
+        raises and the current zones stay in place.
+        """
+        path = path or self.zones_file
+        if contents is None:
+            with open(path, "rb") as f:
+                contents = f.read()
+        zones, revision = parse_zones(contents, path)
+        self.zones = zones
+        self.zone_counter = len(zones) + 1
+        self._invalidate_geometry()
+        self.track_states.reset()
+        self.revision = revision
+        self.file_signature = hashlib.sha1(contents).hexdigest()
+        cached = self.load_geometry(geometry_cache_path(path))
+        print(f"Loaded {len(self.zones)} zones from {path} (revision {self.revision}"
+              f"{', cached geometry' if cached else ''})")
+        return len(self.zones)
+
+    def reload_if_changed(self, path: Optional[str] = None) -> bool:
+        """Load the zones file unless its contents are those already in use (e.g. our own save)
+
+        Never raises: a file that cannot be read or holds an invalid zone is
+        reported and the current zones are kept.
+        """
+        path = path or self.zones_file
+        try:
+            with open(path, "rb") as f:
+                contents = f.read()
+        except OSError as e:
+            print(f"Cannot read zones file {path}: {e}")
+            return False
+        if hashlib.sha1(contents).hexdigest() == self.file_signature:
+            return False
+        try:
+            self.load_zones(path, contents)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Ignoring invalid zones file {path} ({e!r}); keeping the {len(self.zones)} current zones")
+            return False
+        return True
 
     def get_zone_info(self) -> str:
         if not self.zones:
             return "No restricted zones defined"
         info = "Restricted Zones:\n"
+        now = time.time()
         for i, zone in enumerate(self.zones, 1):
-            info += f"{i}. {zone.name}: {zone.points} - Triggers: {zone.trigger_count}\n"
-        return info 
\ No newline at end of file
+            rules = " (exclude)" if zone.kind == "exclude" else ""
+            if zone.classes is not None:
+                rules += f" (classes {zone.classes})"
+            info += f"{i}. {zone.name}{rules}: {zone.points} - Triggers: {zone.trigger_count}\n"
+            for track_id, dwell in self.track_states.occupants(i - 1, now):
+                info += f"   - track {track_id}: inside for {dwell:.1f}s\n"
+        return info 
+
+def parse_zones(contents: bytes, path: str = "zones file"):
+    """(zones, revision) from the contents of a zones file; raises on the first invalid entry"""
+    data = json.loads(contents)
+    version = data.get("version", 1)
+    if version > ZONE_FILE_VERSION:
+        raise ValueError(f"{path} has zone file version {version}; this version reads up to {ZONE_FILE_VERSION}")
+    zones = []
+    for number, entry in enumerate(data.get("zones", []), 1):
+        zones.append(RestrictedZone([tuple(point) for point in entry["points"]], entry.get("name") or f"Zone {number}",
+                                    entry.get("kind", "include"), entry.get("classes")))
+    return zones, data.get("revision", 0)
+
+def load_camera_zones(camera_id: str = "camera01") -> ZoneDetector:
+    """ZoneDetector bound to a camera's zones file, loaded from it (or from the legacy ZONES_FILE)"""
+    path = zone_file_path(camera_id)
+    zone_detector = ZoneDetector(zones_file=path)
+    if os.path.exists(path):
+        zone_detector.load_zones(path)
+    elif os.path.exists(ZONES_FILE):
+        # Older single-file setup; the zones move to the camera's file on the next save
+        zone_detector.load_zones(ZONES_FILE)
+    return zone_detector
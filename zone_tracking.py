@@ -0,0 +1,107 @@
+import numpy as np
+from typing import List
+from config import *
+
+# Track ID used for boxes without one (model.predict, or tracking disabled); all such boxes share one state per zone
+UNTRACKED = -1
+
+class ZoneEvent:
+    """A tracked object entering or leaving a zone"""
+    __slots__ = ("kind", "track_id", "zone_index", "time", "dwell")
+
+    def __init__(self, kind: str, track_id: int, zone_index: int, time: float, dwell: float = 0.0):
+        self.kind = kind              # "enter" or "exit"
+        self.track_id = track_id
+        self.zone_index = zone_index
+        self.time = time
+        self.dwell = dwell            # Seconds spent inside (exit events)
+
+class TrackZoneState:
+    """State of one (track, zone) pair"""
+    __slots__ = ("inside", "hit_streak", "miss_streak", "streak_start", "entered_at", "last_seen", "last_frame")
+
+    def __init__(self):
+        self.inside = False
+        self.hit_streak = 0       # Consecutive frames in the zone
+        self.miss_streak = 0      # Consecutive frames not in the zone
+        self.streak_start = 0.0   # Time of the first frame of the current hit streak
+        self.entered_at = 0.0
+        self.last_seen = 0.0      # Last time the track was in the zone
+        self.last_frame = -1      # Frame number of the last hit
+
+class ZoneStateMachine:
+    """Per-(track, zone) enter/exit state with hysteresis and dwell time
+
+    A track enters a zone after ``enter_frames`` consecutive frames inside it with
+    at least ``min_confidence``, and leaves after ``exit_frames`` consecutive frames
+    outside it (or ``stale_seconds`` without being seen). Only pairs that were
+    recently inside are kept, so each update is O(active tracks); pairs that are
+    outside and quiet are evicted.
+    """
+    def __init__(self, enter_frames: int = ZONE_ENTER_FRAMES, exit_frames: int = ZONE_EXIT_FRAMES,
+                 min_confidence: float = ZONE_MIN_CONFIDENCE, stale_seconds: float = ZONE_TRACK_STALE_SECONDS):
+        self.enter_frames = max(1, enter_frames)
+        self.exit_frames = max(1, exit_frames)
+        self.min_confidence = min_confidence
+        self.stale_seconds = stale_seconds
+        self.states = {}          # (track_id, zone_index) -> TrackZoneState
+        self.occupancy = {}       # zone_index -> number of tracks inside
+        self.frame_number = 0
+
+    def reset(self):
+        self.states = {}
+        self.occupancy = {}
+
+    def update(self, hits: np.ndarray, track_ids, confidences, now: float) -> List[ZoneEvent]:
+        """Advance one frame. ``hits`` is the (boxes x zones) hit matrix; returns this frame's events"""
+        self.frame_number += 1
+        frame_number = self.frame_number
+        events = []
+
+        if len(hits):
+            if confidences is not None:
+                hits = hits & (np.asarray(confidences) >= self.min_confidence)[:, None]
+            rows, zone_indexes = np.nonzero(hits)
+            for row, zone_index in zip(rows.tolist(), zone_indexes.tolist()):
+                track_id = int(track_ids[row]) if track_ids is not None else UNTRACKED
+                key = (track_id, zone_index)
+                state = self.states.get(key)
+                if state is None:
+                    state = self.states[key] = TrackZoneState()
+                elif state.last_frame == frame_number:
+                    continue  # Several untracked boxes in the same zone
+                if state.hit_streak == 0:
+                    state.streak_start = now
+                state.hit_streak += 1
+                state.miss_streak = 0
+                state.last_seen = now
+                state.last_frame = frame_number
+                if not state.inside and state.hit_streak >= self.enter_frames:
+                    state.inside = True
+                    state.entered_at = state.streak_start
+                    self.occupancy[zone_index] = self.occupancy.get(zone_index, 0) + 1
+                    events.append(ZoneEvent("enter", track_id, zone_index, now))
+
+        # Pairs not in their zone this frame
+        evicted = []
+        for key, state in self.states.items():
+            if state.last_frame == frame_number:
+                continue
+            state.hit_streak = 0
+            state.miss_streak += 1
+            gone = state.miss_streak >= self.exit_frames or now - state.last_seen >= self.stale_seconds
+            if not gone:
+                continue
+            if state.inside:
+                state.inside = False
+                self.occupancy[key[1]] -= 1
+                events.append(ZoneEvent("exit", key[0], key[1], now, state.last_seen - state.entered_at))
+            evicted.append(key)
+        for key in evicted:
+            del self.states[key]
+        return events
+
+    def occupants(self, zone_index: int, now: float):
+        """(track_id, dwell seconds) of every track currently inside a zone"""
+        return [(track_id, now - state.entered_at) for (track_id, index), state in self.states.items()
+                if index == zone_index and state.inside]